@@ -1,13 +1,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import uvicorn
 import json
 import os
 
 # Import the OpenAI assistant
-from src.auto.openai_assistant import get_and_execute_drone_commands
+from src.auto.openai_assistant import get_and_execute_drone_commands, tool_router, llm_backend, command_flights
+from src.auto.executor import command_executor
+from src.auto.plan_cache import plan_cache
+# The vehicle, telemetry and mission modules pull in pymavlink, so the handlers
+# import them on first use (as the assistant does) to keep startup fast
 
 app = FastAPI(title="UAV Command API")
 
@@ -23,6 +27,7 @@ app.add_middleware(
 class CommandRequest(BaseModel):
     command: str
     waypoint_file: str = None  # Optional waypoint file for cross coverage
+    stream: bool = False  # Run tool calls as they stream from the LLM
 
 class Waypoint(BaseModel):
     lat: float
@@ -36,6 +41,13 @@ class Mission(BaseModel):
 class CommandWithWaypointsRequest(BaseModel):
     command: str
     waypoints: List[Dict[str, Any]]
+    stream: bool = False
+
+class ModeRequest(BaseModel):
+    mode_name: str
+
+class ArmRequest(BaseModel):
+    arm_command: bool
 
 class CrossCoverageRequest(BaseModel):
     json_file: str
@@ -44,12 +56,25 @@ class CrossCoverageRequest(BaseModel):
     smooth_path_edges: bool = True
     smooth_path_edge_intensity: int = 50
 
+@app.on_event("startup")
+def startup_event():
+    # Telemetry reads the pooled vehicle connection unless a shared-memory publisher owns the link
+    from src.telemetary import start_telemetry_for_commands
+    start_telemetry_for_commands()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    from src.telemetary import stop_continuous_telemetry
+    stop_continuous_telemetry()
+
 @app.get("/")
 async def root():
     return {"message": "UAV Command API is running"}
 
+# The command handlers are plain functions: FastAPI runs them in its threadpool, so
+# a command waiting on the LLM or the vehicle never blocks the event loop
 @app.post("/execute-command")
-async def execute_command(request: CommandRequest):
+def execute_command(request: CommandRequest):
     """Process command through OpenAI and execute on drone in Gazebo"""
     print(f"Received command: {request.command}")
     print(f"Waypoint file: {request.waypoint_file}")
@@ -114,13 +139,15 @@ async def execute_command(request: CommandRequest):
         else:
             print("Executing regular command")
             # Send command to OpenAI assistant for processing and execution
-            success, function_list, waypoint_data = get_and_execute_drone_commands(request.command)
+            plan_report = {}
+            success, function_list, waypoint_data = get_and_execute_drone_commands(request.command, report=plan_report, stream=request.stream)
             
             if success:
                 response_data = {
                     "message": f"Command executed successfully: {request.command}",
                     "status": "success",
-                    "executed_functions": function_list
+                    "executed_functions": function_list,
+                    "plan": plan_report
                 }
                 
                 # Add waypoint data if generated
@@ -145,7 +172,7 @@ async def execute_command(request: CommandRequest):
         }
 
 @app.post("/execute-command-with-waypoints")
-async def execute_command_with_waypoints(request: CommandWithWaypointsRequest):
+def execute_command_with_waypoints(request: CommandWithWaypointsRequest):
     """Process command with waypoint data for cross coverage path generation"""
     print(f"Received command: {request.command}")
     print(f"Received waypoints: {request.waypoints}")
@@ -153,7 +180,8 @@ async def execute_command_with_waypoints(request: CommandWithWaypointsRequest):
     try:
         # Send command to OpenAI assistant for processing and execution
         # The OpenAI assistant will detect cross coverage commands and call the generate_cross_coverage_path function
-        success, function_list, waypoint_data = get_and_execute_drone_commands(request.command, request.waypoints)
+        plan_report = {}
+        success, function_list, waypoint_data = get_and_execute_drone_commands(request.command, request.waypoints, report=plan_report, stream=request.stream)
         
         if success:
             # Check if cross coverage path was generated
@@ -168,7 +196,8 @@ async def execute_command_with_waypoints(request: CommandWithWaypointsRequest):
                 "status": "success",
                 "command": request.command,
                 "waypoints": request.waypoints,
-                "executed_functions": function_list
+                "executed_functions": function_list,
+                "plan": plan_report
             }
             
             # Add cross coverage path data if generated
@@ -202,6 +231,111 @@ async def execute_command_with_waypoints(request: CommandWithWaypointsRequest):
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/telemetry")
+async def telemetry(vehicle_id: Optional[int] = None):
+    """Latest drone telemetry (from this process's link if it is live, else the shared-memory telemetry service)"""
+    from src.telemetary import get_live_telemetry
+    try:
+        return get_live_telemetry(vehicle_id)
+    except KeyError as e:
+        return {"status": "error", "error": str(e)}
+
+@app.get("/telemetry/fleet")
+async def fleet_telemetry():
+    """Latest telemetry of every vehicle heard on the link, keyed by system ID"""
+    from src.telemetary import get_fleet_telemetry
+    return get_fleet_telemetry()
+
+@app.get("/metrics")
+async def metrics():
+    """Telemetry link quality: per-message rate, jitter, loss, age and latency histograms,
+    plus queue vs run time of tool calls, plan cache hit rates, tool routing savings
+    LLM backend latency and hedging, and coalesced duplicate commands"""
+    from src.telemetary import get_telemetry_metrics
+    metrics = get_telemetry_metrics()
+    metrics['commands'] = command_executor.metrics()
+    metrics['plan_cache'] = plan_cache.status()
+    metrics['tool_router'] = tool_router.status()
+    metrics['llm'] = llm_backend.status()
+    metrics['coalescing'] = command_flights.status()
+    return metrics
+
+@app.get("/connections")
+async def connections():
+    """Pooled vehicle command connections and their heartbeat health"""
+    from src.auto.connection_pool import connection_pool
+    return connection_pool.status()
+
+@app.post("/vehicle/mode")
+def vehicle_mode(request: ModeRequest):
+    """Set the flight mode directly, without going through the LLM (on the pooled vehicle connection)"""
+    from src.auto.connection_pool import connection_pool
+    from src.auto.function import set_mode
+    try:
+        with connection_pool.lease() as master:
+            if request.mode_name.upper() not in master.mode_mapping():
+                return {"status": "error", "error": f"Unknown mode {request.mode_name}"}
+            result = set_mode(master, request.mode_name)
+        return {"status": "success" if result == 0 else "failed", "result": result}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+@app.post("/vehicle/arm")
+def vehicle_arm(request: ArmRequest):
+    """Arm or disarm directly, without going through the LLM (on the pooled vehicle connection)"""
+    from src.auto.connection_pool import connection_pool
+    from src.auto.function import arm_disarm
+    try:
+        with connection_pool.lease() as master:
+            result = arm_disarm(master, request.arm_command)
+        return {"status": "success" if result == 0 else "failed", "result": result}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+@app.get("/vehicle/moves")
+async def vehicle_moves():
+    """Closed-loop moves started by move_local_ned, with their progress"""
+    from src.auto.position_controller import list_moves
+    return list_moves()
+
+@app.get("/vehicle/moves/{move_id}")
+async def vehicle_move(move_id: str):
+    from src.auto.position_controller import get_move
+    move = get_move(move_id)
+    if move is None:
+        return {"status": "error", "error": f"Unknown move {move_id}"}
+    return move.status()
+
+@app.post("/vehicle/moves/{move_id}/cancel")
+async def vehicle_move_cancel(move_id: str):
+    """Stop a running move and hold position"""
+    from src.auto.position_controller import cancel_move
+    return {"status": "cancelled" if cancel_move(move_id) else "not running"}
+
+@app.post("/mission/upload")
+def mission_upload(path: Dict[str, Any]):
+    """Upload a generated coverage path to the autopilot as a mission (only changed items if re-sent)"""
+    from src.auto.connection_pool import connection_pool
+    from src.auto.mission_upload import upload_coverage_path, mission_uploader
+    try:
+        with connection_pool.lease() as master:
+            sent = upload_coverage_path(master, path)
+            return {"status": "success", "items_sent": sent, "upload": mission_uploader(master).status()}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+@app.post("/mission/start")
+def mission_start():
+    """Fly the uploaded mission in AUTO mode"""
+    from src.auto.connection_pool import connection_pool
+    from src.auto.mission_upload import start_mission
+    try:
+        with connection_pool.lease() as master:
+            result = start_mission(master)
+        return {"status": "success" if result == 0 else "failed", "result": result}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
 @app.post("/waypoints")
 def save_mission(mission: Mission):
     """Save mission waypoints to JSON file"""
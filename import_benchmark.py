@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules each process imports at startup
+ENTRY_POINTS = {
+    'api': 'api',
+    'websocket_server': 'websocket_server',
+    'terminal_ui': 'terminal_ui',
+    'main': 'main',
+    'telemetry': 'src.telemetary',
+    'assistant': 'src.auto.openai_assistant',
+}
+
+MEASURE = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+
+def time_import(module, python=sys.executable):
+    """Seconds a fresh interpreter takes to import module, or None if the import fails"""
+    result = subprocess.run([python, '-c', MEASURE.format(module=module)],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()
+        print(f"{module}: import failed: {error[-1] if error else result.returncode}")
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module, count=10, python=sys.executable):
+    """The count slowest modules (cumulative microseconds) from python -X importtime"""
+    result = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start import time of each entry point')
+    parser.add_argument('entry_points', nargs='*', default=list(ENTRY_POINTS), help='Entry points to measure')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='Fresh interpreters per entry point')
+    parser.add_argument('--budget-ms', type=float, help='Exit with status 1 if any median exceeds this')
+    parser.add_argument('--top', type=int, default=0, help='Also list the N slowest imports of each entry point')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.entry_points:
+        module = ENTRY_POINTS.get(name, name)
+        runs = [time_import(module) for _ in range(args.runs)]
+        runs = [run for run in runs if run is not None]
+        results[name] = {
+            'module': module,
+            'median_ms': round(statistics.median(runs) * 1000, 1) if runs else None,
+            'min_ms': round(min(runs) * 1000, 1) if runs else None,
+            'max_ms': round(max(runs) * 1000, 1) if runs else None,
+        }
+        if args.top and runs:
+            results[name]['slowest'] = [{'module': mod, 'cumulative_ms': round(us / 1000, 1)}
+                                        for us, mod in slowest_imports(module, args.top)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            median = f"{result['median_ms']:.1f} ms" if result['median_ms'] is not None else "failed"
+            print(f"{name:18} {median:>10}  (min {result['min_ms']}, max {result['max_ms']})")
+            for entry in result.get('slowest', []):
+                print(f"    {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+
+    if args.budget_ms is not None:
+        over = [name for name, result in results.items()
+                if result['median_ms'] is None or result['median_ms'] > args.budget_ms]
+        if over:
+            print(f"Over the {args.budget_ms:.0f} ms budget: {', '.join(over)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
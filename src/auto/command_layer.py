@@ -0,0 +1,260 @@
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from pymavlink import mavutil
+
+from src.auto.executor import check_cancelled, CommandCancelled
+
+mavlink = mavutil.mavlink
+
+
+class PendingCommand:
+    """A COMMAND_LONG waiting for its COMMAND_ACK"""
+
+    def __init__(self, command, params, target_system, target_component):
+        self.command = command
+        self.params = params
+        self.target_system = target_system
+        self.target_component = target_component
+        self.future = Future()
+        self.attempts = 0
+        self.sent_at = None
+        self.in_progress = False
+        self.progress = None
+
+
+class CommandLayer:
+    """Correlates COMMAND_LONG sends with their COMMAND_ACKs on one connection.
+
+    send() returns a Future per command. ACKs are matched on (command id,
+    sending system), so unrelated ACKs never resolve the wrong command.
+    Unanswered commands are retransmitted every ack_timeout seconds with the
+    confirmation field counting the attempt, up to max_attempts.
+    MAV_RESULT_IN_PROGRESS stops retransmission and records the progress
+    percentage; the final ACK is then awaited for up to progress_timeout.
+
+    Different commands can be in flight at once. Repeats of the same command
+    to the same vehicle queue behind the first, as MAVLink does not allow
+    them to overlap. Futures resolve while some thread pumps the connection
+    through wait() or pump().
+    """
+
+    def __init__(self, master, ack_timeout=1.0, max_attempts=3, progress_timeout=30.0):
+        self.master = master
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.progress_timeout = progress_timeout
+        self.lock = threading.Lock()
+        self.read_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.pending = {}  # (command, target system) -> [PendingCommand], head in flight
+        self.listeners = []
+        self.metrics = {
+            'sent': 0,
+            'retransmits': 0,
+            'accepted': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'unmatched_acks': 0,
+        }
+
+    def add_listener(self, callback):
+        """Call callback(msg) for every message read while pumping"""
+        # Replaced rather than mutated so a pump in progress is never disturbed
+        self.listeners = self.listeners + [callback]
+
+    def remove_listener(self, callback):
+        self.listeners = [listener for listener in self.listeners if listener != callback]
+
+    def send(self, command, *params, target_system=None, target_component=None):
+        """Send a COMMAND_LONG and return a Future resolving to its final COMMAND_ACK"""
+        params = (list(params) + [0] * 7)[:7]
+        pending = PendingCommand(
+            command, params,
+            self.master.target_system if target_system is None else target_system,
+            self.master.target_component if target_component is None else target_component
+        )
+        key = (command, pending.target_system)
+        with self.lock:
+            queue = self.pending.setdefault(key, [])
+            queue.append(pending)
+            first = len(queue) == 1
+        if first:
+            self._transmit(pending)
+        return pending.future
+
+    def _transmit(self, pending):
+        with self.send_lock:
+            self.master.mav.command_long_send(
+                pending.target_system, pending.target_component,
+                pending.command, pending.attempts,  # Confirmation counts retransmissions
+                *pending.params
+            )
+        if pending.attempts:
+            self.metrics['retransmits'] += 1
+        else:
+            self.metrics['sent'] += 1
+        pending.attempts += 1
+        pending.sent_at = time.monotonic()
+
+    def handle_message(self, msg):
+        """Resolve the matching pending command from a COMMAND_ACK"""
+        if msg.get_type() != 'COMMAND_ACK':
+            return
+        target = getattr(msg, 'target_system', 0)
+        if target and target != self.master.mav.srcSystem:
+            return  # Addressed to another ground station
+        follow_up = None
+        with self.lock:
+            queue = self.pending.get((msg.command, msg.get_srcSystem()))
+            if not queue or queue[0].sent_at is None:
+                self.metrics['unmatched_acks'] += 1
+                return
+            head = queue[0]
+            if msg.result == mavlink.MAV_RESULT_IN_PROGRESS:
+                head.in_progress = True
+                head.progress = getattr(msg, 'progress', None)
+                head.sent_at = time.monotonic()
+                return
+            queue.pop(0)
+            if queue:
+                follow_up = queue[0]
+            else:
+                del self.pending[(msg.command, msg.get_srcSystem())]
+        self.metrics['accepted' if msg.result == mavlink.MAV_RESULT_ACCEPTED else 'rejected'] += 1
+        try:
+            head.future.set_result(msg)
+        except InvalidStateError:
+            pass  # Cancelled by its caller
+        if follow_up is not None:
+            self._transmit(follow_up)
+
+    def check_timeouts(self):
+        """Retransmit unanswered commands and fail those out of attempts"""
+        now = time.monotonic()
+        expired = []
+        resend = []
+        with self.lock:
+            for key in list(self.pending):
+                queue = self.pending[key]
+                dropped = False
+                while queue and queue[0].future.cancelled():
+                    queue.pop(0)
+                    dropped = True
+                if not queue:
+                    del self.pending[key]
+                    continue
+                head = queue[0]
+                if head.sent_at is None:
+                    if dropped:
+                        resend.append(head)
+                    continue
+                limit = self.progress_timeout if head.in_progress else self.ack_timeout
+                if now - head.sent_at < limit:
+                    continue
+                if not head.in_progress and head.attempts < self.max_attempts:
+                    resend.append(head)
+                    continue
+                queue.pop(0)
+                expired.append(head)
+                if queue:
+                    resend.append(queue[0])
+                else:
+                    del self.pending[key]
+        for pending in expired:
+            self.metrics['timeouts'] += 1
+            try:
+                pending.future.set_exception(TimeoutError(
+                    f"No COMMAND_ACK for command {pending.command} after {pending.attempts} attempts"
+                ))
+            except InvalidStateError:
+                pass
+        for pending in resend:
+            self._transmit(pending)
+
+    def send_message(self, msg):
+        """Send any other MAVLink message, serialized with command traffic"""
+        with self.send_lock:
+            self.master.mav.send(msg)
+
+    def drain(self, max_messages=100):
+        """Dispatch messages that have already arrived without blocking"""
+        if not self.read_lock.acquire(blocking=False):
+            return 0  # Another thread is pumping already
+        messages = []
+        try:
+            while len(messages) < max_messages:
+                msg = self.master.recv_match(blocking=False)
+                if msg is None:
+                    break
+                messages.append(msg)
+        finally:
+            self.read_lock.release()
+        for msg in messages:
+            self.handle_message(msg)
+            for listener in self.listeners:
+                listener(msg)
+        self.check_timeouts()
+        return len(messages)
+
+    def pump(self, timeout=0.1):
+        """Read and dispatch at most one message, then service retransmissions"""
+        msg = None
+        if self.read_lock.acquire(timeout=timeout):
+            try:
+                msg = self.master.recv_match(blocking=True, timeout=timeout)
+            finally:
+                self.read_lock.release()
+        if msg is not None:
+            self.handle_message(msg)
+            for listener in self.listeners:
+                listener(msg)
+        self.check_timeouts()
+        return msg
+
+    def wait(self, future, timeout=None):
+        """Pump until future resolves; returns the COMMAND_ACK, or None on timeout or failure.
+
+        A command still unanswered at timeout is cancelled so it is not
+        retransmitted later; the same happens, with CommandCancelled raised,
+        when the calling command's cancellation token fires.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not future.done():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                future.cancel()
+                return None
+            try:
+                check_cancelled()
+            except CommandCancelled:
+                future.cancel()
+                raise
+            self.pump(0.1 if remaining is None else min(0.1, remaining))
+        if future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def command(self, command, *params, timeout=None, **kwargs):
+        """Send a command and block until its COMMAND_ACK; returns the ACK or None"""
+        return self.wait(self.send(command, *params, **kwargs), timeout)
+
+
+_layers_lock = threading.Lock()
+
+
+def command_layer(master_conn):
+    """The CommandLayer bound to a connection, created on first use"""
+    layer = getattr(master_conn, 'command_layer', None)
+    if layer is None:
+        with _layers_lock:
+            layer = getattr(master_conn, 'command_layer', None)
+            if layer is None:
+                layer = master_conn.command_layer = CommandLayer(master_conn)
+    return layer
+
+
+def send_command(master_conn, command, *params, timeout=None):
+    """Send a COMMAND_LONG and return the ACK result, or None if it never came"""
+    ack = command_layer(master_conn).command(command, *params, timeout=timeout)
+    return ack.result if ack else None
@@ -0,0 +1,145 @@
+import re
+import time
+from collections import namedtuple
+
+# Result of parsing a command locally; path is 'parser' when it resolved, 'llm' when the model is needed
+ParseResult = namedtuple('ParseResult', 'commands confidence path elapsed_ms')
+
+# Commands below this confidence go to the LLM instead
+MIN_CONFIDENCE = 0.8
+DEFAULT_YAW_SPEED = 30  # deg/s when the command doesn't say
+
+NUM = r'(?P<value>\d+(?:\.\d+)?)'
+METERS = r'\s*(?:m|meters?|metres?)\b'
+
+MODES = ('GUIDED', 'LOITER', 'RTL', 'LAND', 'AUTO', 'STABILIZE', 'ALT_HOLD', 'POSHOLD', 'BRAKE', 'SMART_RTL')
+MODE_ALIASES = {'ALTHOLD': 'ALT_HOLD', 'ALTITUDE_HOLD': 'ALT_HOLD', 'POSITION_HOLD': 'POSHOLD', 'POS_HOLD': 'POSHOLD',
+                'RETURN_TO_LAUNCH': 'RTL', 'STABILISE': 'STABILIZE'}
+
+# Direction -> (axis index, sign) in local NED: x forward/north, y right/east, z down
+DIRECTIONS = {
+    'forward': (0, 1), 'forwards': (0, 1), 'ahead': (0, 1), 'north': (0, 1),
+    'back': (0, -1), 'backward': (0, -1), 'backwards': (0, -1), 'south': (0, -1),
+    'right': (1, 1), 'east': (1, 1),
+    'left': (1, -1), 'west': (1, -1),
+    'up': (2, -1), 'down': (2, 1),
+}
+SPEED_TYPES = {'air': 0, 'ground': 1, 'climb': 2, 'descent': 3, 'descend': 3}
+
+_directions = '|'.join(sorted(DIRECTIONS, key=len, reverse=True))
+_filler = r'(?:(?:the|drone|vehicle|please|now|by)\s+)*'
+
+TAKEOFF = re.compile(r'^(?:take\s*off|launch|lift\s*off)\s+(?:to\s+)?(?:an?\s+)?(?:altitude\s+(?:of\s+)?)?' + NUM + METERS + r'(?:\s+(?:altitude|high))?$')
+ARM = re.compile(r'^(?P<action>arm|disarm)(?:\s+(?:the|drone|vehicle|motors|now|please))*$')
+MODE = re.compile(r'^(?:set|change|switch)\s+(?:the\s+)?(?:flight\s+)?(?:mode\s+)?(?:to\s+)?(?P<mode>[a-z_ ]+?)(?:\s+mode)?$')
+LAND = re.compile(r'^(?P<mode>land|rtl|return\s+to\s+(?:launch|home)|return\s+home|go\s+home)$')
+YAW = re.compile(r'^(?:yaw|rotate|turn)\s+' + _filler + r'(?P<pre>left|right|clockwise|counter\s*-?\s*clockwise|anticlockwise)?\s*(?:by\s+)?'
+                 r'(?P<sign>-)?' + NUM + r'\s*(?:deg(?:ree)?s?\b|°)\s*(?P<post>left|right|clockwise|counter\s*-?\s*clockwise|anticlockwise)?$')
+MOVE = re.compile(r'^(?:move|go|fly)\s+' + _filler + r'(?:(?P<pre>' + _directions + r')\s+)?' + NUM + METERS + r'(?:\s+(?P<direction>' + _directions + r'))?$')
+SPEED = re.compile(r'^(?:set|change)\s+(?:the\s+)?(?P<kind>air|ground|climb|descent|descend)?\s*speed\s+(?:to\s+)?' + NUM
+                   + r'\s*(?:m/s|mps|meters?\s+per\s+second|metres?\s+per\s+second)?$')
+
+# Clauses of a compound command: "arm, take off to 10m and then move 5m forward"
+SPLIT = re.compile(r'\s*(?:,|;|\band then\b|\bthen\b|\band\b)\s*')
+SURVEILLANCE_PREFIX = '[surveillance]'
+
+
+def _clean(text):
+    text = text.strip().lower()
+    if text.startswith(SURVEILLANCE_PREFIX):
+        text = text[len(SURVEILLANCE_PREFIX):]
+    text = re.sub(r'(\d)([a-z°])', r'\1 \2', text)  # "10m" -> "10 m"
+    text = re.sub(r'[!?]+|\.$', '', text)
+    return ' '.join(text.split())
+
+
+def _number(value):
+    number = float(value)
+    return int(number) if number == int(number) else number
+
+
+def _parse_clause(clause):
+    """Resolve one clause to ([(function_name, args)], confidence), or None if it doesn't match"""
+    match = TAKEOFF.match(clause)
+    if match:
+        return [('takeoff', {'altitude': _number(match['value'])})], 1.0
+
+    match = ARM.match(clause)
+    if match:
+        return [('arm_disarm', {'arm_command': match['action'] == 'arm'})], 1.0
+
+    match = LAND.match(clause)
+    if match:
+        mode = 'LAND' if match['mode'] == 'land' else 'RTL'
+        return [('set_mode', {'mode_name': mode})], 1.0
+
+    match = MODE.match(clause)
+    if match:
+        mode = match['mode'].strip().upper().replace(' ', '_')
+        mode = MODE_ALIASES.get(mode, mode)
+        if mode in MODES:
+            return [('set_mode', {'mode_name': mode})], 1.0
+        return None
+
+    match = YAW.match(clause)
+    if match:
+        if match['pre'] and match['post']:
+            return None
+        turn = match['pre'] or match['post'] or ''
+        direction = -1 if match['sign'] or turn == 'left' or 'counter' in turn or 'anti' in turn else 1
+        return [('condition_yaw', {
+            'angle_deg': _number(match['value']),
+            'speed_deg_s': DEFAULT_YAW_SPEED,
+            'direction': direction,
+            'relative_offset': True,
+        })], 1.0 if turn or match['sign'] else 0.9
+
+    match = MOVE.match(clause)
+    if match:
+        pre = match['pre']
+        if bool(pre) == bool(match['direction']):
+            return None  # No direction, or one on both sides
+        axis, sign = DIRECTIONS[pre or match['direction']]
+        offset = [0, 0, 0]
+        offset[axis] = sign * _number(match['value'])
+        return [('move_local_ned', {'x_m': offset[0], 'y_m': offset[1], 'z_m_down': offset[2]})], 1.0
+
+    match = SPEED.match(clause)
+    if match:
+        speed_type = SPEED_TYPES[match['kind']] if match['kind'] else 1
+        return [('change_speed', {
+            'speed_type': speed_type,
+            'speed_m_s': _number(match['value']),
+            'throttle_pct': -1,
+            'relative': False,
+        })], 1.0 if match['kind'] else 0.9
+    return None
+
+
+def parse_command(user_input):
+    """Resolve a command to tool calls without the LLM.
+
+    Every clause of the command has to match one of the known intents
+    (takeoff, arm/disarm, mode changes, yaw, relative moves, speed);
+    anything else, or a parse below MIN_CONFIDENCE, comes back with
+    path 'llm' and no commands. Confidence is that of the weakest clause:
+    1.0 when every argument was stated, lower when a default was filled in.
+    """
+    started = time.perf_counter()
+    commands = []
+    confidence = 1.0
+    text = _clean(user_input)
+    clauses = [clause for clause in SPLIT.split(text) if clause] if text else []
+    for clause in clauses:
+        parsed = _parse_clause(clause)
+        if parsed is None:
+            commands, confidence = [], 0.0
+            break
+        clause_commands, clause_confidence = parsed
+        commands.extend(clause_commands)
+        confidence = min(confidence, clause_confidence)
+    if not commands:
+        confidence = 0.0
+    path = 'parser' if commands and confidence >= MIN_CONFIDENCE else 'llm'
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return ParseResult(commands if path == 'parser' else [], confidence, path, elapsed_ms)
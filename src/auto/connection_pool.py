@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pymavlink import mavutil
+
+from src.auto.command_layer import command_layer
+
+DEFAULT_CONNECTION = 'udp:127.0.0.1:14550'
+# A second autopilot output (e.g. MAVProxy/SITL --out udp:127.0.0.1:14551) for commands while the
+# shared-memory telemetry publisher owns DEFAULT_CONNECTION: only one socket on a UDP port receives
+COMMAND_CONNECTION = os.environ.get('MAVLINK_COMMAND_CONNECTION', 'udp:127.0.0.1:14551')
+
+
+class PooledConnection:
+    """One live MAVLink connection to a vehicle, shared by every lease on it"""
+
+    def __init__(self, connection_string, vehicle_id=None):
+        self.connection_string = connection_string
+        self.vehicle_id = vehicle_id
+        self.master = None
+        self.lock = threading.RLock()
+        self.connected_at = None
+        self.reconnects = 0
+        self.leases = 0
+
+    def heartbeat_age(self):
+        if self.master is None:
+            return None
+        return self.master.time_since('HEARTBEAT')
+
+    def close(self):
+        if self.master is not None:
+            try:
+                self.master.close()
+            except Exception:
+                pass
+        self.master = None
+        self.connected_at = None
+
+
+class MavlinkConnectionPool:
+    """Process-wide pool of heartbeat-verified MAVLink connections keyed by vehicle.
+
+    lease() hands out the pooled connection for a vehicle, opening it on first
+    use. Messages that queued up while the connection sat idle are dispatched
+    through its CommandLayer first, and if no heartbeat has been seen for
+    stale_after seconds the link is re-verified and reopened when the vehicle
+    does not answer. Leases on the same vehicle are serialized; different
+    vehicles can be used concurrently.
+
+    Long-lived readers such as the telemetry manager take the same
+    connection through connection() rather than opening their own socket:
+    only one socket bound to a UDP port receives its packets. Every read
+    goes through the CommandLayer's read lock, so the reader and the
+    leaseholders share the traffic instead of racing for it.
+
+    Calls without a connection string use default_connection. A process
+    whose telemetry comes from the shared-memory publisher sets it to
+    COMMAND_CONNECTION, so it never binds the publisher's port.
+    """
+
+    def __init__(self, heartbeat_timeout=5.0, stale_after=3.0, source_system=255):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.stale_after = stale_after
+        self.source_system = source_system
+        self.default_connection = DEFAULT_CONNECTION
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def _entry(self, connection_string, vehicle_id):
+        key = (connection_string or self.default_connection, vehicle_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = PooledConnection(*key)
+            return entry
+
+    def _open(self, entry):
+        entry.close()
+        master = mavutil.mavlink_connection(entry.connection_string, source_system=self.source_system)
+        if not master.wait_heartbeat(timeout=self.heartbeat_timeout):
+            master.close()
+            raise TimeoutError(f"No MAVLink heartbeat from {entry.connection_string} within timeout")
+        if entry.vehicle_id is not None:
+            master.target_system = entry.vehicle_id
+        entry.master = master
+        entry.connected_at = time.monotonic()
+
+    def _wait_heartbeat(self, entry, timeout):
+        """Pump the shared connection until a fresh heartbeat has been seen on it"""
+        layer = command_layer(entry.master)
+        layer.drain()
+        deadline = time.monotonic() + timeout
+        while entry.heartbeat_age() > self.stale_after:
+            if time.monotonic() >= deadline:
+                return False
+            layer.pump(0.1)
+        return True
+
+    def _ensure_healthy(self, entry):
+        if entry.master is None:
+            self._open(entry)
+            return
+        try:
+            if self._wait_heartbeat(entry, min(self.heartbeat_timeout, self.stale_after)):
+                return
+        except Exception as e:
+            print(f"MAVLink connection {entry.connection_string} failed: {e}")
+        print(f"No heartbeat on {entry.connection_string}, reconnecting...")
+        entry.reconnects += 1
+        self._open(entry)
+
+    @contextmanager
+    def lease(self, connection_string=None, vehicle_id=None):
+        """Exclusive use of the live connection to a vehicle for the duration of the with block.
+
+        Raises TimeoutError if the vehicle does not send a heartbeat.
+        """
+        entry = self._entry(connection_string, vehicle_id)
+        with entry.lock:
+            self._ensure_healthy(entry)
+            entry.leases += 1
+            yield entry.master
+
+    def connection(self, connection_string=None, vehicle_id=None):
+        """The live connection to a vehicle without leasing it, opened if needed.
+
+        For readers that only pump it through its CommandLayer, like the
+        telemetry manager; sending commands still takes a lease.
+        """
+        entry = self._entry(connection_string, vehicle_id)
+        master = entry.master
+        if master is None:
+            with entry.lock:
+                if entry.master is None:
+                    self._open(entry)
+                master = entry.master
+        return master
+
+    def discard(self, master, connection_string=None, vehicle_id=None):
+        """Close a connection a reader found dead; the next lease or connection() reopens it"""
+        entry = self._entry(connection_string, vehicle_id)
+        with entry.lock:
+            if entry.master is master:
+                entry.reconnects += 1
+                entry.close()
+
+    def connect(self, connection_string=None, vehicle_id=None):
+        """Open (or verify) the connection ahead of time so the first lease does not wait"""
+        with self.lease(connection_string, vehicle_id):
+            pass
+
+    def close(self, connection_string=None, vehicle_id=None):
+        with self.lock:
+            entry = self.entries.pop((connection_string or self.default_connection, vehicle_id), None)
+        if entry is not None:
+            with entry.lock:
+                entry.close()
+
+    def close_all(self):
+        with self.lock:
+            entries = list(self.entries.values())
+            self.entries = {}
+        for entry in entries:
+            with entry.lock:
+                entry.close()
+
+    def status(self):
+        with self.lock:
+            entries = list(self.entries.values())
+        status = []
+        for entry in entries:
+            age = entry.heartbeat_age()
+            status.append({
+                'connection': entry.connection_string,
+                'vehicle_id': entry.vehicle_id,
+                'connected': entry.master is not None,
+                'heartbeat_age': round(age, 2) if age is not None else None,
+                'reconnects': entry.reconnects,
+                'leases': entry.leases,
+                'commands': dict(entry.master.command_layer.metrics) if hasattr(entry.master, 'command_layer') else None,
+            })
+        return status
+
+
+connection_pool = MavlinkConnectionPool()
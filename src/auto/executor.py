@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+from src.scheduler import LaneScheduler
+
+
+class CommandCancelled(Exception):
+    """Raised inside a command once its cancellation token fires"""
+
+
+class CancellationToken:
+    """Cooperative cancellation for one command, with an optional deadline.
+
+    Primitives poll check_cancelled() between blocking steps; the token of
+    the command running on the current thread is found through current_token().
+    A token with a parent is also cancelled once its parent is, so cancelling
+    a user command stops the tool calls it started.
+    """
+
+    def __init__(self, timeout=None, parent=None):
+        self.event = threading.Event()
+        self.timeout = timeout
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.parent = parent
+        self.reason = None
+
+    def cancel(self, reason="cancelled"):
+        if self.reason is None:
+            self.reason = reason
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        if not self.event.is_set():
+            if self.parent is not None and self.parent.cancelled:
+                self.cancel(self.parent.reason)
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel("deadline exceeded")
+        return self.event.is_set()
+
+    def remaining(self):
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self.cancelled:
+            raise CommandCancelled(self.reason)
+
+
+_local = threading.local()
+
+
+def current_token():
+    """Cancellation token of the command running on this thread, if any"""
+    return getattr(_local, 'token', None)
+
+
+@contextmanager
+def use_token(token):
+    previous = current_token()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def check_cancelled():
+    """Raise CommandCancelled if the current command has been cancelled or is past its deadline"""
+    token = current_token()
+    if token is not None:
+        token.check()
+
+
+# Seconds each tool call may take before it is cancelled
+COMMAND_DEADLINES = {
+    'set_mode': 5,
+    'arm_disarm': 35,  # ACK plus up to 30 s waiting to see the vehicle armed
+    'takeoff': 5,
+    'condition_yaw': 5,
+    'change_speed': 5,
+    'move_local_ned': 5,  # Starting the move; plans that wait for it pass the move's own budget
+    'move_global_int': 5,
+    'generate_cross_coverage_path': 30,
+    'generate_waypoint_json': 10,
+    'generate_dynamic_waypoints_from_command': 10,
+}
+DEFAULT_DEADLINE = 10
+
+
+class CommandExecutor:
+    """Runs tool calls on a fixed pool of workers with a bounded queue.
+
+    Each call gets a CancellationToken with a deadline chosen by command
+    name. When the deadline passes the token is cancelled and the caller
+    waits up to grace seconds for the primitive to notice and return, so a
+    timed-out call no longer keeps using the vehicle connection. Queue time
+    and run time are tracked per command.
+    """
+
+    def __init__(self, workers=4, max_queue=32, grace=1.0):
+        self.scheduler = LaneScheduler(lanes={'tools': workers}, max_queue=max_queue)
+        self.grace = grace
+        self.lock = threading.Lock()
+        self.command_metrics = {}
+
+    def _record(self, name, outcome, task):
+        with self.lock:
+            stats = self.command_metrics.setdefault(name, {
+                'calls': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'timed_out': 0, 'rejected': 0,
+                'total_queue_time': 0.0, 'total_run_time': 0.0,
+            })
+            stats['calls'] += 1
+            stats[outcome] += 1
+            if task is not None and task.started_at is not None:
+                stats['total_queue_time'] += task.started_at - task.enqueued_at
+                stats['total_run_time'] += (task.finished_at or time.monotonic()) - task.started_at
+
+    def _run(self, token, fn, args, kwargs):
+        with use_token(token):
+            token.check()  # Expired while queued
+            return fn(*args, **kwargs)
+
+    def submit(self, name, fn, *args, timeout=None, **kwargs):
+        """Queue fn(*args, **kwargs); returns (task, token). Raises queue.Full when saturated"""
+        self.scheduler.start()
+        timeout = timeout if timeout is not None else COMMAND_DEADLINES.get(name, DEFAULT_DEADLINE)
+        # Cancelling the command that submits the call cancels the call too
+        token = CancellationToken(timeout, parent=current_token())
+        try:
+            task = self.scheduler.submit('tools', self._run, token, fn, args, kwargs, deadline=timeout)
+        except queue.Full:
+            self._record(name, 'rejected', None)
+            raise
+        return task, token
+
+    def wait(self, name, task, token):
+        """Wait for a call queued with submit() within its deadline.
+
+        Raises CommandCancelled on deadline or cancellation and re-raises
+        whatever the call raised.
+        """
+        try:
+            result = task.result(timeout=token.remaining())
+        except FutureTimeoutError:
+            token.cancel("deadline exceeded")
+            # Give the primitive a moment to see the token and let go of the connection
+            try:
+                task.future.exception(timeout=self.grace)
+            except (FutureTimeoutError, CancelledError):
+                pass
+            task.cancel()
+            self._record(name, 'timed_out', task)
+            raise CommandCancelled(f"{name} exceeded its {token.timeout}s deadline")
+        except CommandCancelled:
+            self._record(name, 'cancelled', task)
+            raise
+        except CancelledError:
+            self._record(name, 'cancelled', task)
+            raise CommandCancelled(f"{name} was cancelled")
+        except Exception:
+            self._record(name, 'failed', task)
+            raise
+        self._record(name, 'completed', task)
+        return result
+
+    def run(self, name, fn, *args, timeout=None, **kwargs):
+        """Run fn through the pool and wait for it within its deadline.
+
+        Raises CommandCancelled on deadline or cancellation, queue.Full when
+        the queue is full, and re-raises whatever fn raised.
+        """
+        task, token = self.submit(name, fn, *args, timeout=timeout, **kwargs)
+        return self.wait(name, task, token)
+
+    def metrics(self):
+        """Per-command counts with queue vs run time, plus the pool's lane stats"""
+        with self.lock:
+            commands = {}
+            for name, stats in self.command_metrics.items():
+                ran = stats['calls'] - stats['rejected']
+                commands[name] = dict(stats)
+                commands[name]['avg_queue_time'] = round(stats['total_queue_time'] / ran, 4) if ran else 0.0
+                commands[name]['avg_run_time'] = round(stats['total_run_time'] / ran, 4) if ran else 0.0
+        return {'commands': commands, 'pool': self.scheduler.metrics()['tools']}
+
+
+command_executor = CommandExecutor()
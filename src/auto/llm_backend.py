@@ -0,0 +1,192 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_HEDGE_AFTER = 2.0  # Seconds before the first hedge until enough latencies are known
+MIN_HEDGE_SAMPLES = 20
+
+
+class AsyncLLMBackend:
+    """Chat completions on one shared asyncio loop with a keep-alive HTTP pool.
+
+    All requests from the process run as tasks on a single background event
+    loop with one openai.AsyncOpenAI client, so concurrent commands share
+    pooled keep-alive connections (max_connections) instead of each getting
+    a thread and a fresh connection. At most max_concurrency requests are in
+    flight; the rest wait for a slot.
+
+    A non-streamed request still unanswered after hedge_after seconds (by
+    default the 95th percentile of recent latencies) is sent a second time
+    if a concurrency slot is free, and whichever answer arrives first wins.
+    base_url points the client at any OpenAI-compatible server, e.g. a
+    local stand-in model for tests and benchmarks. api_key may be a
+    callable; it is only read when the first request is made.
+
+    complete() and stream() return concurrent.futures.Future objects, so
+    callers wait on them directly instead of parking a thread per request.
+    """
+
+    def __init__(self, api_key=None, base_url=None, max_concurrency=8, max_connections=20,
+                 keepalive_expiry=30.0, timeout=10.0, hedge=True, hedge_after=None, latency_window=200):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.lock = threading.Lock()
+        self.loop = None
+        self.client = None
+        self.semaphore = None
+        self.latencies = deque(maxlen=latency_window)
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'streams': 0, 'hedged': 0, 'hedge_wins': 0, 'errors': 0, 'cancelled': 0}
+
+    def _start(self):
+        with self.lock:
+            if self.loop is not None:
+                return self.loop
+            import httpx
+            import openai
+
+            api_key = self.api_key() if callable(self.api_key) else self.api_key
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='llm-backend', daemon=True).start()
+
+            async def _setup():
+                self.semaphore = asyncio.Semaphore(self.max_concurrency)
+                self.client = openai.AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    max_retries=0,  # Hedging covers slow requests; failures surface to the caller
+                    http_client=httpx.AsyncClient(
+                        timeout=self.timeout,
+                        limits=httpx.Limits(max_connections=self.max_connections,
+                                            max_keepalive_connections=self.max_connections,
+                                            keepalive_expiry=self.keepalive_expiry),
+                    ),
+                )
+
+            asyncio.run_coroutine_threadsafe(_setup(), loop).result()
+            self.loop = loop
+            return loop
+
+    def _hedge_delay(self):
+        if self.hedge_after is not None:
+            return self.hedge_after
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return DEFAULT_HEDGE_AFTER
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+    async def _attempt(self, kwargs, acquired=False):
+        if not acquired:
+            await self.semaphore.acquire()
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            response = await self.client.chat.completions.create(**kwargs)
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+        with self.lock:
+            self.latencies.append(time.monotonic() - started)
+        return response
+
+    async def _complete(self, kwargs):
+        self.stats['requests'] += 1
+        primary = asyncio.ensure_future(self._attempt(kwargs))
+        attempts = [primary]
+        try:
+            if self.hedge:
+                done, _ = await asyncio.wait(attempts, timeout=self._hedge_delay())
+                # Only hedge with a free slot, so hedges never queue behind real requests
+                if not done and not self.semaphore.locked():
+                    await self.semaphore.acquire()
+                    self.stats['hedged'] += 1
+                    attempts.append(asyncio.ensure_future(self._attempt(kwargs, acquired=True)))
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is not primary:
+                            self.stats['hedge_wins'] += 1
+                        return attempt.result()
+                    error = attempt.exception()
+            self.stats['errors'] += 1
+            raise error
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            raise
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def _stream(self, kwargs, on_chunk):
+        self.stats['streams'] += 1
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                stream = await self.client.chat.completions.create(stream=True, **kwargs)
+                try:
+                    async for chunk in stream:
+                        if on_chunk(chunk) is False:
+                            break
+                finally:
+                    response = getattr(stream, 'response', None)
+                    if response is not None:
+                        await response.aclose()
+            except asyncio.CancelledError:
+                self.stats['cancelled'] += 1
+                raise
+            except Exception:
+                self.stats['errors'] += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    def complete(self, **kwargs):
+        """Start a chat completion; returns a Future for the response (cancel it to abandon the request)"""
+        return asyncio.run_coroutine_threadsafe(self._complete(kwargs), self._start())
+
+    def stream(self, on_chunk, **kwargs):
+        """Stream a chat completion, calling on_chunk(chunk) on the backend loop for each chunk.
+
+        Returning False from on_chunk stops the stream. The returned Future
+        resolves when the stream ends.
+        """
+        return asyncio.run_coroutine_threadsafe(self._stream(kwargs, on_chunk), self._start())
+
+    def status(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        return {
+            'base_url': self.base_url or 'default',
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self.in_flight,
+            'hedge_after_s': round(self._hedge_delay(), 3) if self.hedge else None,
+            'latency_p50_s': round(latencies[len(latencies) // 2], 3) if latencies else None,
+            'latency_p95_s': round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 3) if latencies else None,
+            **self.stats,
+        }
+
+
+def backend_from_env(api_key=None):
+    """AsyncLLMBackend configured from LLM_BASE_URL, LLM_MAX_CONCURRENCY, LLM_MAX_CONNECTIONS and LLM_HEDGE_AFTER"""
+    hedge_after = os.environ.get('LLM_HEDGE_AFTER')
+    return AsyncLLMBackend(
+        api_key=api_key,
+        base_url=os.environ.get('LLM_BASE_URL') or None,
+        max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 8)),
+        max_connections=int(os.environ.get('LLM_MAX_CONNECTIONS', 20)),
+        hedge=hedge_after != '0',
+        hedge_after=float(hedge_after) if hedge_after else None,
+    )
@@ -0,0 +1,260 @@
+import threading
+import time
+from collections import deque, namedtuple
+from pymavlink import mavutil
+
+from src.auto.command_layer import command_layer, send_command
+
+mavlink = mavutil.mavlink
+
+MissionItem = namedtuple('MissionItem', 'command frame param1 param2 param3 param4 x y z autocontinue')
+MissionItem.__new__.__defaults__ = (0, 0, 0, 0, 0, 0, 0, 1)
+
+
+def mission_items_from_path(path, takeoff_alt=None):
+    """Convert generate_cross_coverage_path() output into mission items.
+
+    Item 0 is the home slot the autopilot overwrites, then a takeoff to the
+    coverage altitude, one waypoint per planner waypoint and, when the plan
+    asks for it, return to launch.
+    """
+    waypoints = path.get('waypoints') or []
+    if not waypoints:
+        return []
+    altitude = takeoff_alt if takeoff_alt is not None else path.get('coverage', {}).get('altitude_m', waypoints[0]['position']['alt'])
+    first = waypoints[0]['position']
+    items = [
+        MissionItem(mavlink.MAV_CMD_NAV_WAYPOINT, mavlink.MAV_FRAME_GLOBAL,
+                    x=int(first['lat'] * 1e7), y=int(first['lon'] * 1e7), z=0),
+        MissionItem(mavlink.MAV_CMD_NAV_TAKEOFF, mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT, z=altitude),
+    ]
+    for waypoint in waypoints:
+        position = waypoint['position']
+        hold_s = waypoint.get('action', {}).get('duration_s', 0)
+        items.append(MissionItem(
+            mavlink.MAV_CMD_NAV_WAYPOINT, mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT,
+            param1=hold_s,
+            x=int(round(position['lat'] * 1e7)), y=int(round(position['lon'] * 1e7)), z=position['alt']
+        ))
+    if path.get('settings', {}).get('optimization', {}).get('return_to_home'):
+        items.append(MissionItem(mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH, mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT))
+    return items
+
+
+class MissionUploadError(Exception):
+    """Upload aborted; resumable is True if the vehicle kept the items sent so far"""
+
+    def __init__(self, message, resumable=False):
+        super().__init__(message)
+        self.resumable = resumable
+
+
+class MissionUploader:
+    """Uploads missions over the MAVLink mission protocol on one connection.
+
+    A full upload sends MISSION_COUNT and answers each MISSION_REQUEST_INT
+    (or legacy MISSION_REQUEST) with the MISSION_ITEM_INT for that sequence
+    number until the vehicle's MISSION_ACK. The vehicle drives the transfer,
+    so retransmission is timeout based: if no request arrives for
+    item_timeout seconds the last message is sent again, up to max_retries
+    times in a row.
+
+    The last mission the vehicle acknowledged is remembered. Uploading a
+    mission of the same length only sends the changed range with
+    MISSION_WRITE_PARTIAL_LIST (nothing at all if unchanged), and resume()
+    continues an interrupted transfer from the first unconfirmed item.
+    """
+
+    def __init__(self, master_conn, item_timeout=1.5, max_retries=5):
+        self.master = master_conn
+        self.layer = command_layer(master_conn)
+        self.item_timeout = item_timeout
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.uploaded = None  # Items the vehicle last acknowledged
+        self.interrupted = None  # (items, next seq to send) of an aborted transfer
+        self.inbox = deque()
+        self.stats = {
+            'uploads': 0,
+            'partial_uploads': 0,
+            'skipped_uploads': 0,
+            'resumes': 0,
+            'items_sent': 0,
+            'retransmits': 0,
+            'failures': 0,
+        }
+        self.last_transfer = None
+
+    def _on_message(self, msg):
+        if msg.get_type() in ('MISSION_REQUEST_INT', 'MISSION_REQUEST', 'MISSION_ACK'):
+            if getattr(msg, 'target_system', 0) in (0, self.master.mav.srcSystem):
+                self.inbox.append(msg)
+
+    def _send_item(self, items, seq):
+        item = items[seq]
+        self.layer.send_message(mavlink.MAVLink_mission_item_int_message(
+            self.master.target_system, self.master.target_component,
+            seq, item.frame, item.command,
+            0, item.autocontinue,
+            item.param1, item.param2, item.param3, item.param4,
+            item.x, item.y, item.z
+        ))
+        self.stats['items_sent'] += 1
+
+    def _transfer(self, items, start, end):
+        """Send items[start..end] and wait for the vehicle's MISSION_ACK"""
+        partial = start > 0 or end < len(items) - 1
+
+        def announce():
+            if partial:
+                self.layer.send_message(mavlink.MAVLink_mission_write_partial_list_message(
+                    self.master.target_system, self.master.target_component, start, end))
+            else:
+                self.layer.send_message(mavlink.MAVLink_mission_count_message(
+                    self.master.target_system, self.master.target_component, len(items)))
+
+        started = time.monotonic()
+        self.inbox.clear()
+        self.layer.add_listener(self._on_message)
+        try:
+            announce()
+            last_sent = None  # Sequence number of the item most recently sent
+            next_needed = start  # Every item before this has been received by the vehicle
+            last_activity = time.monotonic()
+            retries = 0
+            while True:
+                while self.inbox:
+                    msg = self.inbox.popleft()
+                    msg_type = msg.get_type()
+                    if msg_type == 'MISSION_ACK':
+                        if msg.type == mavlink.MAV_MISSION_ACCEPTED:
+                            if last_sent is None:
+                                continue  # Stale ACK from an earlier transfer
+                            self.last_transfer = {
+                                'items': end - start + 1,
+                                'partial': partial,
+                                'duration_s': round(time.monotonic() - started, 3),
+                            }
+                            return
+                        if msg.type == mavlink.MAV_MISSION_INVALID_SEQUENCE:
+                            # A retransmitted item the vehicle already had: its request
+                            # for the next one was lost, so send that unasked
+                            if last_sent is not None and last_sent < end:
+                                last_sent += 1
+                                next_needed = max(next_needed, last_sent)
+                                self._send_item(items, last_sent)
+                                last_activity = time.monotonic()
+                            continue
+                        name = mavlink.enums['MAV_MISSION_RESULT'][msg.type].name
+                        raise MissionUploadError(f"Vehicle rejected mission: {name}")
+                    if msg_type in ('MISSION_REQUEST_INT', 'MISSION_REQUEST'):
+                        seq = msg.seq
+                        if seq < start or seq > end:
+                            continue
+                        if seq == last_sent:
+                            self.stats['retransmits'] += 1
+                        self._send_item(items, seq)
+                        last_sent = seq
+                        next_needed = max(next_needed, seq)
+                        last_activity = time.monotonic()
+                        retries = 0
+                if time.monotonic() - last_activity > self.item_timeout:
+                    retries += 1
+                    if retries > self.max_retries:
+                        self.interrupted = (items, next_needed)
+                        raise MissionUploadError(
+                            f"Mission upload stalled at item {next_needed} of {len(items)}",
+                            resumable=next_needed > start
+                        )
+                    self.stats['retransmits'] += 1
+                    if last_sent is None:
+                        announce()
+                    else:
+                        self._send_item(items, last_sent)
+                    last_activity = time.monotonic()
+                self.layer.pump(0.05)
+        finally:
+            self.layer.remove_listener(self._on_message)
+
+    def upload(self, items, force_full=False):
+        """Upload a mission, sending only what changed since the last upload when possible.
+
+        Returns the number of items sent. Raises MissionUploadError on failure.
+        """
+        items = list(items)
+        with self.lock:
+            start, end = 0, len(items) - 1
+            if not force_full and self.uploaded is not None and len(self.uploaded) == len(items):
+                changed = [seq for seq, (old, new) in enumerate(zip(self.uploaded, items)) if old != new]
+                if not changed:
+                    self.stats['skipped_uploads'] += 1
+                    return 0
+                start, end = changed[0], changed[-1]
+            try:
+                self._transfer(items, start, end)
+            except MissionUploadError:
+                self.stats['failures'] += 1
+                self.uploaded = None
+                raise
+            self.stats['partial_uploads' if start > 0 or end < len(items) - 1 else 'uploads'] += 1
+            self.uploaded = items
+            self.interrupted = None
+            return end - start + 1
+
+    def resume(self):
+        """Continue an interrupted upload from the first item the vehicle had not confirmed"""
+        with self.lock:
+            if self.interrupted is None:
+                return 0
+            items, start = self.interrupted
+            try:
+                self._transfer(items, start, len(items) - 1)
+            except MissionUploadError:
+                self.stats['failures'] += 1
+                raise
+            self.stats['resumes'] += 1
+            self.uploaded = items
+            self.interrupted = None
+            return len(items) - start
+
+    def status(self):
+        return {
+            'uploaded_items': len(self.uploaded) if self.uploaded is not None else None,
+            'interrupted_at': self.interrupted[1] if self.interrupted else None,
+            'last_transfer': self.last_transfer,
+            'stats': dict(self.stats),
+        }
+
+
+_uploaders_lock = threading.Lock()
+
+
+def mission_uploader(master_conn):
+    """The MissionUploader bound to a connection, created on first use"""
+    uploader = getattr(master_conn, 'mission_uploader', None)
+    if uploader is None:
+        with _uploaders_lock:
+            uploader = getattr(master_conn, 'mission_uploader', None)
+            if uploader is None:
+                uploader = master_conn.mission_uploader = MissionUploader(master_conn)
+    return uploader
+
+
+def upload_coverage_path(master_conn, path, resume=True):
+    """Upload a generated coverage path as a mission; returns the number of items sent"""
+    uploader = mission_uploader(master_conn)
+    items = mission_items_from_path(path)
+    if not items:
+        raise MissionUploadError("Coverage path has no waypoints")
+    if resume and uploader.interrupted is not None and uploader.interrupted[0] == items:
+        try:
+            return uploader.resume()
+        except MissionUploadError as e:
+            # The vehicle may not have kept the partial mission; start over
+            print(f"Mission resume failed ({e}), uploading in full")
+    return uploader.upload(items, force_full=uploader.interrupted is not None)
+
+
+def start_mission(master_conn):
+    """Start the uploaded mission (switches the vehicle to AUTO); returns the ACK result"""
+    return send_command(master_conn, mavlink.MAV_CMD_MISSION_START, 0, 0)
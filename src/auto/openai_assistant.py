@@ -1,24 +1,24 @@
-import openai
+import copy
 import json
 import os
+import queue
+import threading
 import time
-from pymavlink import mavutil
-
-from .function import (
-    check_heartbeat,
-    set_mode,
-    arm_disarm,
-    takeoff,
-    condition_yaw,
-    change_speed,
-    move_local_ned,
-    move_global_int,
-    generate_waypoint_json,
-    generate_dynamic_waypoints_from_command
-)
-from .cpp_function import generate_cross_coverage_path
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import ExitStack
+
+# The OpenAI client, pymavlink and the drone functions are imported on first
+# use, so importing this module stays cheap and works without an API key
+from .executor import command_executor, CommandCancelled, check_cancelled
+from .plan_cache import plan_cache, normalize_command
+from .command_parser import parse_command
+from .tool_router import ToolRouter, estimate_tokens
+from .llm_backend import backend_from_env
+from .single_flight import SingleFlight
 
 def read_api_key():
+    if not os.path.exists('.profile') and os.environ.get('OPENAI_API_KEY'):
+        return os.environ['OPENAI_API_KEY']
     with open('.profile', 'r') as f:
         content = f.read().strip()
         if content.startswith('OPENAI_API_KEY='):
@@ -26,8 +26,8 @@ def read_api_key():
         raise ValueError("Invalid .profile format. Expected 'OPENAI_API_KEY=<key>'")
 
 
-api_key = read_api_key()
-client = openai.OpenAI(api_key=api_key)
+# Shared async client on one event loop; the API key is read on the first request
+llm_backend = backend_from_env(api_key=read_api_key)
 
 
 available_functions = [
@@ -243,79 +243,418 @@ available_functions = [
     }
 ]
 
-def execute_command(function_name, args, master_conn=None):
-    
+# Sends each command only the tool schemas it needs
+tool_router = ToolRouter(available_functions)
+
+# Seconds during which a repeated identical command shares the first one's execution
+COALESCE_WINDOW = float(os.environ.get('COMMAND_COALESCE_WINDOW', 2.0))
+command_flights = SingleFlight(window=COALESCE_WINDOW)
+
+# Tool calls that run locally and never touch the vehicle
+HELPER_FUNCTIONS = ["generate_cross_coverage_path", "generate_waypoint_json", "generate_dynamic_waypoints_from_command"]
+
+
+_function_map = None
+
+
+def get_function_map():
+    """Tool name -> implementation, importing the drone functions (and pymavlink) on first use"""
+    global _function_map
+    if _function_map is None:
+        from . import function
+        from .cpp_function import generate_cross_coverage_path
+        _function_map = {
+            "set_mode": function.set_mode,
+            "arm_disarm": function.arm_disarm,
+            "takeoff": function.takeoff,
+            "condition_yaw": function.condition_yaw,
+            "change_speed": function.change_speed,
+            "move_local_ned": function.move_local_ned,
+            "move_global_int": function.move_global_int,
+            "generate_cross_coverage_path": generate_cross_coverage_path,
+            # Not every checkout has the waypoint JSON generator; the tool then reports not found
+            "generate_waypoint_json": getattr(function, "generate_waypoint_json", None),
+            "generate_dynamic_waypoints_from_command": function.generate_dynamic_waypoints_from_command
+        }
+    return _function_map
+
+
+def _tool_call(function_name, master_conn):
+    """(function, leading arguments) for a tool call, or (None, result) when it does not run"""
     # This function map is necessary to map function names from the API calls to their actual function implementations
     # Without it, we wouldn't be able to dynamically call the right drone control function based on the command name
-    function_map = {
-        "set_mode": set_mode,
-        "arm_disarm": arm_disarm,
-        "takeoff": takeoff,
-        "condition_yaw": condition_yaw,
-        "change_speed": change_speed,
-        "move_local_ned": move_local_ned,
-        "move_global_int": move_global_int,
-        "generate_cross_coverage_path": generate_cross_coverage_path,
-        "generate_waypoint_json": generate_waypoint_json,
-        "generate_dynamic_waypoints_from_command": generate_dynamic_waypoints_from_command
-    }
-    
-    # Keep track of executed functions for logging/debugging
-    function_list = [{"name": function_name, "args": args}]
+    function_map = get_function_map()
     
-    #print(function_list)
-    #print(f"Functions to execute: {[f['name'] for f in function_list]}")
-    #print(f"With arguments: {[f['args'] for f in function_list]}")
+    #print(f"Functions to execute: {function_name}")
     func = function_map.get(function_name)
     if func is None:
         #print(f"Error: Function {function_name} not found")
-        return False
+        return None, False
     
-    # Call the function with master_conn and the provided arguments
+    # Special handling for non-MAVLink helper functions which should not receive master_conn
+    if function_name in HELPER_FUNCTIONS:
+        return func, ()
+    if master_conn is not None:
+        return func, (master_conn,)
+    # For other functions when master_conn is None, just return success
+    return None, True
+
+
+def _ack(function_name, wait):
+    """The ACK execute_command reports for a tool call whose result wait() returns"""
     try:
-        # Use a separate thread with a timeout to prevent hanging
-        import threading
-        import queue
+        result = wait()
+        return result if result is not None else -1  # Return ACK or -1 if None
+    except CommandCancelled as e:
+        print(f"{function_name} cancelled: {e}")
+        return -1  # Return -1 for timeout
+    except queue.Full:
+        print(f"Command queue full, rejected {function_name}")
+        return -1
+    except Exception as e:
+        #print(f"Error executing {function_name}: {e}")
+        return -1  # Return -1 for error
 
-        result_queue = queue.Queue()
-        
-        def run_with_timeout():
-            try:
-                # Special handling for non-MAVLink helper functions which should not receive master_conn
-                if function_name in ["generate_cross_coverage_path", "generate_waypoint_json", "generate_dynamic_waypoints_from_command"]:
-                    result = func(**args)  # Don't pass master_conn
-                elif master_conn is not None:
-                    result = func(master_conn, **args)
+
+def execute_command(function_name, args, master_conn=None, timeout=None):
+    func, call_args = _tool_call(function_name, master_conn)
+    if func is None:
+        return call_args
+
+    # Run on the bounded command pool; past its deadline the call is cancelled
+    # cooperatively, so it never lingers holding the connection
+    return _ack(function_name, lambda: command_executor.run(function_name, func, *call_args, timeout=timeout, **args))
+
+SYSTEM_PROMPT = "You control a drone with functions. Convert natural language to drone control function calls. When you see commands about 'cross coverage', 'cross cover path', 'cpp path', or similar, you MUST call the generate_cross_coverage_path function with the appropriate parameters extracted from the command. After any movement-related command (e.g., takeoff, move_local_ned, move_global_int, condition_yaw, change_speed), you MUST also call generate_dynamic_waypoints_from_command with the original command so the frontend receives a full waypoint JSON for Cesium. If the user explicitly asks for a waypoint JSON from existing waypoints, you MAY call generate_waypoint_json. For commands starting with '[SURVEILLANCE]', extract the actual command after the bracket and process it normally (e.g., '[SURVEILLANCE] take off' -> 'take off')."
+
+MOVEMENT_FUNCTIONS = ["takeoff", "move_local_ned", "move_global_int", "condition_yaw", "change_speed"]
+LLM_TIMEOUT = 10  # Seconds to wait for the model (for streams: between chunks)
+
+
+class PlanStreamError(Exception):
+    """The streamed plan broke off (request error, timeout or malformed arguments)"""
+
+
+def _completion_args(user_input, usage=None):
+    """Request arguments with only the tools user_input needs; usage gets the routing and prompt size"""
+    groups, tools, tools_tokens = tool_router.route(user_input)
+    if usage is not None:
+        usage['tool_groups'] = list(groups) or ['all']
+        usage['tools'] = len(tools)
+        usage['prompt_tokens_estimate'] = tools_tokens + estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user_input)
+    return dict(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_input}
+        ],
+        tools=tools,
+        tool_choice="auto"
+    )
+
+
+def start_plan_request(user_input, usage=None):
+    """Send the LLM request for user_input's tool calls; returns the backend's Future for the response.
+
+    The request runs on the shared backend loop, so waiting for it ties up
+    no thread of its own.
+    """
+    return llm_backend.complete(**_completion_args(user_input, usage))
+
+
+def plan_from_response(future, usage=None):
+    """Wait for a response started by start_plan_request and return its tool calls (see request_plan)"""
+    try:
+        response = future.result(timeout=LLM_TIMEOUT)
+    except FutureTimeoutError:
+        # Abandoned on the backend loop, which frees its connection
+        future.cancel()
+        print("OpenAI request timed out")
+        return None
+    except Exception as e:
+        print(f"OpenAI request error: {e}")
+        return None
+
+    if usage is not None and getattr(response, 'usage', None) is not None:
+        usage['prompt_tokens'] = response.usage.prompt_tokens
+    message = response.choices[0].message
+    print(f"OpenAI response: {message.content}")
+    print(f"Tool calls: {message.tool_calls}")
+    return [(tool_call.function.name, json.loads(tool_call.function.arguments))
+            for tool_call in message.tool_calls or []]
+
+
+def request_plan(user_input, usage=None):
+    """Ask the LLM for the tool calls that carry out user_input.
+
+    Returns a list of (function_name, args), [] if the model made no tool
+    calls, or None if the request failed or timed out. If usage is a dict it
+    gets the tool groups sent and the prompt token count.
+    """
+    return plan_from_response(start_plan_request(user_input, usage), usage)
+
+
+def stream_plan(user_input, timing, usage=None):
+    """Start streaming the LLM's tool calls; returns an iterator of (function_name, args).
+
+    The request goes out immediately, before the iterator is consumed. A
+    tool call is yielded as soon as it is complete (the next one started or
+    the stream ended), so the caller can execute it while the rest of the
+    plan is still being generated. timing['first_token'] is set to the
+    monotonic time of the first chunk and timing['ready'] to the time the
+    yielded call completed in the stream. usage is filled as in request_plan
+    (estimated tokens only; streamed responses carry no usage). Raises
+    PlanStreamError if the stream fails or stalls.
+    """
+    events: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+
+    calls = []  # [name, arguments] per tool call index, filled from deltas
+
+    def _on_chunk(chunk):
+        # Runs on the backend loop
+        if stop.is_set():
+            return False
+        events.put(("chunk", time.monotonic()))
+        if not chunk.choices:
+            return True
+        for delta in chunk.choices[0].delta.tool_calls or []:
+            while len(calls) <= delta.index:
+                if calls:
+                    # A new call started, so the previous one is complete
+                    events.put(("call", (calls[-1], time.monotonic())))
+                calls.append(["", ""])
+            if delta.function is not None:
+                calls[delta.index][0] += delta.function.name or ""
+                calls[delta.index][1] += delta.function.arguments or ""
+        return True
+
+    def _on_done(future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            events.put(("error", future.exception()))
+            return
+        if calls:
+            events.put(("call", (calls[-1], time.monotonic())))
+        events.put(("done", None))
+
+    def _calls():
+        try:
+            while True:
+                try:
+                    kind, payload = events.get(timeout=LLM_TIMEOUT)
+                except queue.Empty:
+                    raise PlanStreamError("OpenAI stream timed out")
+                if kind == "chunk":
+                    timing.setdefault('first_token', payload)
+                elif kind == "call":
+                    (name, arguments), timing['ready'] = payload
+                    try:
+                        args = json.loads(arguments) if arguments else {}
+                    except ValueError as e:
+                        raise PlanStreamError(f"Malformed arguments for {name}: {e}")
+                    print(f"Streamed tool call: {name}({arguments})")
+                    yield name, args
+                elif kind == "error":
+                    raise PlanStreamError(f"OpenAI request error: {payload}")
                 else:
-                    # For other functions when master_conn is None, just return success
-                    result = True
-                result_queue.put(("success", result))
-            except Exception as e:
-                result_queue.put(("error", str(e)))
-        
-        # Start the function in a separate thread
-        thread = threading.Thread(target=run_with_timeout)
-        thread.daemon = True
-        thread.start()
-        
-        # Wait for the function to complete with timeout
+                    return
+        finally:
+            stop.set()
+            stream.cancel()
+
+    stream = llm_backend.stream(_on_chunk, **_completion_args(user_input, usage))
+    stream.add_done_callback(_on_done)
+    return _calls()
+
+
+def _failed(ack_value):
+    return ack_value is False or ack_value == "timeout"
+
+
+def _run_plan(calls, user_input, waypoints_data, lease_vehicle, report, timing):
+    """Execute the tool calls from calls as a small dependency graph.
+
+    Vehicle commands depend on the one before them (arm before takeoff) and
+    run in plan order, a move_local_ned only counting as done once the
+    vehicle got there; once one fails the remaining vehicle commands are
+    skipped. Helpers that only compute (HELPER_FUNCTIONS) depend on nothing.
+    Every step is dispatched as soon as it appears in the plan, even while
+    the plan is still streaming: helpers are queued on the command pool
+    and collected at the end, while the vehicle chain runs on the calling
+    thread, so a mixed plan takes about as long as its longest chain
+    without a thread per step. lease_vehicle() is called once, when the
+    first vehicle step comes up, and returns the connection the vehicle
+    commands use.
+
+    Returns (success, function_list, waypoint_data) with function_list in
+    plan order. report['timeline'] gets one entry per step with its kind,
+    the steps it waited for, its status and when it was ready, started and
+    finished, in seconds from timing['first_token'] for a streamed plan or
+    from the moment the plan was available otherwise.
+    """
+    steps = []
+    helpers = []  # (step, wait for its result)
+    auto_waypoints = None
+    last_vehicle = None  # Index of the last vehicle step
+    master = None
+    chain_failed = False
+    interrupted = False  # The stream broke off or the command was cancelled
+
+    def start_helper(step, function_name, function_args):
+        func, call_args = _tool_call(function_name, None)
+        if func is None:
+            # Not available in this checkout; reported as failed like execute_command does
+            print(f"Function {function_name} not found")
+            helpers.append((step, lambda: call_args))
+            return
+
+        def timed(*args, **kwargs):
+            step['started'] = time.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                step['finished'] = time.monotonic()
+
         try:
-            status, result = result_queue.get(timeout=5)  # 10 second timeout
-            if status == "error":
-                #print(f"Error executing {function_name}: {result}")
-                return -1  # Return -1 for error
+            task, token = command_executor.submit(function_name, timed, *call_args, **function_args)
+        except queue.Full:
+            print(f"Command queue full, rejected {function_name}")
+            helpers.append((step, lambda: -1))
+            return
+        helpers.append((step, lambda: _ack(function_name, lambda: command_executor.wait(function_name, task, token))))
+
+    def run_vehicle_step(step, function_name, function_args):
+        nonlocal chain_failed
+        if chain_failed:
+            step['status'] = 'skipped'
+            return
+        timeout = None
+        if function_name == "move_local_ned":
+            # Wait for the closed-loop move to finish: the next leg would cancel it
+            from .position_controller import move_timeout
+            function_args = dict(function_args, wait=True)
+            timeout = move_timeout(*(float(function_args.get(axis, 0)) for axis in ("x_m", "y_m", "z_m_down"))) + 5
+        step['started'] = time.monotonic()
+        step['ack'] = execute_command(function_name, function_args, master, timeout)
+        step['finished'] = time.monotonic()
+        step['status'] = 'failed' if _failed(step['ack']) else 'ok'
+        chain_failed = step['status'] == 'failed'
+
+    def new_step(function_name, kind, ready):
+        return {'name': function_name, 'kind': kind, 'after': [], 'status': 'pending',
+                'ready': ready, 'started': None, 'finished': None, 'ack': None}
+
+    try:
+        for function_name, function_args in calls:
+            check_cancelled()
+            ready = timing.pop('ready', time.monotonic())
+            # If this is the generate_cross_coverage_path function and waypoints_data is provided,
+            # replace the waypoints_data parameter with the actual waypoints
+            if function_name == "generate_cross_coverage_path" and waypoints_data is not None:
+                function_args["waypoints_data"] = waypoints_data
+
+            # AUTOMATICALLY ADD DYNAMIC WAYPOINT GENERATION for any movement command.
+            # It only needs the command text, so it can start right away
+            if function_name in MOVEMENT_FUNCTIONS and auto_waypoints is None:
+                print("Movement command detected - automatically adding dynamic waypoint generation")
+                auto_waypoints = new_step("generate_dynamic_waypoints_from_command", 'helper', ready)
+                start_helper(auto_waypoints, auto_waypoints['name'], {"command": user_input})
+
+            if function_name in HELPER_FUNCTIONS:
+                step = new_step(function_name, 'helper', ready)
+                steps.append(step)
+                start_helper(step, function_name, function_args)
             else:
-                #print(f"Result: {result}")
-                return result if result is not None else -1  # Return ACK or -1 if None
-        except queue.Empty:
-            #print(f"Function {function_name} timed out after 10 seconds. Continuing...")
-            return -1  # Return -1 for timeout
-            
-    except Exception as e:
-        #print(f"Error executing {function_name}: {e}")
-        return False
+                if last_vehicle is None:
+                    master = lease_vehicle()
+                step = new_step(function_name, 'vehicle', ready)
+                if last_vehicle is not None:
+                    step['after'] = [last_vehicle]
+                last_vehicle = len(steps)
+                steps.append(step)
+                run_vehicle_step(step, function_name, function_args)
+    except (PlanStreamError, CommandCancelled) as e:
+        print(e)
+        interrupted = True
+
+    for step, wait in helpers:
+        step['ack'] = wait()
+        step['status'] = 'failed' if _failed(step['ack']) else 'ok'
+    if auto_waypoints is not None:
+        steps.append(auto_waypoints)
+
+    origin = timing.get('first_token', timing['plan_ready'])
+    report['timeline'] = [{
+        'step': index,
+        'name': step['name'],
+        'kind': step['kind'],
+        'after': step['after'],
+        'status': step['status'],
+        'ready_s': round(step['ready'] - origin, 3),
+        'started_s': round(step['started'] - origin, 3) if step['started'] is not None else None,
+        'finished_s': round(step['finished'] - origin, 3) if step['finished'] is not None else None,
+    } for index, step in enumerate(steps)]
+
+    executed = [step for step in steps if step['status'] != 'skipped']
+    function_list = [[step['name'], step['ack']] for step in executed]
+    waypoint_data = None
+    for step in executed:
+        # If this is a waypoint generation function, store the result
+        if step['name'] in ["generate_waypoint_json", "generate_dynamic_waypoints_from_command"] and step['ack'] is not None:
+            waypoint_data = step['ack']
+    if not executed:
+        return False, [], None
+    success = not interrupted and all(step['status'] == 'ok' for step in executed)
+    return success, function_list, waypoint_data
+
+
+def command_key(user_input, waypoints_data=None):
+    """Commands with the same key are the same request: equal normalized text, numbers and waypoints"""
+    key, numbers = normalize_command(user_input)
+    waypoints = json.dumps(waypoints_data, sort_keys=True, default=str) if waypoints_data is not None else None
+    return key, tuple(numbers), waypoints
+
+
+def get_and_execute_drone_commands(user_input, waypoints_data=None, report=None, stream=False):
+    """Plan and run user_input; returns (success, function_list, waypoint_data).
 
-def get_and_execute_drone_commands(user_input, waypoints_data=None):
+    When the plan has to come from the LLM, the request is sent first and
+    the drone connection is warmed up while the model is working; the
+    connection is leased for the vehicle commands only once they are
+    about to run. Cross coverage commands, and plans known to
+    use only local helpers, skip the connection entirely. With stream=True
+    the plan is streamed and each tool call runs as soon as its arguments
+    are complete, while the model is still generating the next ones.
+
+    If report is a dict it is filled with how the plan was obtained:
+    plan_source ('parser', 'cache', 'llm' or 'llm-stream'), the parser's
+    confidence, the tools and prompt tokens sent to the LLM (prompt), the
+    per-step timeline and the time spent in each phase
+    (timings: parse_s, llm_s or first_token_s, connect_s, lease_wait_s, execute_s, total_s).
+
+    Identical commands (same normalized text and waypoints) issued while one
+    is running, or within COALESCE_WINDOW seconds of its start, share that
+    execution and its result rather than calling the LLM and commanding the
+    vehicle again; their report is a copy of the first one with coalesced
+    set to True.
+    """
+    def _execute():
+        run_report = {}
+        return _plan_and_execute(user_input, waypoints_data, run_report, stream), run_report
+
+    (result, run_report), coalesced = command_flights.run(command_key(user_input, waypoints_data), _execute)
+    if report is not None:
+        report.update(copy.deepcopy(run_report))
+        report['coalesced'] = coalesced
+    return result
+
+
+def _plan_and_execute(user_input, waypoints_data, report, stream):
+    """One uncoalesced execution of get_and_execute_drone_commands"""
+    requested = time.monotonic()
+    timings = report['timings'] = {}
     try:
         # Check if this is a cross coverage command
         is_cross_coverage = ("cross coverage" in user_input.lower() or 
@@ -325,106 +664,100 @@ def get_and_execute_drone_commands(user_input, waypoints_data=None):
         # Check if this is a surveillance command (should connect to drone)
         is_surveillance = user_input.startswith("[SURVEILLANCE]")
         
-        # Only connect to drone if not a cross coverage command
-        master = None
-        if not is_cross_coverage:
-            try:
-                master = mavutil.mavlink_connection('udp:127.0.0.1:14550', source_system=255)
-                # Use bounded wait to avoid stalling subsequent requests
-                check_heartbeat(master, timeout_s=5.0)
-            except Exception as e:
-                print(f"Warning: Could not connect to drone: {e}")
-                print("Continuing without drone connection for testing...")
-                master = None
-        
-        # Call OpenAI with a bounded timeout using a worker thread
-        import threading
-        import queue
+        timing = {}
+        # Simple commands are resolved locally and never reach the LLM
+        parsed = parse_command(user_input)
+        report['confidence'] = parsed.confidence
+        plan = parsed.commands if parsed.path == 'parser' else None
+        report['plan_source'] = 'parser'
+        if plan is None:
+            # Repeated commands reuse the plan the LLM produced last time
+            plan = plan_cache.get(user_input)
+            report['plan_source'] = 'cache'
+        timings['parse_s'] = round(time.monotonic() - requested, 4)
 
-        def _call_openai(q: "queue.Queue"):
-            try:
-                resp = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You control a drone with functions. Convert natural language to drone control function calls. When you see commands about 'cross coverage', 'cross cover path', 'cpp path', or similar, you MUST call the generate_cross_coverage_path function with the appropriate parameters extracted from the command. After any movement-related command (e.g., takeoff, move_local_ned, move_global_int, condition_yaw, change_speed), you MUST also call generate_dynamic_waypoints_from_command with the original command so the frontend receives a full waypoint JSON for Cesium. If the user explicitly asks for a waypoint JSON from existing waypoints, you MAY call generate_waypoint_json. For commands starting with '[SURVEILLANCE]', extract the actual command after the bracket and process it normally (e.g., '[SURVEILLANCE] take off' -> 'take off')."},
-                        {"role": "user", "content": user_input}
-                    ],
-                    tools=[{"type": "function", "function": func} for func in available_functions],
-                    tool_choice="auto"
-                )
-                q.put(("success", resp))
-            except Exception as e:
-                q.put(("error", e))
-
-        _q: "queue.Queue" = queue.Queue()
-        _t = threading.Thread(target=_call_openai, args=(_q,))
-        _t.daemon = True
-        _t.start()
+        # Send the LLM request before connecting, so the two waits overlap
+        pending = calls = None
+        if plan is None:
+            llm_started = time.monotonic()
+            usage = report['prompt'] = {}
+            if stream:
+                report['plan_source'] = 'llm-stream'
+                calls = stream_plan(user_input, timing, usage)
+            else:
+                report['plan_source'] = 'llm'
+                pending = start_plan_request(user_input, usage)
 
-        try:
-            status, payload = _q.get(timeout=10)
-            if status == "error":
-                print(f"OpenAI request error: {payload}")
-                return False, [], None
-            response = payload
-        except queue.Empty:
-            print("OpenAI request timed out")
-            return False, [], None
-        
-        
-        message = response.choices[0].message
-        print(f"OpenAI response: {message.content}")
-        print(f"Tool calls: {message.tool_calls}")
-        if message.tool_calls:
-            commands = []
-            for tool_call in message.tool_calls:
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                
-                # If this is the generate_cross_coverage_path function and waypoints_data is provided,
-                # replace the waypoints_data parameter with the actual waypoints
-                if function_name == "generate_cross_coverage_path" and waypoints_data is not None:
-                    function_args["waypoints_data"] = waypoints_data
-                
-                args_str = ", ".join([f"{k}={repr(v)}" for k, v in function_args.items()])
-
-                function_call = f"{function_name}(master_conn, {args_str})"
-
-                commands.append((function_name, function_args))
-
-                #print(f"Queued command: {function_call}")
-
-            # AUTOMATICALLY ADD DYNAMIC WAYPOINT GENERATION for any movement command
-            movement_functions = ["takeoff", "move_local_ned", "move_global_int", "condition_yaw", "change_speed"]
-            has_movement = any(cmd[0] in movement_functions for cmd in commands)
-            
-            if has_movement:
-                print("Movement command detected - automatically adding dynamic waypoint generation")
-                commands.append(("generate_dynamic_waypoints_from_command", {"command": user_input}))
+        needs_vehicle = not is_cross_coverage and (
+            plan is None or any(name not in HELPER_FUNCTIONS for name, _ in plan))
 
-            function_list = []
-            
-            waypoint_data = None
-            for i, (function_name, function_args) in enumerate(commands):
-                ack_value = execute_command(function_name, function_args, master)
-                function_list.append([function_name, ack_value])
-                
-                # If this is a waypoint generation function, store the result
-                if function_name in ["generate_waypoint_json", "generate_dynamic_waypoints_from_command"] and ack_value is not None:
-                    waypoint_data = ack_value
-                
-                if ack_value is False or ack_value == "timeout":
-                    return False, function_list, waypoint_data
-                #print(function_list)
-            return True, function_list, waypoint_data
-        else:
-            
-            return False, [], None
-            
-    except Exception as e:
-        #print(f"Error: {str(e)}")
-        return False, [], None
+        with ExitStack() as stack:
+            # Only warming up the pooled link overlaps the LLM call. The lease is
+            # exclusive, so it is taken right before the first vehicle step runs
+            # and concurrent commands never wait out each other's LLM latency
+            connected = False
+            if needs_vehicle:
+                from .connection_pool import connection_pool
+                connect_started = time.monotonic()
+                try:
+                    connection_pool.connection()
+                    connected = True
+                except Exception as e:
+                    print(f"Warning: Could not connect to drone: {e}")
+                    print("Continuing without drone connection for testing...")
+                timings['connect_s'] = round(time.monotonic() - connect_started, 3)
 
+            def lease_vehicle():
+                if not connected:
+                    return None
+                lease_started = time.monotonic()
+                try:
+                    return stack.enter_context(connection_pool.lease())
+                except Exception as e:
+                    print(f"Warning: Could not connect to drone: {e}")
+                    print("Continuing without drone connection for testing...")
+                    return None
+                finally:
+                    timings['lease_wait_s'] = round(time.monotonic() - lease_started, 3)
 
+            if pending is not None:
+                plan = plan_from_response(pending, usage)
+                timings['llm_s'] = round(time.monotonic() - llm_started, 3)
+                if plan is None:
+                    return False, [], None
+                llm_plan = copy.deepcopy(plan)
+            if plan is not None:
+                print(f"Plan from {report['plan_source']} (parser confidence {parsed.confidence:.2f})")
+                if not plan:
+                    return False, [], None
 
+            timing['plan_ready'] = time.monotonic()
+            if calls is None:
+                result = _run_plan(plan, user_input, waypoints_data, lease_vehicle, report, timing)
+                timings['execute_s'] = round(time.monotonic() - timing['plan_ready'], 3)
+                # Only plans that ran successfully are worth repeating
+                if pending is not None and result[0]:
+                    plan_cache.put(user_input, llm_plan)
+                return result
 
+            streamed = []
+
+            def _recorded():
+                for call in calls:
+                    streamed.append(copy.deepcopy(call))
+                    yield call
+
+            result = _run_plan(_recorded(), user_input, waypoints_data, lease_vehicle, report, timing)
+            # Includes waiting for the rest of the plan to stream in
+            timings['execute_s'] = round(time.monotonic() - timing['plan_ready'], 3)
+            if 'first_token' in timing:
+                timings['first_token_s'] = round(timing['first_token'] - llm_started, 3)
+            if result[0] and streamed:
+                plan_cache.put(user_input, streamed)
+            return result
+            
+    except Exception as e:
+        #print(f"Error: {str(e)}")
+        return False, [], None
+    finally:
+        timings['total_s'] = round(time.monotonic() - requested, 3)
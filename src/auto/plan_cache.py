@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+DEFAULT_CACHE_PATH = 'plan_cache.json'
+
+
+def normalize_command(command):
+    """Reduce a command to (template key, numbers), e.g. "Take off to 10 m!" -> ("take off to <n> m", [10.0])"""
+    text = command.strip().lower()
+    text = re.sub(r'(\d)([a-z])', r'\1 \2', text)  # "10m" -> "10 m"
+    text = re.sub(r'[^\w\s.\-\[\]]', ' ', text)
+    text = re.sub(r'(?<!\d)\.|\.(?!\d)', ' ', text)  # Keep only decimal points
+    numbers = [float(n) for n in NUMBER.findall(text)]
+    key = ' '.join(NUMBER.sub('<n>', text).split())
+    return key, numbers
+
+
+# Arguments that carry a quantity from the command and may become number slots.
+# Enum and flag fields (speed_type, throttle_pct, direction, ...) never do, even
+# when their value happens to equal a number in the command
+VALUE_ARGUMENTS = {
+    'takeoff': {'altitude'},
+    'move_local_ned': {'x_m', 'y_m', 'z_m_down', 'yaw_rad', 'yaw_rate_rad_s'},
+    'move_global_int': {'lat_deg_e7', 'lon_deg_e7', 'alt_m', 'yaw_rad', 'yaw_rate_rad_s'},
+    'condition_yaw': {'angle_deg', 'speed_deg_s'},
+    'change_speed': {'speed_m_s'},
+    'generate_cross_coverage_path': {'altitude', 'line_spacing_in_meter', 'smooth_path_edge_intensity'},
+}
+
+
+class AmbiguousPlan(ValueError):
+    """An argument value matches more than one number of the command, so the plan cannot be templated"""
+
+
+def _command_refs(value, command):
+    """Replace strings equal to the command text by a reference to it"""
+    if isinstance(value, dict):
+        return {k: _command_refs(v, command) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_command_refs(v, command) for v in value]
+    if isinstance(value, str) and value == command:
+        return {'$command': True}
+    return value
+
+
+def _template(function_name, args, command, numbers, used):
+    """Replace the arguments of one tool call that came from the command by slot references.
+
+    A value argument of the tool (VALUE_ARGUMENTS) becomes a slot when it
+    equals exactly one of the command's numbers, or its negative; the
+    indices of the slots taken are added to used. Raises AmbiguousPlan when
+    it equals several.
+    """
+    value_arguments = VALUE_ARGUMENTS.get(function_name, ())
+    templated = {}
+    for name, value in args.items():
+        if name in value_arguments and isinstance(value, (int, float)) and not isinstance(value, bool):
+            matches = [(i, 1) for i, number in enumerate(numbers) if value == number]
+            matches += [(i, -1) for i, number in enumerate(numbers) if number and value == -number]
+            if len(matches) > 1:
+                raise AmbiguousPlan(f"{function_name}.{name}={value} matches several numbers of {command!r}")
+            if matches:
+                slot, scale = matches[0]
+                used.add(slot)
+                value = {'$slot': slot, 'scale': scale, 'int': isinstance(value, int)}
+        else:
+            value = _command_refs(value, command)
+        templated[name] = value
+    return templated
+
+
+def _fill(value, command, numbers):
+    if isinstance(value, dict):
+        if '$slot' in value:
+            filled = numbers[value['$slot']] * value['scale']
+            return int(filled) if value['int'] and filled == int(filled) else filled
+        if '$command' in value:
+            return command
+        return {k: _fill(v, command, numbers) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, command, numbers) for v in value]
+    return value
+
+
+class PlanCache:
+    """Caches the tool-call plan the LLM produced for a command.
+
+    Commands are keyed by their normalized text with numbers replaced by
+    slots, so "take off to 15m" reuses the plan of "Take off to 10 m" with
+    15 substituted. A plan is only reused for different numbers if every
+    number in the command ended up in a value argument (VALUE_ARGUMENTS);
+    otherwise a number influenced the plan in some other way and only an
+    exact repeat hits. Plans where a value matches more than one number are
+    not cached at all.
+    Entries are evicted least-recently-used beyond max_entries and expire
+    after ttl seconds. The cache is persisted to path as JSON.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=256, ttl=24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> {'plan', 'numbers', 'templated', 'created', 'hits'}
+        self.stats = {'hits': 0, 'template_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'stores': 0, 'ambiguous': 0}
+        self.loaded = False
+
+    def _load(self):
+        self.loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable plan cache {self.path}: {e}")
+            return
+        now = time.time()
+        for key, entry in stored.get('entries', []):
+            if now - entry['created'] < self.ttl:
+                self.entries[key] = entry
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'entries': list(self.entries.items())}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save plan cache: {e}")
+
+    def get(self, command):
+        """Return the cached plan for command as a list of (function_name, args), or None"""
+        key, numbers = normalize_command(command)
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            if time.time() - entry['created'] >= self.ttl:
+                del self.entries[key]
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            exact = entry['numbers'] == numbers
+            if not exact and not entry['templated']:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            entry['hits'] += 1
+            self.stats['hits'] += 1
+            if not exact:
+                self.stats['template_hits'] += 1
+            return [(name, _fill(args, command, numbers)) for name, args in entry['plan']]
+
+    def put(self, command, plan):
+        """Store the plan (list of (function_name, args)) produced for command; returns False if it was refused"""
+        key, numbers = normalize_command(command)
+        used = set()
+        try:
+            template = [[name, _template(name, args, command, numbers, used)] for name, args in plan]
+        except AmbiguousPlan as e:
+            print(f"Not caching plan: {e}")
+            with self.lock:
+                self.stats['ambiguous'] += 1
+            return False
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            self.entries[key] = {
+                'plan': template,
+                'numbers': numbers,
+                'templated': len(used) == len(numbers),
+                'created': time.time(),
+                'hits': 0,
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+            self.stats['stores'] += 1
+            self._save()
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self._save()
+
+    def status(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'entries': len(self.entries),
+                'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0,
+                **self.stats,
+            }
+
+
+plan_cache = PlanCache()
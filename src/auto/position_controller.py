@@ -0,0 +1,251 @@
+import asyncio
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from contextlib import ExitStack
+from pymavlink import mavutil
+
+from src.auto.command_layer import command_layer
+from src.state_waits import default_manager, feeding_telemetry, feeds_telemetry
+
+mavlink = mavutil.mavlink
+
+# Velocity setpoint: position, acceleration, yaw and yaw rate ignored
+VELOCITY_TYPE_MASK = 0b110111000111
+
+_move_ids = itertools.count(1)
+_moves_lock = threading.Lock()
+# Move id -> PositionController, running and recently finished
+moves = {}
+MAX_FINISHED_MOVES = 50
+
+
+def move_timeout(x_m, y_m, z_m_down, max_speed=2.0):
+    """Default time budget of a move: twice the straight-line time at max_speed, plus slack for the approach"""
+    return 2 * math.sqrt(x_m ** 2 + y_m ** 2 + z_m_down ** 2) / max_speed + 10
+
+
+class PositionController:
+    """Closed-loop move by a local NED offset, streamed as velocity setpoints.
+
+    Every tick (rate_hz, on the telemetry manager's realtime lane, so no
+    thread per move) reads LOCAL_POSITION_NED from the shared telemetry and
+    commands a velocity towards the target: max_speed far away, slowing
+    proportionally (gain) inside the last meters. The move completes when the
+    position error drops below tolerance_m and fails after timeout seconds
+    or when no local position arrives. Cancelling stops the vehicle in place.
+
+    result() blocks for the outcome (True when the target was reached) and
+    the controller can be awaited from asyncio.
+    """
+
+    def __init__(self, master_conn, x_m, y_m, z_m_down, yaw_rad=0, manager=None,
+                 rate_hz=10, tolerance_m=0.5, max_speed=2.0, gain=0.8, timeout=None, position_timeout=3.0):
+        self.id = f"move-{next(_move_ids)}"
+        self.master = master_conn
+        self.layer = command_layer(master_conn)
+        self.manager = manager or default_manager()
+        self.offset = (x_m, y_m, z_m_down)
+        self.yaw_rad = yaw_rad
+        self.interval = 1.0 / rate_hz
+        self.tolerance_m = tolerance_m
+        self.max_speed = max_speed
+        self.gain = gain
+        self.distance = math.sqrt(x_m ** 2 + y_m ** 2 + z_m_down ** 2)
+        self.timeout = timeout if timeout is not None else move_timeout(x_m, y_m, z_m_down, max_speed)
+        self.position_timeout = position_timeout
+        self.future = Future()
+        self.target = None
+        self.remaining = self.distance
+        self.setpoints_sent = 0
+        self.started_at = None
+        self.finished_at = None
+        # Manager clock time at start; only local positions received after it are trusted
+        self.fresh_after = None
+        self.stop_event = None
+        # Keeps the link feeding the shared telemetry while the move runs
+        self.feed = ExitStack()
+
+    @property
+    def progress(self):
+        """Fraction of the distance covered, 0.0 to 1.0"""
+        if self.status_name() == 'reached':
+            return 1.0
+        if not self.distance:
+            return 0.0
+        return max(0.0, min(1.0, 1.0 - self.remaining / self.distance))
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.fresh_after = self.manager.now()
+        self.future.add_done_callback(self._finished)
+        self._request_local_position(1.0 / self.interval)
+        self.feed.enter_context(feeding_telemetry(self.layer, self.manager))
+        self.manager.scheduler.start()
+        self.stop_event = self.manager.scheduler.schedule_periodic('realtime', self._tick, self.interval)
+        return self
+
+    def _request_local_position(self, rate_hz):
+        if self.manager.master is not None:
+            self.manager.request_stream_rate(self.id, 'LOCAL_POSITION_NED', rate_hz)
+        else:
+            interval_us = 1e6 / rate_hz if rate_hz else -1
+            self.layer.send(mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+                            mavlink.MAVLINK_MSG_ID_LOCAL_POSITION_NED, interval_us)
+
+    def _position(self):
+        """Latest local position, or None until one newer than the start of the move arrives.
+
+        The stream is off between moves, so the cached position may be from
+        before a takeoff or global move and must not anchor the target.
+        """
+        vehicle = self.manager.primary
+        with vehicle.lock:
+            updated = vehicle.field_updated.get('local_x')
+            if updated is None or (self.fresh_after is not None and updated <= self.fresh_after):
+                return None
+            data = vehicle.telemetry_data
+            return data['local_x'], data['local_y'], data['local_z']
+
+    def _send_velocity(self, vx, vy, vz):
+        self.layer.send_message(mavlink.MAVLink_set_position_target_local_ned_message(
+            0,
+            self.master.target_system,
+            self.master.target_component,
+            mavlink.MAV_FRAME_LOCAL_NED,
+            VELOCITY_TYPE_MASK,
+            0, 0, 0,  # Position (ignored)
+            vx, vy, vz,  # Velocity
+            0, 0, 0,  # Acceleration (ignored)
+            self.yaw_rad, 0
+        ))
+        self.setpoints_sent += 1
+
+    def _tick(self):
+        if self.future.done():
+            return
+        try:
+            if feeds_telemetry(self.layer, self.manager):
+                # Nothing else reads the link; feed the shared telemetry from it
+                self.layer.drain()
+            elapsed = time.monotonic() - self.started_at
+            position = self._position()
+            if position is None:
+                if elapsed > self.position_timeout:
+                    self._fail(TimeoutError("No LOCAL_POSITION_NED telemetry to close the loop on"))
+                return
+            if self.target is None:
+                self.target = tuple(p + d for p, d in zip(position, self.offset))
+            error = [t - p for t, p in zip(self.target, position)]
+            self.remaining = math.sqrt(sum(e * e for e in error))
+            if self.remaining <= self.tolerance_m:
+                self._send_velocity(0, 0, 0)
+                self._resolve(True)
+                return
+            if elapsed > self.timeout:
+                self._send_velocity(0, 0, 0)
+                self._fail(TimeoutError(f"Move not within {self.tolerance_m}m after {self.timeout:.0f}s"))
+                return
+            speed = min(self.max_speed, self.gain * self.remaining)
+            self._send_velocity(*(e / self.remaining * speed for e in error))
+        except Exception as e:
+            self._fail(e)
+
+    def _resolve(self, value):
+        try:
+            self.future.set_result(value)
+        except InvalidStateError:
+            pass
+
+    def _fail(self, error):
+        print(f"Move {self.id} failed: {error}")
+        try:
+            self.future.set_exception(error)
+        except InvalidStateError:
+            pass
+
+    def _finished(self, future):
+        self.finished_at = time.monotonic()
+        if self.stop_event is not None:
+            self.stop_event.set()
+        self.feed.close()
+        try:
+            self._request_local_position(0)
+        except Exception as e:
+            print(f"Could not stop LOCAL_POSITION_NED for move {self.id}: {e}")
+
+    def cancel(self):
+        """Stop the move and hold position"""
+        if not self.future.cancel():
+            return False
+        try:
+            self._send_velocity(0, 0, 0)
+        except Exception as e:
+            print(f"Could not stop move {self.id}: {e}")
+        return True
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
+
+    def status_name(self):
+        if not self.future.done():
+            return 'running'
+        if self.future.cancelled():
+            return 'cancelled'
+        if self.future.exception() is not None:
+            return 'failed'
+        return 'reached'
+
+    def status(self):
+        state = self.status_name()
+        return {
+            'id': self.id,
+            'state': state,
+            'offset': self.offset,
+            'progress': round(self.progress, 3),
+            'remaining_m': round(self.remaining, 2),
+            'setpoints_sent': self.setpoints_sent,
+            'elapsed_s': round((self.finished_at or time.monotonic()) - self.started_at, 2) if self.started_at else 0,
+            'error': str(self.future.exception()) if state == 'failed' else None,
+        }
+
+
+def start_local_move(master_conn, x_m, y_m, z_m_down, yaw_rad=0, **kwargs):
+    """Start a closed-loop move and return its PositionController without waiting.
+
+    A move already running on the same connection is cancelled first.
+    """
+    with _moves_lock:
+        previous = [move for move in moves.values() if move.master is master_conn and not move.done()]
+    for move in previous:
+        move.cancel()
+    controller = PositionController(master_conn, x_m, y_m, z_m_down, yaw_rad, **kwargs)
+    with _moves_lock:
+        finished = [move_id for move_id, move in moves.items() if move.done()]
+        for move_id in finished[:max(0, len(finished) - MAX_FINISHED_MOVES)]:
+            del moves[move_id]
+        moves[controller.id] = controller
+    return controller.start()
+
+
+def get_move(move_id):
+    with _moves_lock:
+        return moves.get(move_id)
+
+
+def list_moves():
+    with _moves_lock:
+        return [move.status() for move in moves.values()]
+
+
+def cancel_move(move_id):
+    move = get_move(move_id)
+    return move.cancel() if move is not None else False
@@ -0,0 +1,63 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Runs identical requests once and hands every caller the same result.
+
+    The first caller for a key executes; callers with the same key that
+    arrive while it is running, or within window seconds of its start,
+    wait for and share its result (or exception) instead of executing
+    again.
+
+    Flights live in this process only: the web API and the TUI run in
+    separate processes and never coalesce with each other.
+    """
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.lock = threading.Lock()
+        self.flights = {}  # key -> (Future, started)
+        self.stats = {'requests': 0, 'executions': 0, 'coalesced_in_flight': 0, 'coalesced_recent': 0}
+
+    def _prune(self, now):
+        expired = [key for key, (future, started) in self.flights.items()
+                   if future.done() and now - started >= self.window]
+        for key in expired:
+            del self.flights[key]
+
+    def run(self, key, fn, *args, **kwargs):
+        """Return (result of fn(*args, **kwargs), shared) where shared is True if another caller's run was reused"""
+        now = time.monotonic()
+        with self.lock:
+            self.stats['requests'] += 1
+            self._prune(now)
+            flight = self.flights.get(key)
+            if flight is None:
+                future = Future()
+                self.flights[key] = (future, now)
+                self.stats['executions'] += 1
+            else:
+                future = flight[0]
+                self.stats['coalesced_recent' if future.done() else 'coalesced_in_flight'] += 1
+        if flight is not None:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result, False
+
+    def status(self):
+        with self.lock:
+            coalesced = self.stats['coalesced_in_flight'] + self.stats['coalesced_recent']
+            return {
+                'window_s': self.window,
+                'in_flight': sum(1 for future, _ in self.flights.values() if not future.done()),
+                'coalesced': coalesced,
+                'coalesced_rate': round(coalesced / self.stats['requests'], 3) if self.stats['requests'] else 0.0,
+                **self.stats,
+            }
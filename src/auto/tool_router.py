@@ -0,0 +1,84 @@
+import json
+import re
+import threading
+
+# Tool groups and the words that route a command to them
+TOOL_GROUPS = {
+    'mode': {
+        'tools': ['set_mode', 'arm_disarm'],
+        'keywords': r'\b(?:arm|disarm|mode|guided|loiter|land|rtl|return|home|auto|stabili[sz]e|hold|brake)\b',
+    },
+    'movement': {
+        'tools': ['takeoff', 'move_local_ned', 'move_global_int', 'condition_yaw', 'change_speed',
+                  'generate_dynamic_waypoints_from_command'],
+        'keywords': r'\b(?:take\s*off|launch|move|go|fly|goto|yaw|rotate|turn|heading|speed|climb|descend|'
+                    r'up|down|left|right|forward|ahead|back(?:ward)?|north|south|east|west|altitude|lat|lon|position)\b',
+    },
+    'mission': {
+        'tools': ['generate_cross_coverage_path', 'generate_waypoint_json'],
+        'keywords': r'\b(?:cross\s*cover(?:age)?|cpp|coverage|survey|scan|waypoints?|mission|path|area|polygon)\b',
+    },
+}
+# Groups whose tools a command in the key group usually needs as well (takeoff needs GUIDED and arming)
+GROUP_DEPENDENCIES = {'movement': ['mode']}
+
+
+def estimate_tokens(text):
+    """Rough prompt token count (about 4 characters per token for English and JSON)"""
+    return (len(text) + 3) // 4
+
+
+class ToolRouter:
+    """Picks the subset of tool schemas a command needs.
+
+    Commands are matched against each group's keywords; a command that
+    matches no group gets every tool. The tools payload for each distinct
+    subset is built once and reused together with its serialized size, so
+    requests no longer rebuild the full schema list.
+    """
+
+    def __init__(self, functions, groups=TOOL_GROUPS, dependencies=GROUP_DEPENDENCIES):
+        self.functions = {func['name']: func for func in functions}
+        self.groups = {name: (group['tools'], re.compile(group['keywords'], re.IGNORECASE))
+                       for name, group in groups.items()}
+        self.dependencies = dependencies
+        self.lock = threading.Lock()
+        self.payloads = {}  # tuple of group names -> (tools list, token estimate)
+        self.stats = {'requests': 0, 'fallbacks': 0, 'tokens_saved': 0}
+
+    def select(self, command):
+        """Names of the tool groups command needs, or () for all tools"""
+        selected = {name for name, (_, pattern) in self.groups.items() if pattern.search(command)}
+        for name in list(selected):
+            selected.update(self.dependencies.get(name, []))
+        return tuple(sorted(selected))
+
+    def _payload(self, groups):
+        with self.lock:
+            payload = self.payloads.get(groups)
+            if payload is None:
+                names = [name for group in groups for name in self.groups[group][0]] if groups else list(self.functions)
+                tools = [{"type": "function", "function": self.functions[name]} for name in names]
+                payload = self.payloads[groups] = (tools, estimate_tokens(json.dumps(tools)))
+            return payload
+
+    def route(self, command):
+        """Return (group names, tools payload, estimated tokens of the payload) for command"""
+        groups = self.select(command)
+        tools, tokens = self._payload(groups)
+        with self.lock:
+            self.stats['requests'] += 1
+            if not groups:
+                self.stats['fallbacks'] += 1
+        if groups:
+            _, all_tokens = self._payload(())
+            with self.lock:
+                self.stats['tokens_saved'] += all_tokens - tokens
+        return groups, tools, tokens
+
+    def status(self):
+        with self.lock:
+            return {
+                **self.stats,
+                'payloads': {'+'.join(groups) or 'all': tokens for groups, (_, tokens) in self.payloads.items()},
+            }
@@ -0,0 +1,304 @@
+"""Binary flight recorder and deterministic replay for the telemetry pipeline.
+
+Record:  python -m src.flight_recorder record flight.rsfr
+Replay:  python -m src.flight_recorder replay flight.rsfr --speed 4
+"""
+import argparse
+import os
+import struct
+import threading
+import time
+from pymavlink import mavutil
+
+MAGIC = b"RSFR"
+VERSION = 1
+CHUNK_MAGIC = b"CHNK"
+
+# magic, version, reserved
+FILE_HEADER = struct.Struct('<4sHH')
+# magic, record count, first timestamp, last timestamp, payload bytes
+CHUNK_HEADER = struct.Struct('<4sIddI')
+# receive timestamp, raw message length
+RECORD_HEADER = struct.Struct('<dH')
+# chunk offset, first timestamp, last timestamp, record count
+INDEX_ENTRY = struct.Struct('<QddI')
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class FlightRecorder:
+    """Append raw MAVLink messages with their receive time to a chunked log.
+
+    Records are buffered in memory and written as one chunk every
+    chunk_records messages or flush_interval seconds. Each chunk is also
+    appended to a sidecar index so readers can seek by time.
+    """
+
+    def __init__(self, path, chunk_records=512, flush_interval=1.0):
+        self.path = path
+        self.chunk_records = chunk_records
+        self.flush_interval = flush_interval
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab')
+        self.index_file = open(index_path(path), 'ab')
+        if new_file:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, 0))
+            self.file.flush()
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.last_flush = time.monotonic()
+        self.records_written = 0
+        # record() runs on the reader thread while periodic flushes may come from elsewhere
+        self.lock = threading.RLock()
+
+    def record(self, msg, timestamp=None):
+        """Buffer one received MAVLink message"""
+        raw = msg.get_msgbuf()
+        if not raw:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            self.pending.append(RECORD_HEADER.pack(timestamp, len(raw)))
+            self.pending.append(bytes(raw))
+            self.pending_bytes += RECORD_HEADER.size + len(raw)
+            self.last_timestamp = timestamp
+            if (len(self.pending) // 2 >= self.chunk_records
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        """Write buffered records out as one chunk"""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.pending:
+                return
+            count = len(self.pending) // 2
+            offset = self.file.tell()
+            self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, count, self.first_timestamp,
+                                              self.last_timestamp, self.pending_bytes))
+            self.file.write(b"".join(self.pending))
+            self.file.flush()
+            self.index_file.write(INDEX_ENTRY.pack(offset, self.first_timestamp, self.last_timestamp, count))
+            self.index_file.flush()
+            self.records_written += count
+            self.pending = []
+            self.pending_bytes = 0
+            self.first_timestamp = None
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self.index_file.close()
+
+
+class FlightLogReader:
+    """Read records back from a flight log, seeking by time through the chunk index"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, _ = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a flight log")
+        self.chunks = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(index_path(self.path), 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            return [INDEX_ENTRY.unpack_from(data, pos) for pos in range(0, usable, INDEX_ENTRY.size)]
+        except OSError:
+            return self.rebuild_index()
+
+    def rebuild_index(self):
+        """Scan chunk headers (skipping payloads) when the sidecar index is missing"""
+        chunks = []
+        with open(self.path, 'rb') as f:
+            offset = FILE_HEADER.size
+            f.seek(offset)
+            while True:
+                header = f.read(CHUNK_HEADER.size)
+                if len(header) < CHUNK_HEADER.size:
+                    break
+                magic, count, first, last, size = CHUNK_HEADER.unpack(header)
+                if magic != CHUNK_MAGIC:
+                    break
+                chunks.append((offset, first, last, count))
+                offset += CHUNK_HEADER.size + size
+                f.seek(offset)
+        return chunks
+
+    @property
+    def start_time(self):
+        return self.chunks[0][1] if self.chunks else None
+
+    @property
+    def end_time(self):
+        return self.chunks[-1][2] if self.chunks else None
+
+    def records(self, start=None, end=None):
+        """Yield (timestamp, raw message bytes) in recorded order"""
+        with open(self.path, 'rb') as f:
+            for offset, first, last, count in self.chunks:
+                if start is not None and last < start:
+                    continue
+                if end is not None and first > end:
+                    break
+                f.seek(offset)
+                magic, count, _, _, size = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+                payload = f.read(size)
+                if magic != CHUNK_MAGIC or len(payload) < size:
+                    break  # Truncated tail from an interrupted recording
+                pos = 0
+                for _ in range(count):
+                    timestamp, length = RECORD_HEADER.unpack_from(payload, pos)
+                    pos += RECORD_HEADER.size
+                    raw = payload[pos:pos + length]
+                    pos += length
+                    if start is not None and timestamp < start:
+                        continue
+                    if end is not None and timestamp > end:
+                        return
+                    yield timestamp, raw
+
+
+class _NullWriter:
+    def write(self, data):
+        pass
+
+
+class ReplaySource:
+    """A recorded flight that quacks like a mavutil connection.
+
+    speed=1.0 replays in real time, speed=N at N times real time, and
+    speed=0 (or None) as fast as the consumer reads. Commands sent to it are
+    discarded. Pass it to ContinuousTelemetryManager.use_replay().
+    """
+
+    def __init__(self, path, speed=1.0, start=None, end=None):
+        self.path = path
+        self.speed = speed
+        self.start = start
+        self.end = end
+        self.reader = FlightLogReader(path)
+        self.parser = mavutil.mavlink.MAVLink(None)
+        self.parser.robust_parsing = True
+        self.mav = mavutil.mavlink.MAVLink(_NullWriter(), srcSystem=255)
+        self.target_system = 1
+        self.target_component = 1
+        self.finished = False
+        self.messages_replayed = 0
+        self._records = self.reader.records(start, end)
+        self._pending = []
+        self._log_start = None
+        self._wall_start = None
+
+    def _next_message(self):
+        while not self._pending:
+            try:
+                timestamp, raw = next(self._records)
+            except StopIteration:
+                self.finished = True
+                return None
+            msgs = self.parser.parse_buffer(raw) or []
+            for msg in msgs:
+                msg._timestamp = timestamp
+            self._pending.extend(msgs)
+        return self._pending[0]
+
+    def recv_match(self, type=None, blocking=False, timeout=None, condition=None):
+        """Return the next recorded message, pacing it to the replay speed"""
+        if isinstance(type, str):
+            type = [type]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            msg = self._next_message()
+            if msg is None:
+                return None
+            if self.speed:
+                if self._log_start is None:
+                    self._log_start = msg._timestamp
+                    self._wall_start = time.monotonic()
+                due = self._wall_start + (msg._timestamp - self._log_start) / self.speed
+                wait = due - time.monotonic()
+                if wait > 0:
+                    if not blocking:
+                        return None
+                    if deadline is not None and due > deadline:
+                        time.sleep(max(0, deadline - time.monotonic()))
+                        return None
+                    time.sleep(wait)
+            self._pending.pop(0)
+            self.messages_replayed += 1
+            if msg.get_type() == 'HEARTBEAT' and msg.type != mavutil.mavlink.MAV_TYPE_GCS:
+                self.target_system = msg.get_srcSystem()
+                self.target_component = msg.get_srcComponent()
+            if type is None or msg.get_type() in type:
+                return msg
+
+    def wait_heartbeat(self, blocking=True, timeout=None):
+        return self.recv_match(type='HEARTBEAT', blocking=blocking, timeout=timeout)
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def replay_telemetry(path, speed=1.0, manager=None):
+    """Drive a telemetry manager from a recorded flight and return it once the log is exhausted"""
+    from src.telemetary import ContinuousTelemetryManager
+
+    source = ReplaySource(path, speed)
+    if manager is None:
+        manager = ContinuousTelemetryManager()
+    manager.use_replay(source)
+    manager.start()
+    try:
+        while not source.finished:
+            time.sleep(0.1)
+    finally:
+        manager.stop()
+    return manager
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Record or replay MAVLink telemetry')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    record_parser = subparsers.add_parser('record', help='Record the live link to a flight log')
+    record_parser.add_argument('path')
+    record_parser.add_argument('--connection', default='udp:127.0.0.1:14550', help='MAVLink connection string')
+    replay_parser = subparsers.add_parser('replay', help='Replay a flight log through the telemetry manager')
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='Replay speed multiplier (0 = as fast as possible)')
+    args = parser.parse_args()
+
+    if args.action == 'record':
+        from src.telemetary import ContinuousTelemetryManager
+        recorder = FlightRecorder(args.path)
+        manager = ContinuousTelemetryManager(args.connection, recorder=recorder)
+        manager.start()
+        print(f"Recording {args.connection} to {args.path} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            manager.stop()
+            recorder.close()
+        print(f"Recorded {recorder.records_written} messages")
+    else:
+        started = time.monotonic()
+        manager = replay_telemetry(args.path, args.speed)
+        print(f"Replayed in {time.monotonic() - started:.2f}s")
+        print(f"Final telemetry: {manager.get_telemetry_data()}")
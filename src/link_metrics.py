@@ -0,0 +1,163 @@
+import bisect
+import threading
+import time
+
+# Default bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+INTERVAL_BUCKETS_MS = [5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative counts per upper bound, Prometheus style)"""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None if empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets['+Inf'] = self.count
+        return {
+            'buckets': buckets,
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+
+class MessageTypeStats:
+    """Arrival statistics for one message type"""
+
+    def __init__(self):
+        self.count = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.interval_ms = Histogram(INTERVAL_BUCKETS_MS)
+        self.mean_interval = None
+        # RFC 3550 style smoothed deviation of inter-arrival time from its mean
+        self.jitter = 0.0
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+
+    def observe(self, now):
+        if self.last_seen is not None:
+            interval = (now - self.last_seen) * 1000.0
+            self.interval_ms.observe(interval)
+            if self.mean_interval is None:
+                self.mean_interval = interval
+            else:
+                self.mean_interval += (interval - self.mean_interval) / 16.0
+                self.jitter += (abs(interval - self.mean_interval) - self.jitter) / 16.0
+        else:
+            self.first_seen = now
+        self.last_seen = now
+        self.count += 1
+
+    def snapshot(self, now):
+        elapsed = (self.last_seen - self.first_seen) if self.count > 1 else 0
+        return {
+            'count': self.count,
+            'rate_hz': round((self.count - 1) / elapsed, 2) if elapsed > 0 else 0.0,
+            'age_s': round(now - self.last_seen, 3) if self.last_seen is not None else None,
+            'jitter_ms': round(self.jitter, 2),
+            'interval_ms': self.interval_ms.snapshot(),
+            'latency_ms': self.latency_ms.snapshot() if self.latency_ms.count else None,
+        }
+
+
+class LinkMetrics:
+    """Link-quality and telemetry-latency instrumentation for one MAVLink link.
+
+    Tracks per message type: receive rate, inter-arrival time and jitter, and
+    age since the last message. Per source (system, component) it counts
+    sequence-number gaps as lost packets. For messages stamped with
+    time_boot_ms it estimates transport latency relative to the fastest
+    delivery seen from that system (the vehicle's clock offset is unknown, so
+    the best observed sample is taken as zero latency).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.types = {}
+        self.sources = {}  # (system, component) -> [last seq, received, lost]
+        self.boot_offsets = {}  # system -> [min(receive - boot time), last time_boot_ms]
+        self.started = None  # Time of the first message
+
+    def observe(self, msg, now=None):
+        """Record one received message (call for every message on the link)"""
+        if now is None:
+            now = time.time()
+        msg_type = msg.get_type()
+        with self.lock:
+            if self.started is None:
+                self.started = now
+            stats = self.types.get(msg_type)
+            if stats is None:
+                stats = self.types[msg_type] = MessageTypeStats()
+            stats.observe(now)
+
+            source = (msg.get_srcSystem(), msg.get_srcComponent())
+            seq = msg.get_seq()
+            tracked = self.sources.get(source)
+            if tracked is None:
+                self.sources[source] = [seq, 1, 0]
+            else:
+                gap = (seq - tracked[0] - 1) % 256
+                if gap < 128:  # Larger jumps are reorders or restarts, not loss
+                    tracked[2] += gap
+                tracked[0] = seq
+                tracked[1] += 1
+
+            time_boot_ms = getattr(msg, 'time_boot_ms', None)
+            if time_boot_ms is not None:
+                system = source[0]
+                offset = now - time_boot_ms / 1000.0
+                clock = self.boot_offsets.get(system)
+                if clock is None or time_boot_ms < clock[1]:
+                    # First sample or the vehicle rebooted - restart the estimate
+                    clock = self.boot_offsets[system] = [offset, time_boot_ms]
+                clock[0] = min(clock[0], offset)
+                clock[1] = time_boot_ms
+                stats.latency_ms.observe((offset - clock[0]) * 1000.0)
+
+    def snapshot(self, now=None):
+        """Counters as of now (wall clock by default; a replay passes the time of its latest message)"""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            return {
+                'uptime_s': round(now - self.started, 1) if self.started is not None else 0.0,
+                'messages': {msg_type: stats.snapshot(now) for msg_type, stats in sorted(self.types.items())},
+                'sources': {
+                    f"{system}/{component}": {
+                        'received': received,
+                        'lost': lost,
+                        'loss_pct': round(100.0 * lost / (received + lost), 2) if received + lost else 0.0,
+                    }
+                    for (system, component), (_, received, lost) in self.sources.items()
+                },
+            }
@@ -0,0 +1,146 @@
+"""asyncio view of the telemetry manager's MAVLink link: every message it reads
+is handed straight to coroutines on the event loop, with no polling.
+"""
+import asyncio
+import time
+from pymavlink import mavutil
+
+
+class AsyncMavlinkLink:
+    """MAVLink link living on the asyncio event loop.
+
+    It owns no socket: attach() it to the telemetry manager that reads the
+    vehicle's link (only one socket can receive on the port), and packets are
+    written out through that manager's connection.
+    """
+
+    def __init__(self, source_system=255):
+        # Outgoing messages are encoded by .mav and written through write()
+        self.mav = mavutil.mavlink.MAVLink(self, srcSystem=source_system)
+        self.target_system = 1
+        self.target_component = 1
+        self.vehicle_type = None
+        self.messages = {}  # Latest message of each type
+        self.last_message_time = None
+        self._subscribers = {}  # Message type (or None for all) -> set of queues
+        self._waiters = []  # (predicate, future) pairs
+        self._connected = None
+        self.source = None  # Telemetry manager whose link this one follows
+
+    async def attach(self, telemetry):
+        """Follow a telemetry manager's link.
+
+        Every message the manager reads is dispatched on the running loop, and
+        packets are written out through the manager's connection.
+        """
+        loop = asyncio.get_running_loop()
+        self._connected = loop.create_future()
+        self.source = telemetry
+        self._listener = lambda msg: loop.call_soon_threadsafe(self._dispatch, msg)
+        telemetry.add_message_listener(self._listener)
+        return self
+
+    def close(self):
+        if self.source is not None:
+            self.source.remove_message_listener(self._listener)
+            self.source = None
+
+    def write(self, data):
+        """Called by self.mav to put an encoded packet on the wire"""
+        if self.source is not None:
+            self.source.write(data)
+
+    def _dispatch(self, msg):
+        msg_type = msg.get_type()
+        self.last_message_time = time.monotonic()
+        self.messages[msg_type] = msg
+
+        if msg_type == 'HEARTBEAT' and msg.type != mavutil.mavlink.MAV_TYPE_GCS:
+            self.target_system = msg.get_srcSystem()
+            self.target_component = msg.get_srcComponent()
+            self.vehicle_type = msg.type
+            if self._connected is not None and not self._connected.done():
+                self._connected.set_result(msg)
+
+        for key in (msg_type, None):
+            for q in self._subscribers.get(key, ()):
+                if q.full():
+                    q.get_nowait()  # Slow consumer - drop its oldest message
+                q.put_nowait(msg)
+
+        if self._waiters:
+            remaining = []
+            for predicate, future in self._waiters:
+                if future.done():
+                    continue
+                try:
+                    matched = predicate(msg)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+                if matched:
+                    future.set_result(msg)
+                else:
+                    remaining.append((predicate, future))
+            self._waiters = remaining
+
+    async def wait_heartbeat(self, timeout=None):
+        """Wait until the vehicle has been heard from"""
+        return await asyncio.wait_for(asyncio.shield(self._connected), timeout)
+
+    async def wait_for(self, predicate=None, type=None, timeout=None):
+        """Await the next message that matches type and/or predicate(msg)"""
+        types = [type] if isinstance(type, str) else type
+
+        def matches(msg):
+            if types is not None and msg.get_type() not in types:
+                return False
+            return predicate is None or predicate(msg)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((matches, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            future.cancel()
+
+    async def subscribe(self, *types, maxsize=100):
+        """Async iterator over incoming messages of the given types (all if none).
+
+        A consumer that falls more than maxsize messages behind loses the oldest.
+        """
+        q = asyncio.Queue(maxsize=maxsize)
+        keys = types or (None,)
+        for key in keys:
+            self._subscribers.setdefault(key, set()).add(q)
+        try:
+            while True:
+                yield await q.get()
+        finally:
+            for key in keys:
+                self._subscribers.get(key, set()).discard(q)
+
+    async def command_long(self, command, *params, timeout=3.0):
+        """Send COMMAND_LONG and return the MAV_RESULT from its matching COMMAND_ACK"""
+        params = list(params) + [0] * (7 - len(params))
+        self.mav.command_long_send(self.target_system, self.target_component, command, 0, *params)
+        ack = await self.wait_for(lambda msg: msg.command == command, type='COMMAND_ACK', timeout=timeout)
+        return ack.result
+
+    async def set_mode(self, mode_name, timeout=3.0):
+        mapping = mavutil.mode_mapping_byname(self.vehicle_type) if self.vehicle_type is not None else None
+        if not mapping or mode_name.upper() not in mapping:
+            raise ValueError(f"Unknown mode {mode_name}")
+        return await self.command_long(
+            mavutil.mavlink.MAV_CMD_DO_SET_MODE,
+            mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
+            mapping[mode_name.upper()],
+            timeout=timeout
+        )
+
+    async def arm_disarm(self, arm_command, timeout=3.0):
+        return await self.command_long(
+            mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+            1 if arm_command else 0,
+            timeout=timeout
+        )
@@ -0,0 +1,232 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+
+class ScheduledTask:
+    """Handle for one submitted unit of work.
+
+    Cancelling a queued task removes it before it runs. Cancelling a running
+    task resolves its future as cancelled straight away and sets cancel_event,
+    which the work can poll to stop early; whatever it returns afterwards is
+    discarded.
+    """
+
+    def __init__(self, lane, fn, args, kwargs, deadline, ready_at):
+        self.lane = lane
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.ready_at = ready_at
+        self.future = Future()
+        self.cancel_event = threading.Event()
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def running(self):
+        return self.started_at is not None and self.finished_at is None
+
+    def cancel(self):
+        """Cancel the task; returns False if it had already finished"""
+        self.cancel_event.set()
+        return self.future.cancel()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class Lane:
+    """A named queue with its own worker threads, ordered earliest-deadline-first"""
+
+    def __init__(self, name, workers=1, max_queue=None):
+        self.name = name
+        self.workers = workers
+        # Submitting to a full lane raises queue.Full instead of growing without bound
+        self.max_queue = max_queue
+        self.condition = threading.Condition()
+        self.ready = []  # (deadline, seq, task) heap of runnable tasks
+        self.delayed = []  # (ready_at, seq, task) heap of tasks not yet due
+        self.seq = itertools.count()
+        self.running_tasks = set()
+        self.threads = []
+        self.stopped = False
+        self.metrics = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'rejected': 0,
+            'deadline_missed': 0,
+            'max_queue_depth': 0,
+            'total_wait_time': 0.0,
+            'total_run_time': 0.0,
+        }
+
+    def start(self):
+        self.stopped = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-lane-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=2):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.threads = []
+
+    def submit(self, task):
+        with self.condition:
+            if self.max_queue is not None and self.queue_depth() >= self.max_queue:
+                self.metrics['rejected'] += 1
+                raise queue.Full(f"{self.name} lane queue is full")
+            entry_deadline = task.deadline if task.deadline is not None else float('inf')
+            if task.ready_at is not None and task.ready_at > time.monotonic():
+                heapq.heappush(self.delayed, (task.ready_at, next(self.seq), task))
+            else:
+                heapq.heappush(self.ready, (entry_deadline, next(self.seq), task))
+            self.metrics['submitted'] += 1
+            self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], self.queue_depth())
+            self.condition.notify()
+
+    def queue_depth(self):
+        return len(self.ready) + len(self.delayed)
+
+    def _next_task(self):
+        """Block until a task is runnable; returns None when the lane stops"""
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+                while self.delayed and self.delayed[0][0] <= now:
+                    _, seq, task = heapq.heappop(self.delayed)
+                    deadline = task.deadline if task.deadline is not None else float('inf')
+                    heapq.heappush(self.ready, (deadline, seq, task))
+                if self.ready:
+                    _, _, task = heapq.heappop(self.ready)
+                    if task.future.done():  # Cancelled while queued
+                        self.metrics['cancelled'] += 1
+                        continue
+                    return task
+                wait = self.delayed[0][0] - now if self.delayed else None
+                self.condition.wait(wait)
+            return None
+
+    def _worker(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            task.started_at = time.monotonic()
+            # Queue time counts from when the task became runnable, not from a delayed submit
+            self.metrics['total_wait_time'] += task.started_at - max(task.enqueued_at, task.ready_at or 0)
+            if task.deadline is not None and task.started_at > task.deadline:
+                self.metrics['deadline_missed'] += 1
+            with self.condition:
+                self.running_tasks.add(task)
+            try:
+                result = task.fn(*task.args, **task.kwargs)
+                try:
+                    task.future.set_result(result)
+                    self.metrics['completed'] += 1
+                except InvalidStateError:
+                    self.metrics['cancelled'] += 1  # Cancelled while running
+            except Exception as e:
+                try:
+                    task.future.set_exception(e)
+                except InvalidStateError:
+                    pass
+                self.metrics['failed'] += 1
+            finally:
+                task.finished_at = time.monotonic()
+                self.metrics['total_run_time'] += task.finished_at - task.started_at
+                with self.condition:
+                    self.running_tasks.discard(task)
+
+    def snapshot(self):
+        with self.condition:
+            stats = dict(self.metrics)
+            stats['workers'] = self.workers
+            stats['queue_depth'] = self.queue_depth()
+            stats['running'] = len(self.running_tasks)
+        return stats
+
+
+class LaneScheduler:
+    """Independent scheduling lanes so slow work in one lane never starves another.
+
+    Lanes: 'realtime' for telemetry housekeeping, 'command' for user commands
+    (command_workers threads) and 'background' for everything else.
+    """
+
+    def __init__(self, command_workers=1, lanes=None, max_queue=None):
+        lanes = lanes or {'realtime': 1, 'command': command_workers, 'background': 1}
+        self.lanes = {name: Lane(name, workers, max_queue) for name, workers in lanes.items()}
+        self.started = False
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        for lane in self.lanes.values():
+            lane.start()
+
+    def stop(self):
+        self.started = False
+        for lane in self.lanes.values():
+            lane.stop()
+
+    def submit(self, lane, fn, *args, deadline=None, delay=None, **kwargs):
+        """Queue fn(*args, **kwargs) on a lane.
+
+        deadline is seconds from now (earliest deadline runs first); delay holds
+        the task back for that many seconds.
+        """
+        now = time.monotonic()
+        task = ScheduledTask(
+            lane, fn, args, kwargs,
+            deadline=now + deadline if deadline is not None else None,
+            ready_at=now + delay if delay else None
+        )
+        self.lanes[lane].submit(task)
+        return task
+
+    def schedule_periodic(self, lane, fn, interval):
+        """Run fn every interval seconds on a lane, each run due by the next tick.
+
+        Returns a threading.Event; set it to stop the schedule.
+        """
+        stop_event = threading.Event()
+        next_run = [time.monotonic()]
+
+        def run():
+            if stop_event.is_set() or not self.started:
+                return
+            try:
+                fn()
+            except Exception as e:
+                print(f"Periodic task error on {lane} lane: {e}")
+            finally:
+                # Stay on a fixed grid; skip ticks rather than bunching up after a stall
+                now = time.monotonic()
+                next_run[0] += interval
+                if next_run[0] < now:
+                    next_run[0] = now + interval
+                if not stop_event.is_set() and self.started:
+                    self.lanes[lane].submit(ScheduledTask(
+                        lane, run, (), {}, deadline=next_run[0] + interval, ready_at=next_run[0]
+                    ))
+
+        self.submit(lane, run, deadline=interval)
+        return stop_event
+
+    def metrics(self):
+        """Per-lane queue depth, throughput and wait/run time counters"""
+        return {name: lane.snapshot() for name, lane in self.lanes.items()}
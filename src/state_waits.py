@@ -0,0 +1,234 @@
+import asyncio
+import math
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import CancelledError, Future, InvalidStateError, TimeoutError as FutureTimeoutError
+
+from src.auto.command_layer import command_layer
+from src.auto.executor import check_cancelled, CommandCancelled
+
+
+class Condition:
+    """A named predicate over the telemetry dict, re-checked whenever one of its fields updates"""
+
+    def __init__(self, description, fields, predicate):
+        self.description = description
+        self.fields = tuple(fields)
+        self.predicate = predicate
+
+    def __call__(self, telemetry):
+        return self.predicate(telemetry)
+
+    def __repr__(self):
+        return f"Condition({self.description})"
+
+
+def armed(expected=True):
+    return Condition("armed" if expected else "disarmed", ('armed',),
+                     lambda t: t['armed'] == expected)
+
+
+def altitude_within(target_alt, tolerance=0.5):
+    return Condition(f"altitude {target_alt}m +/- {tolerance}m", ('alt',),
+                     lambda t: abs(t['alt'] - target_alt) <= tolerance)
+
+
+def mode_is(mode_name):
+    mode_name = mode_name.upper()
+    return Condition(f"mode == {mode_name}", ('mode',),
+                     lambda t: t['mode'] == mode_name)
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Ground distance in meters (equirectangular, fine over the short ranges flown here)"""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000.0 * math.hypot(x, y)
+
+
+def position_within(lat, lon, radius_m):
+    return Condition(f"within {radius_m}m of {lat:.6f},{lon:.6f}", ('lat', 'long'),
+                     lambda t: distance_m(t['lat'], t['long'], lat, lon) <= radius_m)
+
+
+def default_manager():
+    from src.telemetary import telemetry_manager
+    return telemetry_manager
+
+
+class StateWait:
+    """One pending wait for a condition on the primary vehicle's live telemetry.
+
+    The condition is evaluated on the telemetry reader thread as its fields
+    update, so waiting costs no thread and no socket. Block with result(),
+    or await the StateWait from asyncio. It resolves to a telemetry snapshot,
+    raises TimeoutError once the deadline passes and CancelledError after
+    cancel(). Fields never received yet do not satisfy a condition.
+    """
+
+    def __init__(self, manager, condition, timeout=None):
+        self.manager = manager
+        self.condition = condition
+        self.future = Future()
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.started_at = time.monotonic()
+        self.subscriptions = []
+        self.expiry = None
+        self.lock = threading.Lock()
+        self.future.add_done_callback(self._cleanup)
+        for field in condition.fields:
+            self.subscriptions.append(manager.subscribe_field(field, self._on_update))
+        # Check the current state only after subscribing so no update slips in between
+        self._check()
+
+    def _schedule_expiry(self):
+        """Have the realtime lane fire the deadline, for waiters that do not block in result()"""
+        with self.lock:
+            if self.expiry is not None or self.deadline is None or self.future.done():
+                return
+            remaining = max(0, self.deadline - time.monotonic())
+            self.manager.scheduler.start()
+            self.expiry = self.manager.scheduler.submit('realtime', self._expire, delay=remaining, deadline=remaining)
+
+    def _check(self):
+        if self.future.done():
+            return
+        vehicle = self.manager.primary
+        with vehicle.lock:
+            if any(vehicle.field_updated.get(field) is None for field in self.condition.fields):
+                return
+            telemetry = dict(vehicle.telemetry_data)
+        try:
+            satisfied = self.condition(telemetry)
+        except Exception as e:
+            print(f"Condition {self.condition.description} failed: {e}")
+            return
+        if satisfied:
+            try:
+                self.future.set_result(telemetry)
+            except InvalidStateError:
+                pass
+
+    def _on_update(self, field, value):
+        self._check()
+
+    def _expire(self):
+        try:
+            self.future.set_exception(TimeoutError(f"Timed out waiting for {self.condition.description}"))
+        except InvalidStateError:
+            pass
+
+    def _cleanup(self, future):
+        for subscription in self.subscriptions:
+            self.manager.dispatcher.unsubscribe(subscription)
+        self.subscriptions = []
+        with self.lock:
+            if self.expiry is not None:
+                self.expiry.cancel()
+
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        return self.future.cancel()
+
+    def result(self, timeout=None):
+        """Block until the condition holds; timeout bounds this call on top of the wait's deadline"""
+        limits = [t for t in (timeout, None if self.deadline is None else self.deadline - time.monotonic())
+                  if t is not None]
+        try:
+            return self.future.result(max(0, min(limits)) if limits else None)
+        except FutureTimeoutError:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self._expire()
+            raise TimeoutError(f"Timed out waiting for {self.condition.description}")
+
+    def __await__(self):
+        self._schedule_expiry()
+        return asyncio.wrap_future(self.future).__await__()
+
+
+def wait_for(condition, timeout=None, manager=None):
+    """Start waiting for condition on the live telemetry; returns a StateWait"""
+    return StateWait(manager or default_manager(), condition, timeout)
+
+
+def telemetry_live(manager=None):
+    """True if the shared telemetry state is being fed by a link"""
+    manager = manager or default_manager()
+    last = manager.last_message_time
+    return last is not None and time.monotonic() - last < manager.link_timeout
+
+
+_feed_lock = threading.Lock()
+_feeders = {}  # CommandLayer -> number of feeding_telemetry() blocks open on it
+
+
+@contextmanager
+def feeding_telemetry(layer, manager=None):
+    """Let feeds_telemetry() hook the layer into the telemetry manager for the duration of the with block.
+
+    The manager stops listening to the layer when the last block open on it exits.
+    """
+    manager = manager or default_manager()
+    with _feed_lock:
+        _feeders[layer] = _feeders.get(layer, 0) + 1
+    try:
+        yield
+    finally:
+        with _feed_lock:
+            _feeders[layer] -= 1
+            if not _feeders[layer]:
+                del _feeders[layer]
+                layer.remove_listener(manager.ingest)
+
+
+def feeds_telemetry(layer, manager=None):
+    """True if the shared telemetry depends on this command layer being pumped.
+
+    That is the case when the telemetry manager reads this layer or when no
+    other link keeps it live. Inside feeding_telemetry() the layer is then
+    registered to feed every message it reads into the telemetry manager.
+    """
+    manager = manager or default_manager()
+    if manager._on_message in layer.listeners or manager.ingest in layer.listeners:
+        return True
+    if telemetry_live(manager):
+        return False
+    with _feed_lock:
+        if layer in _feeders:
+            layer.add_listener(manager.ingest)
+    return True
+
+
+def wait_until(condition, timeout=None, master_conn=None, manager=None):
+    """Block until condition holds; returns the telemetry snapshot, or None on timeout.
+
+    When nothing else feeds the shared telemetry state and master_conn is
+    given, the calling thread reads that connection into it while waiting.
+    Raises CommandCancelled if the calling command is cancelled meanwhile.
+    """
+    manager = manager or default_manager()
+    wait = wait_for(condition, timeout, manager)
+    layer = command_layer(master_conn) if master_conn is not None else None
+    try:
+        with feeding_telemetry(layer, manager) if layer is not None else nullcontext():
+            while not wait.done():
+                check_cancelled()
+                if wait.deadline is not None and time.monotonic() >= wait.deadline:
+                    wait._expire()
+                    break
+                if layer is not None and feeds_telemetry(layer, manager):
+                    layer.pump(0.1)
+                else:
+                    try:
+                        return wait.result(0.1)
+                    except TimeoutError:
+                        pass
+        return wait.result()
+    except (TimeoutError, FutureTimeoutError, CancelledError):
+        return None
+    except CommandCancelled:
+        wait.cancel()
+        raise
@@ -0,0 +1,215 @@
+import threading
+import time
+from pymavlink import mavutil
+
+from src.auto.command_layer import command_layer
+from src.telemetry_dispatch import message_id
+
+mavlink = mavutil.mavlink
+
+# Legacy REQUEST_DATA_STREAM group carrying each message on ArduPilot, used
+# when the autopilot rejects MAV_CMD_SET_MESSAGE_INTERVAL
+LEGACY_STREAM_GROUPS = {
+    mavlink.MAVLINK_MSG_ID_SYS_STATUS: mavlink.MAV_DATA_STREAM_EXTENDED_STATUS,
+    mavlink.MAVLINK_MSG_ID_GPS_RAW_INT: mavlink.MAV_DATA_STREAM_EXTENDED_STATUS,
+    mavlink.MAVLINK_MSG_ID_GLOBAL_POSITION_INT: mavlink.MAV_DATA_STREAM_POSITION,
+    mavlink.MAVLINK_MSG_ID_LOCAL_POSITION_NED: mavlink.MAV_DATA_STREAM_POSITION,
+    mavlink.MAVLINK_MSG_ID_ATTITUDE: mavlink.MAV_DATA_STREAM_EXTRA1,
+    mavlink.MAVLINK_MSG_ID_VFR_HUD: mavlink.MAV_DATA_STREAM_EXTRA2,
+    mavlink.MAVLINK_MSG_ID_BATTERY_STATUS: mavlink.MAV_DATA_STREAM_EXTRA3,
+    mavlink.MAVLINK_MSG_ID_EKF_STATUS_REPORT: mavlink.MAV_DATA_STREAM_EXTRA3,
+}
+
+# Results after which retrying the same interval is pointless
+REJECTED_RESULTS = (
+    mavlink.MAV_RESULT_DENIED,
+    mavlink.MAV_RESULT_UNSUPPORTED,
+    mavlink.MAV_RESULT_FAILED,
+)
+
+
+class StreamRateManager:
+    """Keeps each message stream at the highest rate any subscriber currently wants.
+
+    Rate changes go out as MAV_CMD_SET_MESSAGE_INTERVAL one at a time (the
+    COMMAND_ACK does not say which message it is for) through the
+    connection's CommandLayer, which retransmits and matches the ACK, and
+    only count as applied once ACCEPTED. Rejected or unanswered messages fall
+    back to legacy REQUEST_DATA_STREAM groups. After a reconnect, streams
+    already arriving at their wanted rate are left alone instead of being
+    re-requested.
+    """
+
+    def __init__(self, retry_delay=1.5, rate_tolerance=0.7):
+        self.master = None
+        self.lock = threading.RLock()
+        self.requests = {}  # msg id -> {subscriber: rate_hz}
+        self.applied = {}  # msg id -> rate confirmed by the autopilot
+        self.legacy = {}  # msg id -> rate requested through its legacy stream group
+        self.pending = None  # (msg id, rate, Future of its COMMAND_ACK)
+        self.retry_after = {}  # msg id -> monotonic time before which not to resend
+        self.retry_delay = retry_delay
+        self.rate_tolerance = rate_tolerance
+        # Observed arrival counts used to verify rates after a reconnect
+        self.arrivals = {}
+        self.window_start = time.monotonic()
+        self.observed = {}
+        self.attached_at = None
+
+    def request(self, subscriber, msg_type, rate_hz):
+        """Record that subscriber wants msg_type at rate_hz (0 withdraws the request)"""
+        msg_id = message_id(msg_type)
+        with self.lock:
+            wanted = self.requests.setdefault(msg_id, {})
+            if rate_hz:
+                wanted[subscriber] = rate_hz
+            else:
+                wanted.pop(subscriber, None)
+        self.sync()
+
+    def release(self, subscriber):
+        """Withdraw every request made by subscriber"""
+        with self.lock:
+            for wanted in self.requests.values():
+                wanted.pop(subscriber, None)
+        self.sync()
+
+    def desired_rate(self, msg_id):
+        wanted = self.requests.get(msg_id)
+        return max(wanted.values()) if wanted else 0
+
+    def attach(self, master):
+        """Use a (new) connection; previously applied rates are verified, not resent"""
+        with self.lock:
+            self._drop_pending()
+            self.master = master
+            self.retry_after = {}
+            self.attached_at = time.monotonic()
+            self.arrivals = {}
+            self.observed = {}
+            self.window_start = self.attached_at
+        self.sync()
+
+    def detach(self):
+        with self.lock:
+            self._drop_pending()
+            self.master = None
+
+    def _drop_pending(self):
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            pending[2].cancel()  # Stops the CommandLayer retransmitting it
+
+    def observe(self, msg):
+        """Count arrivals of tracked messages (called for every received message)"""
+        msg_id = msg.get_msgId()
+        if msg_id in self.requests:
+            self.arrivals[msg_id] = self.arrivals.get(msg_id, 0) + 1
+
+    def _on_ack(self, pending, future):
+        """Apply the outcome of the in-flight SET_MESSAGE_INTERVAL once the CommandLayer resolves it"""
+        with self.lock:
+            if self.pending is not pending:
+                return  # Dropped by a detach meanwhile
+            self.pending = None
+            msg_id, rate, _ = pending
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                print(f"No ACK for {rate} Hz on message {msg_id}, using legacy stream request")
+                self.applied[msg_id] = rate
+                self._request_legacy(msg_id)
+            elif future.result().result == mavlink.MAV_RESULT_ACCEPTED:
+                self.applied[msg_id] = rate
+                self.legacy.pop(msg_id, None)
+            elif future.result().result in REJECTED_RESULTS:
+                print(f"Autopilot rejected {rate} Hz for message {msg_id}, using legacy stream request")
+                self.applied[msg_id] = rate
+                self._request_legacy(msg_id)
+            else:
+                # Temporarily rejected - try again shortly
+                self.retry_after[msg_id] = time.monotonic() + self.retry_delay
+        self.sync()
+
+    def tick(self):
+        """Periodic housekeeping: rate verification and pending changes"""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.window_start >= 2.0:
+                elapsed = now - self.window_start
+                self.observed = {msg_id: count / elapsed for msg_id, count in self.arrivals.items()}
+                self.arrivals = {}
+                self.window_start = now
+                self._verify_observed_rates()
+        self.sync()
+
+    def _verify_observed_rates(self):
+        """Forget applied rates for streams arriving well below what was asked for"""
+        if self.attached_at is None or time.monotonic() - self.attached_at < 2.0:
+            return
+        for msg_id, rate in list(self.applied.items()):
+            if rate > 0 and self.observed.get(msg_id, 0) < rate * self.rate_tolerance:
+                del self.applied[msg_id]
+
+    def sync(self):
+        """Send the next needed rate change, if any and if nothing is in flight"""
+        with self.lock:
+            if self.master is None or self.pending is not None:
+                return
+            now = time.monotonic()
+            for msg_id in self.requests:
+                rate = self.desired_rate(msg_id)
+                if self.applied.get(msg_id) == rate:
+                    continue
+                if rate and self.observed.get(msg_id, 0) >= rate * self.rate_tolerance and msg_id not in self.applied \
+                        and self.attached_at is not None and now - self.attached_at >= 2.0:
+                    # Already streaming at the wanted rate (e.g. kept across a reconnect)
+                    self.applied[msg_id] = rate
+                    continue
+                if self.retry_after.get(msg_id, 0) > now:
+                    continue
+                if msg_id in self.legacy:
+                    self.applied[msg_id] = rate
+                    self._request_legacy(msg_id)
+                    continue
+                self._send_interval(msg_id, rate)
+                return
+
+    def _send_interval(self, msg_id, rate):
+        # -1 disables the stream when nobody wants it any more
+        interval_us = 1e6 / rate if rate else -1
+        future = command_layer(self.master).send(
+            mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+            msg_id, interval_us,
+            0, 0, 0, 0,
+            0  # Target address of message stream (0: all systems)
+        )
+        pending = self.pending = (msg_id, rate, future)
+        future.add_done_callback(lambda future: self._on_ack(pending, future))
+
+    def _request_legacy(self, msg_id):
+        """Request the whole legacy stream group at the highest rate wanted for any member"""
+        group = LEGACY_STREAM_GROUPS.get(msg_id)
+        self.legacy[msg_id] = self.desired_rate(msg_id)
+        if group is None or self.master is None:
+            return
+        members = [m for m, g in LEGACY_STREAM_GROUPS.items() if g == group]
+        rate = max(self.desired_rate(m) for m in members)
+        command_layer(self.master).send_message(self.master.mav.request_data_stream_encode(
+            self.master.target_system, self.master.target_component,
+            group, int(round(rate)), 1 if rate else 0
+        ))
+
+    def status(self):
+        """Wanted, applied and observed rate per message name"""
+        with self.lock:
+            status = {}
+            for msg_id in self.requests:
+                name = mavlink.mavlink_map[msg_id].msgname if msg_id in mavlink.mavlink_map else str(msg_id)
+                status[name] = {
+                    'desired_hz': self.desired_rate(msg_id),
+                    'applied_hz': self.applied.get(msg_id),
+                    'observed_hz': round(self.observed.get(msg_id, 0), 2),
+                    'legacy': msg_id in self.legacy,
+                }
+            return status
@@ -2,30 +2,34 @@ import argparse
 from anyio import sleep
 from pymavlink import mavutil
 import time
-import math
-import json
-import os
 import threading
-import queue
-from src.auto.openai_assistant import get_and_execute_drone_commands
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+from src.telemetry_history import TelemetryHistory
+from src.telemetry_shm import DEFAULT_SHM_PATH, TelemetryReader
+from src.telemetry_dispatch import MessageDispatcher
+from src.scheduler import LaneScheduler
+from src.stream_rates import StreamRateManager
+from src.link_metrics import LinkMetrics
+from src.auto.command_layer import command_layer
+from src.auto.executor import CancellationToken, CommandCancelled, use_token
+from src.auto.connection_pool import COMMAND_CONNECTION, connection_pool
 
-def read_telemetry_from_service(data_file="/tmp/redstar_telemetry.json"):
-    """Read telemetry data from the background service"""
+_service_readers = {}
+
+def read_telemetry_from_service(data_file=DEFAULT_SHM_PATH):
+    """Read telemetry data published by the shared-memory telemetry service"""
+    reader = _service_readers.get(data_file)
+    if reader is None:
+        reader = _service_readers[data_file] = TelemetryReader(data_file)
     try:
-        # Check if file exists and is recent (less than 5 seconds old)
-        if os.path.exists(data_file):
-            file_age = time.time() - os.path.getmtime(data_file)
-            if file_age < 5.0:  # File is recent
-                with open(data_file, 'r') as f:
-                    data = json.load(f)
-                    # Ensure we have all required fields
-                    required_fields = ['mode', 'armed', 'lat', 'long', 'yaw', 'gs', 'vs', 'alt', 'battery']
-                    if all(field in data for field in required_fields):
-                        return data
-        return None
+        return reader.read()
     except Exception:
         return None
 
+def telemetry_service_available(data_file=DEFAULT_SHM_PATH):
+    """True when a telemetry publisher is live and this process need not open its own link"""
+    return read_telemetry_from_service(data_file) is not None
+
 def connect_vehicle():
     master = mavutil.mavlink_connection('udp:127.0.0.1:14550')
     master.wait_heartbeat()
@@ -41,12 +45,43 @@ def request_message_interval(master, message_id, frequency_hz):
         0  # Target address of message stream (0: all systems)
     )
 
+# Rates (Hz) the telemetry snapshot itself needs; subscribers can ask for more
+DEFAULT_STREAM_RATES = {
+    mavutil.mavlink.MAVLINK_MSG_ID_ATTITUDE: 10,
+    mavutil.mavlink.MAVLINK_MSG_ID_GLOBAL_POSITION_INT: 5,
+    mavutil.mavlink.MAVLINK_MSG_ID_SYS_STATUS: 1,
+    mavutil.mavlink.MAVLINK_MSG_ID_VFR_HUD: 5,
+}
+
 def setup_data_streams(master):
     """Set up all required data streams"""
-    request_message_interval(master, mavutil.mavlink.MAVLINK_MSG_ID_ATTITUDE, 10)
-    request_message_interval(master, mavutil.mavlink.MAVLINK_MSG_ID_GLOBAL_POSITION_INT, 5)
-    request_message_interval(master, mavutil.mavlink.MAVLINK_MSG_ID_SYS_STATUS, 1)
-    request_message_interval(master, mavutil.mavlink.MAVLINK_MSG_ID_VFR_HUD, 5)
+    for message_id, frequency_hz in DEFAULT_STREAM_RATES.items():
+        request_message_interval(master, message_id, frequency_hz)
+
+TELEMETRY_FIELDS = ['mode', 'armed', 'lat', 'long', 'yaw', 'gs', 'vs', 'alt', 'battery']
+
+def default_telemetry():
+    """Return a fresh telemetry dict with every field at its default value"""
+    return {
+        'mode': "UNKNOWN",
+        'armed': False,
+        'lat': 0,
+        'long': 0,  # Changed to match UI
+        'yaw': 0,
+        'gs': 0,
+        'vs': 0,
+        'alt': 0,
+        'battery': 0
+    }
+
+_default_dispatcher = MessageDispatcher()
+
+def decode_telemetry_message(msg):
+    """Translate a single MAVLink message into the telemetry fields it updates.
+
+    Returns an empty dict for messages that carry no telemetry we track.
+    """
+    return _default_dispatcher.decode(msg)
 
 def process_telemetry_direct():
     """Direct telemetry collection (fallback method)"""
@@ -56,17 +91,7 @@ def process_telemetry_direct():
         setup_data_streams(master)
         
         # Initialize variables
-        telemetry_data = {
-            'mode': "UNKNOWN",
-            'armed': False,
-            'lat': 0,
-            'long': 0,  # Changed to match UI
-            'yaw': 0,
-            'gs': 0,
-            'vs': 0,
-            'alt': 0,
-            'battery': 0
-        }
+        telemetry_data = default_telemetry()
         
         # Try to get initial data
         attempts = 0
@@ -79,26 +104,12 @@ def process_telemetry_direct():
                 attempts += 1
                 continue
                 
-            msg_type = msg.get_type()
-            if msg_type == 'BAD_DATA':
+            if msg.get_type() == 'BAD_DATA':
                 attempts += 1
                 continue
                 
             # Update telemetry data based on message type
-            if msg_type == "ATTITUDE":
-                telemetry_data['yaw'] = math.degrees(msg.yaw)
-            elif msg_type == "GLOBAL_POSITION_INT":
-                telemetry_data['lat'] = msg.lat / 1e7
-                telemetry_data['long'] = msg.lon / 1e7  # Changed to match UI
-                telemetry_data['alt'] = msg.relative_alt / 1000.0  # Convert mm to meters
-                telemetry_data['vs'] = -msg.vz / 100.0  # Convert cm/s to m/s
-            elif msg_type == "VFR_HUD":
-                telemetry_data['gs'] = msg.groundspeed
-            elif msg_type == "HEARTBEAT":
-                telemetry_data['mode'] = master.flightmode
-                telemetry_data['armed'] = msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED
-            elif msg_type == "SYS_STATUS":
-                telemetry_data['battery'] = msg.battery_remaining if hasattr(msg, 'battery_remaining') else 0
+            telemetry_data.update(decode_telemetry_message(msg))
             
             attempts += 1
             
@@ -106,17 +117,9 @@ def process_telemetry_direct():
         
     except Exception as e:
         print(f"Error in direct telemetry processing: {e}")
-        return {
-            'mode': "ERROR",
-            'armed': False,
-            'lat': 0,
-            'long': 0,
-            'yaw': 0,
-            'gs': 0,
-            'vs': 0,
-            'alt': 0,
-            'battery': 0
-        }
+        telemetry_data = default_telemetry()
+        telemetry_data['mode'] = "ERROR"
+        return telemetry_data
 
 def process_telemetry():
     """Main telemetry function - tries service first, falls back to direct"""
@@ -133,156 +136,570 @@ def process_telemetry():
 # CONTINUOUS TELEMETRY MANAGEMENT SYSTEM
 # ============================================================================
 
+class VehicleTelemetry:
+    """Telemetry snapshot, field freshness and history for one vehicle (system ID)"""
+    
+    def __init__(self, vehicle_id=None, history_minutes=10, history_rate_hz=10):
+        self.vehicle_id = vehicle_id
+        self.telemetry_data = default_telemetry()
+        # Monotonic time at which each field was last refreshed (None = never)
+        self.field_updated = {field: None for field in TELEMETRY_FIELDS}
+        self.history = TelemetryHistory(minutes=history_minutes, rate_hz=history_rate_hz)
+        self.last_message_time = None
+        self.last_sample_slot = None
+        self.lock = threading.Lock()
+    
+    def apply(self, updates, now):
+        with self.lock:
+            self.telemetry_data.update(updates)
+            for field in updates:
+                self.field_updated[field] = now
+    
+    def snapshot(self, now=None):
+        """Copy of the telemetry dict plus 'field_age' and 'vehicle_id' (ages as of now, monotonic by default)"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            data = self.telemetry_data.copy()
+            data['field_age'] = {
+                field: (now - updated if updated is not None else None)
+                for field, updated in self.field_updated.items()
+            }
+        data['vehicle_id'] = self.vehicle_id
+        return data
+    
+    def sample_history(self, link_timeout):
+        """Append the current snapshot to the history while the vehicle is being heard"""
+        if self.last_message_time is None or time.monotonic() - self.last_message_time > link_timeout:
+            return
+        with self.lock:
+            self.history.append(time.time(), self.telemetry_data)
+    
+    def sample_history_at(self, timestamp, interval):
+        """Append the current snapshot at message time timestamp, at most once per interval-long slot"""
+        slot = int(timestamp / interval + 1e-3)  # Tolerate float error at slot boundaries
+        if slot == self.last_sample_slot:
+            return
+        self.last_sample_slot = slot
+        with self.lock:
+            self.history.append(timestamp, self.telemetry_data)
+
+
 class ContinuousTelemetryManager:
-    def __init__(self):
-        # Priority queue: 0 = highest priority (user commands), 1 = telemetry
-        self.task_queue = queue.PriorityQueue()
-        self.telemetry_data = {
-            'mode': "UNKNOWN",
-            'armed': False,
-            'lat': 0,
-            'long': 0,
-            'yaw': 0,
-            'gs': 0,
-            'vs': 0,
-            'alt': 0,
-            'battery': 0
-        }
+    """Owns the MAVLink link and keeps per-vehicle telemetry for every system ID heard on it.
+
+    The first vehicle heard becomes the primary vehicle; the single-vehicle
+    attributes and methods (telemetry_data, history, get_telemetry_data() ...)
+    refer to it unless a vehicle_id is given.
+    """
+    
+    def __init__(self, connection_string='udp:127.0.0.1:14550', history_minutes=10, history_rate_hz=10,
+                 connection_factory=None, recorder=None, command_workers=1):
+        # Separate lanes so commands (LLM round trips, heartbeat waits) never starve telemetry work
+        self.scheduler = LaneScheduler(command_workers=command_workers)
+        self.command_timeout = 30
+        self.periodic_tasks = []
+        self.connection_string = connection_string
+        # Returns a mavutil-style connection; by default the pooled command connection, so commands
+        # and telemetry read one socket. use_replay() swaps in a recorded flight
+        self.connection_factory = connection_factory or self._shared_connection
+        # Follow each message's own receive time (msg._timestamp) rather than the wall clock for
+        # field ages, history and link metrics, so a replay gives the same telemetry at any speed
+        self.message_clock = False
+        self.message_time = None
+        # Optional FlightRecorder that receives every raw message
+        self.recorder = recorder
+        # Per-vehicle state keyed by MAVLink system ID, all fed by the one reader
+        self.history_minutes = history_minutes
+        self.history_rate_hz = history_rate_hz
+        self.vehicles = {}
+        self.primary = VehicleTelemetry(None, history_minutes, history_rate_hz)
+        # System IDs that are ground stations, not vehicles
+        self.ignored_systems = {255}
         self.running = False
-        self.worker_thread = None
-        self.lock = threading.Lock()
-        self.last_telemetry_update = 0
-        self.telemetry_interval = 1.0  # Update telemetry every 1 second
+        self.reader_thread = None
+        self.master = None
+        self.last_message_time = None
+        # Reconnect backoff (seconds), doubled after every failed attempt
+        self.reconnect_delay_min = 0.5
+        self.reconnect_delay_max = 10.0
+        # Drop and reopen the link if nothing arrives for this long
+        self.link_timeout = 5.0
+        self.heartbeat_timeout = 5.0
+        # Recent history is sampled history_rate_hz times a second on the realtime lane
+        self.history_interval = 1.0 / history_rate_hz
+        # Callbacks invoked with each dict of primary-vehicle field updates
+        self.listeners = []
+        # Callbacks invoked with every raw message read on the link
+        self.message_listeners = []
+        # Message ID -> decoder table plus per-field and per-message subscriptions
+        self.dispatcher = MessageDispatcher()
+        # Stream rates follow demand: the baseline below plus any subscriber's max_rate_hz
+        self.stream_rates = StreamRateManager()
+        for message_id, frequency_hz in DEFAULT_STREAM_RATES.items():
+            self.stream_rates.request('baseline', message_id, frequency_hz)
+        # Link quality and latency instrumentation, plus counters for link events
+        self.link_metrics = LinkMetrics()
+        self.link_events = {'connects': 0, 'connect_failures': 0, 'read_errors': 0, 'link_timeouts': 0}
         
-    def start(self):
-        """Start the continuous telemetry manager"""
+    def start(self, open_link=True):
+        """Start the continuous telemetry manager.
+
+        With open_link=False only the scheduler runs, e.g. when another
+        process already owns the MAVLink link.
+        """
         if self.running:
             return
             
         self.running = True
-        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
-        self.worker_thread.start()
+        self.scheduler.start()
+        self.periodic_tasks = [
+            self.scheduler.schedule_periodic('realtime', self._sample_history, self.history_interval),
+            self.scheduler.schedule_periodic('background', self._flush_recorder, 1.0),
+            self.scheduler.schedule_periodic('background', self.stream_rates.tick, 0.5),
+        ]
         
-        # Schedule initial telemetry update
-        self._schedule_telemetry()
+        if open_link:
+            # Dedicated reader owning the long-lived MAVLink connection
+            self.reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
+            self.reader_thread.start()
     
     def stop(self):
         """Stop the continuous telemetry manager"""
         self.running = False
-        if self.worker_thread:
-            # Add a stop signal to wake up the worker
-            self.task_queue.put((0, 'STOP', None))
-            self.worker_thread.join(timeout=2)
+        for stop_event in self.periodic_tasks:
+            stop_event.set()
+        self.periodic_tasks = []
+        self.scheduler.stop()
+        if self.reader_thread:
+            self.reader_thread.join(timeout=2)
+            self.reader_thread = None
+        self._close_connection()
+    
+    # The primary vehicle's state, kept under the names used before multi-vehicle support
+    @property
+    def telemetry_data(self):
+        return self.primary.telemetry_data
+    
+    @property
+    def field_updated(self):
+        return self.primary.field_updated
+    
+    @property
+    def history(self):
+        return self.primary.history
+    
+    @property
+    def lock(self):
+        return self.primary.lock
+    
+    def vehicle(self, vehicle_id=None):
+        """Get a vehicle's state (the primary vehicle if vehicle_id is None)"""
+        if vehicle_id is None:
+            return self.primary
+        vehicle = self.vehicles.get(vehicle_id)
+        if vehicle is None:
+            raise KeyError(f"No telemetry received from vehicle {vehicle_id}")
+        return vehicle
+    
+    def _vehicle_for(self, msg):
+        """Find the vehicle that sent msg, registering it on its first autopilot HEARTBEAT.
+
+        None for ground stations and for systems not (yet) known to be a
+        vehicle, such as a telemetry radio sending RADIO_STATUS before the
+        vehicle's first heartbeat arrives.
+        """
+        vehicle_id = msg.get_srcSystem()
+        vehicle = self.vehicles.get(vehicle_id)
+        if vehicle is not None:
+            return vehicle
+        if vehicle_id in self.ignored_systems or msg.get_type() != 'HEARTBEAT':
+            return None
+        if msg.type == mavutil.mavlink.MAV_TYPE_GCS:
+            self.ignored_systems.add(vehicle_id)
+            return None
+        if msg.autopilot == mavutil.mavlink.MAV_AUTOPILOT_INVALID:
+            return None  # A companion computer, gimbal or other non-flight component
+        if self.primary.vehicle_id is None:
+            # The first vehicle heard takes over the placeholder primary state
+            vehicle = self.primary
+            vehicle.vehicle_id = vehicle_id
+        else:
+            vehicle = VehicleTelemetry(vehicle_id, self.history_minutes, self.history_rate_hz)
+        self.vehicles[vehicle_id] = vehicle
+        return vehicle
+    
+    def _submit_command(self, command):
+        """Queue a user command on the command lane; cancelling its task cancels the command's token.
+
+        The token itself has no deadline: a plan may run longer than any one
+        tool call, and each tool call is bounded by its own COMMAND_DEADLINES entry.
+        """
+        token = CancellationToken()
+        task = self.scheduler.submit('command', self._run_command, command, token, deadline=self.command_timeout)
+        task.future.add_done_callback(lambda future: token.cancel() if future.cancelled() else None)
+        return task
     
     def execute_user_command(self, command):
-        """Execute a user command with highest priority"""
-        result_queue = queue.Queue()
-        # Priority 0 = highest priority for user commands
-        self.task_queue.put((0, 'USER_COMMAND', {'command': command, 'result_queue': result_queue}))
-        
+        """Execute a user command on the command lane and wait for its result"""
+        task = self._submit_command(command)
         try:
-            # Wait for result with timeout
-            result = result_queue.get(timeout=30)
-            return result
-        except queue.Empty:
+            return task.result(timeout=self.command_timeout)
+        except FutureTimeoutError:
+            task.cancel()
             return "Command timed out"
+        except CancelledError:
+            return "Command cancelled"
     
     def execute_user_command_async(self, command, result_callback):
-        """Execute a user command asynchronously"""
-        # Priority 0 = highest priority for user commands
-        self.task_queue.put((0, 'USER_COMMAND_ASYNC', {'command': command, 'callback': result_callback}))
+        """Execute a user command asynchronously.
+
+        Returns the scheduled task; pass it to cancel_user_command() to abandon
+        the command. Cancelled commands do not invoke result_callback.
+        """
+        task = self._submit_command(command)
+        
+        def on_done(future):
+            if not future.cancelled():
+                result_callback(future.result())
+        
+        task.future.add_done_callback(on_done)
+        return task
     
-    def get_telemetry_data(self):
-        """Get the latest telemetry data"""
-        with self.lock:
-            return self.telemetry_data.copy()
+    def cancel_user_command(self, task):
+        """Cancel a queued or in-flight user command; tool calls it is running stop at their next check"""
+        return task.cancel()
     
-    def _schedule_telemetry(self):
-        """Schedule the next telemetry update"""
-        if self.running:
-            # Priority 1 = lower priority for telemetry
-            self.task_queue.put((1, 'TELEMETRY', None))
+    def get_scheduler_metrics(self):
+        """Per-lane queue depth and timing counters"""
+        return self.scheduler.metrics()
+    
+    def _run_command(self, command, token):
+        try:
+            # Imported here so telemetry-only processes never load the assistant
+            from src.auto.openai_assistant import get_and_execute_drone_commands
+            with use_token(token):
+                return get_and_execute_drone_commands(command)
+        except CommandCancelled:
+            return "Command cancelled"
+        except Exception as e:
+            return f"Error: {str(e)}"
+    
+    def _sample_history(self):
+        """Append each vehicle's current snapshot to its history"""
+        if self.message_clock:
+            return  # Sampled on message time in ingest()
+        for vehicle in list(self.vehicles.values()):
+            vehicle.sample_history(self.link_timeout)
+    
+    def _flush_recorder(self):
+        if self.recorder is not None:
+            self.recorder.flush()
+    
+    def get_telemetry_data(self, vehicle_id=None):
+        """Get the latest telemetry data for one vehicle (the primary by default).
+
+        The returned dict also carries 'field_age' (seconds since each field was
+        last refreshed, None if never received), 'vehicle_id' and 'link_connected'.
+        """
+        data = self.vehicle(vehicle_id).snapshot(self.message_time)
+        data['link_connected'] = self.master is not None
+        return data
+    
+    def get_fleet_telemetry(self):
+        """Get a telemetry snapshot of every vehicle heard, keyed by system ID"""
+        return {vehicle_id: vehicle.snapshot(self.message_time) for vehicle_id, vehicle in list(self.vehicles.items())}
+    
+    def ingest(self, msg):
+        """Apply one MAVLink message to its vehicle's telemetry snapshot in place"""
+        # The link is alive by the wall clock; the telemetry itself follows the message clock when replaying
+        self.last_message_time = time.monotonic()
+        if self.message_clock:
+            now = self.message_time = msg._timestamp
+            self.link_metrics.observe(msg, now)
+        else:
+            now = self.last_message_time
+            self.link_metrics.observe(msg)
+        vehicle = self._vehicle_for(msg)
+        if vehicle is None:
+            # Ground station traffic still resolves subscriptions such as COMMAND_ACK
+            self.dispatcher.dispatch(msg)
+            return
+        vehicle.last_message_time = now
+        if vehicle is self.primary:
+            self.stream_rates.observe(msg)
+        updates = self.dispatcher.dispatch(msg)
+        if updates:
+            vehicle.apply(updates, now)
+        if self.message_clock:
+            vehicle.sample_history_at(now, self.history_interval)
+        if not updates or vehicle is not self.primary:
+            return
+        # Field subscriptions and listeners follow the primary vehicle
+        self.dispatcher.notify_fields(updates)
+        for listener in self.listeners:
+            try:
+                listener(updates)
+            except Exception as e:
+                print(f"Telemetry listener error: {e}")
+    
+    def subscribe_field(self, field, callback, min_change=0.0):
+        """Call callback(field, value) when a telemetry field changes by more than min_change"""
+        return self.dispatcher.subscribe_field(field, callback, min_change)
+    
+    def subscribe_message(self, msg_type, callback, max_rate_hz=None):
+        """Call callback(msg) for every msg_type message, at most max_rate_hz times a second.
+
+        max_rate_hz is also requested from the autopilot if it exceeds the current stream rate.
+        """
+        subscription = self.dispatcher.subscribe_message(msg_type, callback, max_rate_hz)
+        if max_rate_hz:
+            self.stream_rates.request(subscription, msg_type, max_rate_hz)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        self.dispatcher.unsubscribe(subscription)
+        self.stream_rates.release(subscription)
+    
+    def request_stream_rate(self, subscriber, msg_type, rate_hz):
+        """Ask for msg_type at rate_hz on behalf of subscriber (0 withdraws)"""
+        self.stream_rates.request(subscriber, msg_type, rate_hz)
+    
+    def get_stream_rates(self):
+        """Desired, applied and observed rate of each managed stream"""
+        return self.stream_rates.status()
+    
+    def get_metrics(self):
+        """Link quality, latency histograms, stream rates and scheduler lane stats"""
+        return {
+            'link_connected': self.master is not None,
+            'link_events': dict(self.link_events),
+            'last_message_age_s': (time.monotonic() - self.last_message_time
+                                   if self.last_message_time is not None else None),
+            'link': self.link_metrics.snapshot(self.message_time),
+            'stream_rates': self.get_stream_rates(),
+            'scheduler': self.get_scheduler_metrics(),
+        }
+    
+    def add_listener(self, callback):
+        """Call callback(updates) from the reader thread after every telemetry update"""
+        self.listeners.append(callback)
+    
+    def add_message_listener(self, callback):
+        """Call callback(msg) from the reader thread for every message read on the link"""
+        self.message_listeners = self.message_listeners + [callback]
+    
+    def remove_message_listener(self, callback):
+        self.message_listeners = [listener for listener in self.message_listeners if listener != callback]
+    
+    def write(self, data):
+        """Write an encoded MAVLink packet out on the manager's link"""
+        master = self.master
+        if master is None:
+            raise ConnectionError("Telemetry link is not connected")
+        with command_layer(master).send_lock:
+            master.write(data)
+    
+    def get_history(self, start=None, end=None, vehicle_id=None):
+        """Get zero-copy views (at most two, in time order) of history between two Unix timestamps"""
+        return self.vehicle(vehicle_id).history.segments(start, end)
+    
+    def get_recent_history(self, seconds, vehicle_id=None):
+        """Get the last `seconds` of history as one structured array"""
+        return self.vehicle(vehicle_id).history.latest(seconds)
+    
+    def get_telemetry_at(self, timestamps, vehicle_id=None):
+        """Get telemetry interpolated at one or more Unix timestamps"""
+        return self.vehicle(vehicle_id).history.interpolate(timestamps)
+    
+    def now(self):
+        """Current time on the clock field ages are kept in: the latest message time when replaying"""
+        return self.message_time if self.message_clock else time.monotonic()
+    
+    def use_replay(self, source):
+        """Read telemetry from a ReplaySource instead of the link, on the recording's clock"""
+        self.connection_factory = lambda: source
+        self.message_clock = True
+    
+    def _shared_connection(self):
+        return connection_pool.connection(self.connection_string)
+    
+    def _release_connection(self, master, failed):
+        """Close a connection; the shared one only when it failed, as commands still use it"""
+        if self.connection_factory == self._shared_connection:
+            if failed:
+                connection_pool.discard(master, self.connection_string)
+            return
+        try:
+            master.close()
+        except Exception:
+            pass
+    
+    def _open_connection(self):
+        """Open the MAVLink link, feed everything read on it to this manager and wait for the vehicle heartbeat.
+
+        Messages are taken from the connection's CommandLayer, so whichever
+        thread reads the connection (this reader or a command waiting for its
+        ACK) hands them to the telemetry as well.
+        """
+        master = self.connection_factory()
+        layer = command_layer(master)
+        heard = threading.Event()
+        
+        def on_heartbeat(msg):
+            if msg.get_type() == 'HEARTBEAT':
+                heard.set()
+        
+        layer.add_listener(self._on_message)
+        layer.add_listener(on_heartbeat)
+        try:
+            deadline = time.monotonic() + self.heartbeat_timeout
+            while not heard.is_set() and time.monotonic() < deadline:
+                layer.pump(0.1)
+        finally:
+            layer.remove_listener(on_heartbeat)
+        if not heard.is_set():
+            layer.remove_listener(self._on_message)
+            self._release_connection(master, failed=True)
+            raise TimeoutError("No MAVLink heartbeat received within timeout")
+        return master
+    
+    def _close_connection(self, failed=False):
+        self.stream_rates.detach()
+        master, self.master = self.master, None
+        if master is not None:
+            command_layer(master).remove_listener(self._on_message)
+            self._release_connection(master, failed)
     
-    def _worker_loop(self):
-        """Main worker loop that processes the priority queue"""
+    def _on_message(self, msg):
+        """Record and ingest one message read on the link, whichever thread read it"""
+        if msg.get_type() == 'BAD_DATA':
+            return
+        
+        if self.recorder is not None:
+            try:
+                self.recorder.record(msg)
+            except Exception as e:
+                print(f"Flight recorder error: {e}")
+        
+        try:
+            self.ingest(msg)
+        except Exception as e:
+            print(f"Telemetry error: {e}")
+        
+        for listener in self.message_listeners:
+            try:
+                listener(msg)
+            except Exception as e:
+                print(f"Telemetry message listener error: {e}")
+    
+    def _reader_loop(self):
+        """Keep one connection open and pump it, so every incoming message reaches _on_message"""
+        delay = self.reconnect_delay_min
         while self.running:
+            if self.master is None:
+                try:
+                    self.master = self._open_connection()
+                    self.last_message_time = time.monotonic()
+                    # Only streams not already arriving at the wanted rate get re-requested
+                    self.stream_rates.attach(self.master)
+                    self.link_events['connects'] += 1
+                    delay = self.reconnect_delay_min
+                except Exception as e:
+                    self.link_events['connect_failures'] += 1
+                    print(f"Telemetry connection failed, retrying in {delay:.1f}s: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.reconnect_delay_max)
+                    continue
+            
             try:
-                # Get next task (blocks until available)
-                priority, task_type, task_data = self.task_queue.get(timeout=1.0)
-                
-                if task_type == 'STOP':
-                    break
-                    
-                elif task_type == 'USER_COMMAND':
-                    # Execute user command with highest priority
-                    try:
-                        result = get_and_execute_drone_commands(task_data['command'])
-                        task_data['result_queue'].put(result)
-                    except Exception as e:
-                        task_data['result_queue'].put(f"Error: {str(e)}")
-                
-                elif task_type == 'USER_COMMAND_ASYNC':
-                    # Execute user command asynchronously
-                    try:
-                        result = get_and_execute_drone_commands(task_data['command'])
-                        task_data['callback'](result)
-                    except Exception as e:
-                        task_data['callback'](f"Error: {str(e)}")
-                
-                elif task_type == 'TELEMETRY':
-                    # Update telemetry data
-                    current_time = time.time()
-                    if current_time - self.last_telemetry_update >= self.telemetry_interval:
-                        try:
-                            new_data = process_telemetry_direct()
-                            with self.lock:
-                                self.telemetry_data.update(new_data)
-                            self.last_telemetry_update = current_time
-                        except Exception as e:
-                            print(f"Telemetry error: {e}")
-                        
-                        # Schedule next telemetry update
-                        self._schedule_telemetry()
-                    else:
-                        # If called too early, reschedule for later
-                        time.sleep(0.1)
-                        self._schedule_telemetry()
-                
-                # Mark task as done
-                self.task_queue.task_done()
-                
-            except queue.Empty:
-                # Timeout - schedule telemetry update if needed
-                current_time = time.time()
-                if current_time - self.last_telemetry_update >= self.telemetry_interval:
-                    self._schedule_telemetry()
-                continue
+                msg = command_layer(self.master).pump(1.0)
             except Exception as e:
-                print(f"Worker error: {e}")
+                self.link_events['read_errors'] += 1
+                print(f"Telemetry read error: {e}")
+                self._close_connection(failed=True)
+                continue
+            
+            if msg is None or msg.get_type() == 'BAD_DATA':
+                # Link went silent - reconnect
+                if time.monotonic() - self.last_message_time > self.link_timeout:
+                    self.link_events['link_timeouts'] += 1
+                    print("Telemetry link timed out, reconnecting")
+                    self._close_connection(failed=True)
                 continue
 
 # Global instance
 telemetry_manager = ContinuousTelemetryManager()
 
-def start_continuous_telemetry():
+def start_continuous_telemetry(open_link=True):
     """Start the continuous telemetry system"""
-    telemetry_manager.start()
+    telemetry_manager.start(open_link)
+
+def start_telemetry_for_commands():
+    """Start telemetry in a process that also sends vehicle commands.
+
+    When the shared-memory publisher owns the MAVLink link only the
+    scheduler runs, and the pooled command connection moves to
+    COMMAND_CONNECTION so it does not take the publisher's port.
+    """
+    if telemetry_service_available():
+        connection_pool.default_connection = COMMAND_CONNECTION
+        telemetry_manager.start(open_link=False)
+    else:
+        telemetry_manager.start()
 
 def stop_continuous_telemetry():
     """Stop the continuous telemetry system"""
     telemetry_manager.stop()
 
-def get_live_telemetry():
-    """Get current telemetry data"""
-    return telemetry_manager.get_telemetry_data()
+def get_live_telemetry(vehicle_id=None):
+    """Get current telemetry data, including per-field age in seconds.
+
+    Uses this process's own link when it is running, otherwise the
+    shared-memory telemetry service if one is publishing. vehicle_id selects a vehicle by MAVLink system ID; the default
+    is the first vehicle heard.
+    """
+    if vehicle_id is None and telemetry_manager.reader_thread is None and telemetry_manager.last_message_time is None:
+        service_data = read_telemetry_from_service()
+        if service_data:
+            return service_data
+    return telemetry_manager.get_telemetry_data(vehicle_id)
+
+def get_fleet_telemetry():
+    """Get a telemetry snapshot of every vehicle heard, keyed by MAVLink system ID"""
+    return telemetry_manager.get_fleet_telemetry()
+
+def get_telemetry_history(seconds=60, vehicle_id=None):
+    """Get the last `seconds` of telemetry history as a NumPy structured array"""
+    return telemetry_manager.get_recent_history(seconds, vehicle_id)
+
+def subscribe_telemetry_field(field, callback, min_change=0.0):
+    """Subscribe to changes of one telemetry field, e.g. ('alt', cb, min_change=0.5)"""
+    return telemetry_manager.subscribe_field(field, callback, min_change)
+
+def subscribe_telemetry_message(msg_type, callback, max_rate_hz=None):
+    """Subscribe to raw MAVLink messages of one type, e.g. ('ATTITUDE', cb, max_rate_hz=20)"""
+    return telemetry_manager.subscribe_message(msg_type, callback, max_rate_hz)
 
 def execute_priority_command(command):
     """Execute a command with priority over telemetry"""
     return telemetry_manager.execute_user_command(command)
 
 def execute_priority_command_async(command, callback):
-    """Execute a command asynchronously with priority over telemetry"""
-    telemetry_manager.execute_user_command_async(command, callback)
+    """Execute a command asynchronously on the command lane; returns a cancellable task"""
+    return telemetry_manager.execute_user_command_async(command, callback)
+
+def cancel_priority_command(task):
+    """Cancel a command started with execute_priority_command_async"""
+    return telemetry_manager.cancel_user_command(task)
+
+def get_telemetry_metrics():
+    """Link quality, latency histograms, stream rates and scheduler stats of the telemetry manager"""
+    return telemetry_manager.get_metrics()
+
+def get_scheduler_metrics():
+    """Per-lane queue depth and timing counters of the telemetry manager"""
+    return telemetry_manager.get_scheduler_metrics()
 
 # For backward compatibility, keep the old call
 if __name__ == "__main__":
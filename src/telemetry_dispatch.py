@@ -0,0 +1,199 @@
+import math
+import threading
+import time
+from pymavlink import mavutil
+
+mavlink = mavutil.mavlink
+
+
+# ----------------------------------------------------------------------------
+# Per-message decoders: each turns one MAVLink message into the telemetry
+# fields it updates. They are looked up by message ID, so adding a decoder
+# only costs the messages of that type.
+# ----------------------------------------------------------------------------
+
+def decode_attitude(msg):
+    return {'yaw': math.degrees(msg.yaw)}
+
+def decode_global_position_int(msg):
+    return {
+        'lat': msg.lat / 1e7,
+        'long': msg.lon / 1e7,
+        'alt': msg.relative_alt / 1000.0,  # Convert mm to meters
+        'vs': -msg.vz / 100.0  # Convert cm/s to m/s
+    }
+
+def decode_vfr_hud(msg):
+    return {'gs': msg.groundspeed}
+
+def decode_heartbeat(msg):
+    # Ignore heartbeats from ground stations, they carry no vehicle state
+    if msg.type == mavlink.MAV_TYPE_GCS:
+        return {}
+    return {
+        'mode': mavutil.mode_string_v10(msg),
+        'armed': bool(msg.base_mode & mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+    }
+
+def decode_sys_status(msg):
+    return {'battery': msg.battery_remaining if hasattr(msg, 'battery_remaining') else 0}
+
+EKF_REQUIRED_FLAGS = mavlink.EKF_ATTITUDE | mavlink.EKF_VELOCITY_HORIZ | mavlink.EKF_POS_HORIZ_ABS
+
+def decode_ekf_status_report(msg):
+    return {
+        'ekf_flags': msg.flags,
+        'ekf_ok': (msg.flags & EKF_REQUIRED_FLAGS) == EKF_REQUIRED_FLAGS
+                  and not msg.flags & mavlink.EKF_CONST_POS_MODE
+    }
+
+def decode_battery_status(msg):
+    cells = [v for v in msg.voltages if v != 65535]  # 65535 = cell not present
+    return {
+        'battery_voltage': sum(cells) / 1000.0,  # Convert mV to V
+        'battery_current': msg.current_battery / 100.0 if msg.current_battery != -1 else None  # cA to A
+    }
+
+def decode_gps_raw_int(msg):
+    return {
+        'gps_fix': msg.fix_type,
+        'satellites': msg.satellites_visible,
+        'hdop': msg.eph / 100.0 if msg.eph != 65535 else None
+    }
+
+def decode_local_position_ned(msg):
+    return {'local_x': msg.x, 'local_y': msg.y, 'local_z': msg.z}
+
+DEFAULT_DECODERS = {
+    mavlink.MAVLINK_MSG_ID_ATTITUDE: decode_attitude,
+    mavlink.MAVLINK_MSG_ID_GLOBAL_POSITION_INT: decode_global_position_int,
+    mavlink.MAVLINK_MSG_ID_VFR_HUD: decode_vfr_hud,
+    mavlink.MAVLINK_MSG_ID_HEARTBEAT: decode_heartbeat,
+    mavlink.MAVLINK_MSG_ID_SYS_STATUS: decode_sys_status,
+    mavlink.MAVLINK_MSG_ID_EKF_STATUS_REPORT: decode_ekf_status_report,
+    mavlink.MAVLINK_MSG_ID_BATTERY_STATUS: decode_battery_status,
+    mavlink.MAVLINK_MSG_ID_GPS_RAW_INT: decode_gps_raw_int,
+    mavlink.MAVLINK_MSG_ID_LOCAL_POSITION_NED: decode_local_position_ned,
+}
+
+
+def message_id(msg_type):
+    """Resolve a message name such as 'ATTITUDE' (or an ID) to its MAVLink message ID"""
+    if isinstance(msg_type, int):
+        return msg_type
+    return getattr(mavlink, f"MAVLINK_MSG_ID_{msg_type.upper()}")
+
+
+class FieldSubscription:
+    """Fires callback(field, value) when a field moves by more than min_change"""
+
+    def __init__(self, field, callback, min_change=0.0):
+        self.field = field
+        self.callback = callback
+        self.min_change = min_change
+        self.last_value = None
+
+    def offer(self, value):
+        last = self.last_value
+        if last is not None:
+            if isinstance(value, (int, float)) and isinstance(last, (int, float)) and not isinstance(value, bool):
+                if abs(value - last) <= self.min_change:
+                    return
+            elif value == last:
+                return
+        self.last_value = value
+        self.callback(self.field, value)
+
+
+class MessageSubscription:
+    """Fires callback(msg) for every message of one type, at most max_rate_hz times a second"""
+
+    def __init__(self, msg_id, callback, max_rate_hz=None):
+        self.msg_id = msg_id
+        self.callback = callback
+        self.max_rate_hz = max_rate_hz
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz else 0.0
+        self.last_delivery = 0.0
+
+    def offer(self, msg, now):
+        if now - self.last_delivery < self.min_interval:
+            return
+        self.last_delivery = now
+        self.callback(msg)
+
+
+class MessageDispatcher:
+    """Routes MAVLink messages by ID to their decoder and to subscribers.
+
+    Messages with no decoder and no subscriber cost one dict lookup.
+    Subscription lists are replaced rather than mutated, so subscribing from
+    another thread never disturbs a dispatch in progress.
+    """
+
+    def __init__(self, decoders=None):
+        self.decoders = dict(DEFAULT_DECODERS if decoders is None else decoders)
+        self.message_subscriptions = {}  # msg id -> tuple of MessageSubscription
+        self.field_subscriptions = {}  # field -> tuple of FieldSubscription
+        self.lock = threading.Lock()
+
+    def register(self, msg_type, decoder):
+        """Add or replace the decoder for a message type"""
+        self.decoders[message_id(msg_type)] = decoder
+
+    def decode(self, msg):
+        """Return the telemetry fields carried by msg (empty dict if none)"""
+        decoder = self.decoders.get(msg.get_msgId())
+        return decoder(msg) if decoder is not None else {}
+
+    def dispatch(self, msg):
+        """Decode msg and deliver it to its message subscribers; returns the field updates"""
+        msg_id = msg.get_msgId()
+        decoder = self.decoders.get(msg_id)
+        subscriptions = self.message_subscriptions.get(msg_id)
+        if subscriptions:
+            now = time.monotonic()
+            for subscription in subscriptions:
+                try:
+                    subscription.offer(msg, now)
+                except Exception as e:
+                    print(f"Message subscriber error: {e}")
+        return decoder(msg) if decoder is not None else {}
+
+    def notify_fields(self, updates):
+        """Deliver decoded field updates to field subscribers"""
+        if not self.field_subscriptions:
+            return
+        for field, value in updates.items():
+            for subscription in self.field_subscriptions.get(field, ()):
+                try:
+                    subscription.offer(value)
+                except Exception as e:
+                    print(f"Field subscriber error: {e}")
+
+    def subscribe_field(self, field, callback, min_change=0.0):
+        """Call callback(field, value) when field changes by more than min_change"""
+        subscription = FieldSubscription(field, callback, min_change)
+        with self.lock:
+            current = self.field_subscriptions.get(field, ())
+            self.field_subscriptions[field] = current + (subscription,)
+        return subscription
+
+    def subscribe_message(self, msg_type, callback, max_rate_hz=None):
+        """Call callback(msg) for each msg_type message, throttled to max_rate_hz"""
+        subscription = MessageSubscription(message_id(msg_type), callback, max_rate_hz)
+        with self.lock:
+            current = self.message_subscriptions.get(subscription.msg_id, ())
+            self.message_subscriptions[subscription.msg_id] = current + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if isinstance(subscription, FieldSubscription):
+                table, key = self.field_subscriptions, subscription.field
+            else:
+                table, key = self.message_subscriptions, subscription.msg_id
+            remaining = tuple(s for s in table.get(key, ()) if s is not subscription)
+            if remaining:
+                table[key] = remaining
+            else:
+                table.pop(key, None)
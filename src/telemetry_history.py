@@ -0,0 +1,135 @@
+import threading
+import numpy as np
+
+# Row layout of the history buffer
+HISTORY_DTYPE = np.dtype([
+    ('timestamp', 'f8'),  # Unix time of the sample
+    ('lat', 'f8'),
+    ('lon', 'f8'),
+    ('alt', 'f4'),
+    ('yaw', 'f4'),
+    ('gs', 'f4'),
+    ('vs', 'f4'),
+    ('battery', 'f4'),
+    ('mode', 'u1'),  # Index into TelemetryHistory.mode_names
+    ('armed', '?'),
+])
+
+# Fields that can be linearly interpolated between samples (yaw is handled separately)
+INTERPOLATED_FIELDS = ['lat', 'lon', 'alt', 'gs', 'vs', 'battery']
+
+
+class TelemetryHistory:
+    """Fixed-capacity ring buffer of telemetry samples backed by a NumPy structured array.
+
+    Appends are O(1) and never allocate. Readers get zero-copy views into the
+    buffer; a view is only stable until the ring wraps over it, so copy it if
+    it has to outlive the history window.
+    """
+
+    def __init__(self, minutes=10, rate_hz=10):
+        self.capacity = max(1, int(minutes * 60 * rate_hz))
+        self.buffer = np.zeros(self.capacity, dtype=HISTORY_DTYPE)
+        self.head = 0  # Next slot to write
+        self.count = 0
+        self.mode_names = []
+        self._mode_codes = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def mode_code(self, mode_name):
+        """Return the compact code for a flight mode name, registering it if new"""
+        code = self._mode_codes.get(mode_name)
+        if code is None:
+            code = len(self.mode_names)
+            self.mode_names.append(mode_name)
+            self._mode_codes[mode_name] = code
+        return code
+
+    def append(self, timestamp, data):
+        """Store one telemetry dict (same keys as get_live_telemetry) at timestamp"""
+        with self.lock:
+            row = self.buffer[self.head]
+            row['timestamp'] = timestamp
+            row['lat'] = data.get('lat', 0)
+            row['lon'] = data.get('long', 0)
+            row['alt'] = data.get('alt', 0)
+            row['yaw'] = data.get('yaw', 0)
+            row['gs'] = data.get('gs', 0)
+            row['vs'] = data.get('vs', 0)
+            row['battery'] = data.get('battery', 0)
+            row['mode'] = self.mode_code(data.get('mode', "UNKNOWN"))
+            row['armed'] = bool(data.get('armed', False))
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def segments(self, start=None, end=None):
+        """Return zero-copy views covering [start, end] in time order.
+
+        At most two views are returned: one per side of the ring's wrap point.
+        """
+        with self.lock:
+            if self.count < self.capacity:
+                parts = [self.buffer[:self.count]]
+            else:
+                parts = [self.buffer[self.head:], self.buffer[:self.head]]
+        views = []
+        for part in parts:
+            timestamps = part['timestamp']
+            lo = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+            hi = len(part) if end is None else np.searchsorted(timestamps, end, side='right')
+            if hi > lo:
+                views.append(part[lo:hi])
+        return views
+
+    def window(self, start=None, end=None):
+        """Return the samples in [start, end] as a single array.
+
+        This is a view when the range does not straddle the wrap point and a
+        copy otherwise.
+        """
+        views = self.segments(start, end)
+        if not views:
+            return self.buffer[:0]
+        if len(views) == 1:
+            return views[0]
+        return np.concatenate(views)
+
+    def latest(self, seconds):
+        """Return the samples from the last `seconds` seconds of history"""
+        views = self.segments()
+        if not views:
+            return self.buffer[:0]
+        newest = views[-1]['timestamp'][-1]
+        return self.window(newest - seconds, None)
+
+    def interpolate(self, timestamps):
+        """Estimate telemetry at arbitrary timestamps.
+
+        Numeric fields are linearly interpolated; mode and armed take the value
+        of the most recent sample at or before each timestamp. Timestamps
+        outside the recorded range are clamped to the first/last sample.
+        """
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype='f8'))
+        samples = self.window()
+        result = np.zeros(len(timestamps), dtype=HISTORY_DTYPE)
+        result['timestamp'] = timestamps
+        if len(samples) == 0:
+            return result
+        sample_times = samples['timestamp']
+        for field in INTERPOLATED_FIELDS:
+            result[field] = np.interp(timestamps, sample_times, samples[field])
+        # Unwrap yaw so interpolating across +/-180 degrees takes the short way round
+        yaw = np.unwrap(np.radians(samples['yaw'].astype('f8')))
+        yaw = np.degrees(np.interp(timestamps, sample_times, yaw))
+        result['yaw'] = (yaw + 180.0) % 360.0 - 180.0
+        previous = np.clip(np.searchsorted(sample_times, timestamps, side='right') - 1, 0, len(samples) - 1)
+        result['mode'] = samples['mode'][previous]
+        result['armed'] = samples['armed'][previous]
+        return result
+
+    def mode_name(self, code):
+        """Translate a stored mode code back to its name"""
+        return self.mode_names[code] if code < len(self.mode_names) else "UNKNOWN"
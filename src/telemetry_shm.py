@@ -0,0 +1,188 @@
+"""Seqlock-guarded shared-memory telemetry: one publisher owns the MAVLink link,
+any number of processes read snapshots with plain memory reads.
+
+Run the publisher with:  python -m src.telemetry_shm
+"""
+import argparse
+import math
+import mmap
+import os
+import struct
+import time
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp"
+DEFAULT_SHM_PATH = os.path.join(SHM_DIR, "redstar_telemetry")
+
+MAGIC = b"RSTL"
+VERSION = 1
+
+# magic, version, sequence counter (odd while a write is in progress)
+HEADER = struct.Struct('<4sIQ')
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = 8
+
+# Field order for the per-field update times stored after the snapshot
+FIELD_ORDER = ['mode', 'armed', 'lat', 'long', 'yaw', 'gs', 'vs', 'alt', 'battery']
+
+# published_at, lat, long, alt, yaw, gs, vs, battery, armed, mode, field update times.
+# All times are time.monotonic(), which is shared by every process on the host.
+PAYLOAD = struct.Struct('<ddd5f?16s%dd' % len(FIELD_ORDER))
+PAYLOAD_OFFSET = HEADER.size
+REGION_SIZE = HEADER.size + PAYLOAD.size
+
+
+class TelemetryPublisher:
+    """Writer side of the shared telemetry region (one per host)"""
+
+    def __init__(self, path=DEFAULT_SHM_PATH):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, REGION_SIZE)
+            self.mm = mmap.mmap(fd, REGION_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self.seq = 0
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, self.seq)
+
+    def publish(self, data, field_updated=None):
+        """Write one telemetry snapshot.
+
+        data uses the get_live_telemetry() keys; field_updated maps field name
+        to the monotonic time it was last refreshed (None if never).
+        """
+        field_updated = field_updated or {}
+        payload = PAYLOAD.pack(
+            time.monotonic(),
+            data.get('lat', 0),
+            data.get('long', 0),
+            data.get('alt', 0),
+            data.get('yaw', 0),
+            data.get('gs', 0),
+            data.get('vs', 0),
+            data.get('battery', 0),
+            bool(data.get('armed', False)),
+            str(data.get('mode', "UNKNOWN")).encode()[:16],
+            *[field_updated.get(field) if field_updated.get(field) is not None else math.nan
+              for field in FIELD_ORDER]
+        )
+        # Seqlock: odd sequence marks the write in progress
+        self.seq += 1
+        SEQ.pack_into(self.mm, SEQ_OFFSET, self.seq)
+        self.mm[PAYLOAD_OFFSET:REGION_SIZE] = payload
+        self.seq += 1
+        SEQ.pack_into(self.mm, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        self.mm.close()
+
+
+class TelemetryReader:
+    """Reader side of the shared telemetry region.
+
+    The file is mapped lazily on first use so readers can start before the
+    publisher does.
+    """
+
+    def __init__(self, path=DEFAULT_SHM_PATH, max_age=5.0, max_retries=100):
+        self.path = path
+        self.max_age = max_age
+        self.max_retries = max_retries
+        self.mm = None
+
+    def _map(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            if os.fstat(fd).st_size < REGION_SIZE:
+                return False
+            self.mm = mmap.mmap(fd, REGION_SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        magic, version, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            self.mm = None
+            return False
+        return True
+
+    def read_raw(self):
+        """Return (sequence, payload tuple) from a consistent snapshot, or None"""
+        if self.mm is None and not self._map():
+            return None
+        for _ in range(self.max_retries):
+            before = SEQ.unpack_from(self.mm, SEQ_OFFSET)[0]
+            if before & 1:
+                continue  # Writer is mid-update
+            values = PAYLOAD.unpack_from(self.mm, PAYLOAD_OFFSET)
+            if SEQ.unpack_from(self.mm, SEQ_OFFSET)[0] == before:
+                return before, values
+        return None
+
+    def read(self):
+        """Return the latest telemetry dict, or None if nothing recent is published"""
+        snapshot = self.read_raw()
+        if snapshot is None:
+            return None
+        seq, values = snapshot
+        if seq == 0:
+            return None  # Publisher has not written yet
+        published_at, lat, lon, alt, yaw, gs, vs, battery, armed, mode = values[:10]
+        now = time.monotonic()
+        if now - published_at > self.max_age:
+            return None
+        return {
+            'mode': mode.rstrip(b'\0').decode(errors='replace'),
+            'armed': armed,
+            'lat': lat,
+            'long': lon,
+            'yaw': yaw,
+            'gs': gs,
+            'vs': vs,
+            'alt': alt,
+            'battery': battery,
+            'field_age': {
+                field: (None if math.isnan(updated) else now - updated)
+                for field, updated in zip(FIELD_ORDER, values[10:])
+            },
+            'seq': seq
+        }
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+
+def run_publisher(connection_string='udp:127.0.0.1:14550', path=DEFAULT_SHM_PATH):
+    """Own the MAVLink link and publish every telemetry update until interrupted"""
+    from src.telemetary import ContinuousTelemetryManager
+
+    publisher = TelemetryPublisher(path)
+    manager = ContinuousTelemetryManager(connection_string)
+
+    def publish(_updates):
+        with manager.lock:
+            publisher.publish(manager.telemetry_data, manager.field_updated)
+
+    manager.add_listener(publish)
+    manager.start()
+    print(f"Publishing telemetry from {connection_string} to {path}")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.stop()
+        publisher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Publish drone telemetry to shared memory')
+    parser.add_argument('--connection', default='udp:127.0.0.1:14550', help='MAVLink connection string')
+    parser.add_argument('--path', default=DEFAULT_SHM_PATH, help='Shared memory file')
+    args = parser.parse_args()
+    run_publisher(args.connection, args.path)
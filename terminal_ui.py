@@ -4,7 +4,7 @@ import threading
 from queue import Queue, Empty
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from src.auto.openai_assistant import get_and_execute_drone_commands
-from src.telemetary import start_continuous_telemetry, stop_continuous_telemetry, get_live_telemetry, execute_priority_command_async
+from src.telemetary import start_telemetry_for_commands, stop_continuous_telemetry, get_live_telemetry, execute_priority_command_async, cancel_priority_command
 
 def format_value(value, precision=2):
     """Format numeric values with specified precision"""
@@ -30,12 +30,14 @@ def main(stdscr):
     input_str = ""
     MAX_LOGS = 500
 
-    # Start continuous telemetry system
-    start_continuous_telemetry()
+    # Start continuous telemetry system (only the command worker reads from it
+    # when a shared-memory telemetry publisher already owns the link)
+    start_telemetry_for_commands()
 
     # Simplified command processing 
     processing_command = False
     current_command = ""
+    current_task = None
     command_start_time = 0
 
     # Fixed telemetry section height
@@ -175,6 +177,7 @@ def main(stdscr):
             if ch != -1:
                 if ch == 3:  # Ctrl+C
                     if processing_command:
+                        cancel_priority_command(current_task)
                         logs.append("<user> Command cancelled")
                         processing_command = False
                         current_command = ""
@@ -188,7 +191,7 @@ def main(stdscr):
                         command_start_time = current_time
                         
                         # Execute command with priority using the queue system
-                        execute_priority_command_async(input_str, command_result_callback)
+                        current_task = execute_priority_command_async(input_str, command_result_callback)
                         
                         input_str = ""
                         if len(logs) > MAX_LOGS:
@@ -210,6 +213,7 @@ def main(stdscr):
             
         except KeyboardInterrupt:
             if processing_command:
+                cancel_priority_command(current_task)
                 logs.append("<user> Command cancelled")
                 processing_command = False
                 current_command = ""
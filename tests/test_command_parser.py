@@ -0,0 +1,96 @@
+import pytest
+
+from src.auto.command_parser import DEFAULT_YAW_SPEED, parse_command
+
+
+def commands(text):
+    result = parse_command(text)
+    assert result.path == 'parser', text
+    return result.commands
+
+
+@pytest.mark.parametrize('text, altitude', [
+    ("take off to 10m", 10),
+    ("Takeoff to 12.5 meters", 12.5),
+    ("launch to an altitude of 30 metres", 30),
+])
+def test_takeoff(text, altitude):
+    assert commands(text) == [('takeoff', {'altitude': altitude})]
+
+
+def test_arm_and_disarm():
+    assert commands("arm the drone") == [('arm_disarm', {'arm_command': True})]
+    assert commands("Disarm!") == [('arm_disarm', {'arm_command': False})]
+
+
+@pytest.mark.parametrize('text, mode', [
+    ("set mode to guided", 'GUIDED'),
+    ("switch to loiter mode", 'LOITER'),
+    ("change flight mode to alt hold", 'ALT_HOLD'),
+    ("land", 'LAND'),
+    ("return to launch", 'RTL'),
+    ("go home", 'RTL'),
+])
+def test_modes(text, mode):
+    assert commands(text) == [('set_mode', {'mode_name': mode})]
+
+
+def test_unknown_mode_goes_to_the_llm():
+    result = parse_command("set mode to hover")
+    assert result.path == 'llm'
+    assert result.commands == []
+
+
+def test_yaw():
+    assert commands("turn left 90 degrees") == [('condition_yaw', {
+        'angle_deg': 90, 'speed_deg_s': DEFAULT_YAW_SPEED, 'direction': -1, 'relative_offset': True})]
+    assert commands("rotate 45 deg clockwise")[0][1]['direction'] == 1
+
+
+def test_yaw_without_a_direction_is_less_confident():
+    result = parse_command("yaw 30 degrees")
+    assert result.path == 'parser'
+    assert result.confidence < 1.0
+
+
+@pytest.mark.parametrize('text, offset', [
+    ("move 5m forward", (5, 0, 0)),
+    ("go left 3 meters", (0, -3, 0)),
+    ("fly the drone 2.5m up", (0, 0, -2.5)),
+    ("move 4m south", (-4, 0, 0)),
+])
+def test_move(text, offset):
+    x_m, y_m, z_m_down = offset
+    assert commands(text) == [('move_local_ned', {'x_m': x_m, 'y_m': y_m, 'z_m_down': z_m_down})]
+
+
+def test_move_needs_exactly_one_direction():
+    assert parse_command("move 5m").path == 'llm'
+    assert parse_command("move forward 5m back").path == 'llm'
+
+
+def test_speed():
+    assert commands("set ground speed to 5 m/s") == [('change_speed', {
+        'speed_type': 1, 'speed_m_s': 5, 'throttle_pct': -1, 'relative': False})]
+    assert commands("change climb speed 2")[0][1]['speed_type'] == 2
+
+
+def test_compound_command_keeps_clause_order():
+    assert [name for name, _ in commands("arm, take off to 10m and then move 5m forward")] == [
+        'arm_disarm', 'takeoff', 'move_local_ned']
+
+
+def test_surveillance_prefix_is_ignored():
+    assert commands("[SURVEILLANCE] take off to 20m") == [('takeoff', {'altitude': 20})]
+
+
+@pytest.mark.parametrize('text', [
+    "",
+    "generate a cross coverage path at 40m",
+    "take off to 10m and survey the field",
+])
+def test_anything_unrecognised_falls_back_to_the_llm(text):
+    result = parse_command(text)
+    assert result.path == 'llm'
+    assert result.commands == []
+    assert result.confidence == 0.0
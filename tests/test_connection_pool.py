@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip('pymavlink')
+
+from src import telemetary
+from src.auto.connection_pool import COMMAND_CONNECTION, DEFAULT_CONNECTION, MavlinkConnectionPool, connection_pool
+
+
+def test_calls_without_a_connection_use_the_default():
+    pool = MavlinkConnectionPool()
+    assert pool._entry(None, None).connection_string == DEFAULT_CONNECTION
+    pool.default_connection = COMMAND_CONNECTION
+    assert pool._entry(None, None).connection_string == COMMAND_CONNECTION
+    assert pool._entry(DEFAULT_CONNECTION, None).connection_string == DEFAULT_CONNECTION
+
+
+@pytest.mark.parametrize('service, connection, open_link', [
+    (True, COMMAND_CONNECTION, False),
+    (False, DEFAULT_CONNECTION, True),
+])
+def test_commands_keep_off_the_publishers_port(monkeypatch, service, connection, open_link):
+    started = []
+    monkeypatch.setattr(telemetary, 'telemetry_service_available', lambda: service)
+    monkeypatch.setattr(telemetary.telemetry_manager, 'start', lambda open_link=True: started.append(open_link))
+    monkeypatch.setattr(connection_pool, 'default_connection', DEFAULT_CONNECTION)
+    telemetary.start_telemetry_for_commands()
+    assert started == [open_link]
+    assert connection_pool.default_connection == connection
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('module, requires', [
+    ('api', 'fastapi'),
+    ('src.auto.openai_assistant', None),
+])
+def test_entry_point_does_not_import_pymavlink(module, requires):
+    if requires:
+        pytest.importorskip(requires)
+    result = subprocess.run([sys.executable, '-c', f"import sys, {module}; print('pymavlink' in sys.modules)"],
+                            capture_output=True, text=True, cwd=ROOT)
+    assert result.stdout.strip() == 'False', result.stderr
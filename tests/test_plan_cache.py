@@ -0,0 +1,81 @@
+import pytest
+
+from src.auto.plan_cache import AmbiguousPlan, PlanCache, _fill, _template, normalize_command
+
+
+def template(function_name, args, command):
+    _, numbers = normalize_command(command)
+    used = set()
+    return _template(function_name, args, command, numbers, used), numbers, used
+
+
+def test_normalize_command():
+    assert normalize_command("Take off to 10m!") == ("take off to <n> m", [10.0])
+    assert normalize_command("move 2.5 m left") == ("move <n> m left", [2.5])
+
+
+def test_value_argument_becomes_slot():
+    args, numbers, used = template('takeoff', {'altitude': 10}, "take off to 10m")
+    assert args == {'altitude': {'$slot': 0, 'scale': 1, 'int': True}}
+    assert used == {0}
+    assert _fill(args, "take off to 15m", [15.0]) == {'altitude': 15}
+
+
+def test_negative_value_keeps_its_sign():
+    args, _, _ = template('move_local_ned', {'x_m': 0, 'y_m': -5, 'z_m_down': 0}, "move 5m left")
+    assert args['y_m'] == {'$slot': 0, 'scale': -1, 'int': True}
+    assert _fill(args, "move 7.5m left", [7.5]) == {'x_m': 0, 'y_m': -7.5, 'z_m_down': 0}
+
+
+def test_enum_and_flag_fields_stay_constant():
+    plan_args = {'speed_type': 1, 'speed_m_s': 1, 'throttle_pct': -1, 'relative': False}
+    args, _, used = template('change_speed', plan_args, "change speed to 1 m/s")
+    assert args['speed_type'] == 1
+    assert args['throttle_pct'] == -1
+    assert args['speed_m_s'] == {'$slot': 0, 'scale': 1, 'int': True}
+    assert used == {0}
+    assert _fill(args, "change speed to 8 m/s", [8.0]) == {
+        'speed_type': 1, 'speed_m_s': 8, 'throttle_pct': -1, 'relative': False}
+
+
+def test_value_matching_several_numbers_is_ambiguous():
+    with pytest.raises(AmbiguousPlan):
+        template('move_local_ned', {'x_m': 5, 'y_m': 0, 'z_m_down': 0}, "move 5m forward and 5m right")
+
+
+def test_command_text_is_referenced():
+    command = "take off to 10m"
+    args, _, _ = template('generate_dynamic_waypoints_from_command', {'command': command}, command)
+    assert args == {'command': {'$command': True}}
+    assert _fill(args, "take off to 20m", [20.0]) == {'command': "take off to 20m"}
+
+
+def test_cache_replays_speed_plan_with_new_speed():
+    cache = PlanCache(path=None)
+    plan = [('change_speed', {'speed_type': 1, 'speed_m_s': 1, 'throttle_pct': -1, 'relative': False})]
+    assert cache.put("change speed to 1 m/s", plan)
+    assert cache.get("change speed to 8 m/s") == [
+        ('change_speed', {'speed_type': 1, 'speed_m_s': 8, 'throttle_pct': -1, 'relative': False})]
+
+
+def test_cache_refuses_ambiguous_plan():
+    cache = PlanCache(path=None)
+    plan = [('move_local_ned', {'x_m': 5, 'y_m': 0, 'z_m_down': 0}),
+            ('move_local_ned', {'x_m': 0, 'y_m': 5, 'z_m_down': 0})]
+    assert not cache.put("move 5m forward and 5m right", plan)
+    assert cache.get("move 5m forward and 5m right") is None
+    assert cache.status()['ambiguous'] == 1
+
+
+def test_unused_number_only_hits_exact_repeat():
+    cache = PlanCache(path=None)
+    plan = [('set_mode', {'mode_name': 'GUIDED'}), ('takeoff', {'altitude': 10})]
+    cache.put("takeoff 10m in 3 seconds", plan)
+    assert cache.get("takeoff 10m in 3 seconds") == plan
+    assert cache.get("takeoff 12m in 3 seconds") is None
+
+
+def test_cache_persists(tmp_path):
+    path = str(tmp_path / 'plans.json')
+    PlanCache(path=path).put("take off to 10m", [('takeoff', {'altitude': 10})])
+    assert PlanCache(path=path).get("take off to 12m") == [('takeoff', {'altitude': 12})]
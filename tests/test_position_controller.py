@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+mavutil = pytest.importorskip('pymavlink.mavutil')
+
+from src.auto.command_layer import command_layer
+from src.auto.position_controller import PositionController
+from src.telemetary import ContinuousTelemetryManager
+
+
+class FakeMav:
+    srcSystem = 255
+
+    def __init__(self):
+        self.sent = []
+        self.commands = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+    def command_long_send(self, target_system, target_component, command, confirmation, *params):
+        self.commands.append((command, params))
+
+
+class FakeMaster:
+    target_system = 1
+    target_component = 1
+
+    def __init__(self):
+        self.mav = FakeMav()
+
+    def recv_match(self, blocking=False, timeout=None):
+        return None
+
+
+def local_position(manager, x, y, z):
+    manager.primary.apply({'local_x': x, 'local_y': y, 'local_z': z}, manager.now())
+
+
+@pytest.fixture
+def manager():
+    manager = ContinuousTelemetryManager()
+    manager.master = FakeMaster()  # Stream rates go through the manager
+    yield manager
+    manager.scheduler.stop()
+
+
+def test_stale_local_position_does_not_anchor_the_move(manager):
+    local_position(manager, 100, 0, -10)  # Left over from a move before a takeoff
+    controller = PositionController(FakeMaster(), 5, 0, 0, manager=manager, rate_hz=20).start()
+    time.sleep(0.2)
+    assert controller.target is None
+    local_position(manager, 0, 0, -10)
+    deadline = time.monotonic() + 2
+    while controller.target is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert controller.target == (5, 0, -10)
+    controller.cancel()
+
+
+def test_feedback_follows_the_control_rate(manager):
+    controller = PositionController(FakeMaster(), 5, 0, 0, manager=manager, rate_hz=20).start()
+    msg_id = mavutil.mavlink.MAVLINK_MSG_ID_LOCAL_POSITION_NED
+    assert manager.stream_rates.requests[msg_id][controller.id] == 20
+    controller.cancel()
+    assert controller.id not in manager.stream_rates.requests.get(msg_id, {})
+
+
+def test_feedback_interval_is_reset_without_a_telemetry_link(manager):
+    manager.master = None  # The move asks the vehicle itself
+    master = FakeMaster()
+    controller = PositionController(master, 5, 0, 0, manager=manager, rate_hz=20).start()
+    controller.cancel()
+    # The reset queues behind the unacknowledged request, as repeats of a command may not overlap
+    queued = [pending.params[1] for pendings in command_layer(master).pending.values() for pending in pendings
+              if pending.command == mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL]
+    assert queued == [1e6 / 20, -1]
@@ -0,0 +1,56 @@
+import pytest
+
+mavutil = pytest.importorskip('pymavlink.mavutil')
+
+from src.flight_recorder import FlightRecorder, replay_telemetry
+from src.telemetary import ContinuousTelemetryManager
+
+LOG_START = 1_700_000_000.0
+
+
+def record_flight(path, messages=40, interval=0.05):
+    recorder = FlightRecorder(str(path))
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1)
+    for i in range(messages):
+        timestamp = LOG_START + i * interval
+        for msg in (mav.heartbeat_encode(2, 3, 0, 0, 4),
+                    mav.global_position_int_encode(i * 50, 96212000 + i * 10, 777243000, 10000, 5000, 0, 0, 0, 0)):
+            msg.pack(mav)
+            recorder.record(msg, timestamp)
+    recorder.close()
+
+
+def replay(path, speed):
+    manager = ContinuousTelemetryManager(history_rate_hz=10)
+    replay_telemetry(str(path), speed, manager)
+    return manager
+
+
+def test_history_follows_the_log_clock(tmp_path):
+    path = tmp_path / 'flight.log'
+    record_flight(path)
+    manager = replay(path, 0)
+    timestamps = manager.history.window()['timestamp']
+    # One sample per 0.1s of log time, stamped with the log's own time, even unpaced
+    assert len(timestamps) == 20
+    assert timestamps[0] == pytest.approx(LOG_START)
+    assert timestamps[-1] == pytest.approx(LOG_START + 1.9)
+    assert manager.get_telemetry_data()['field_age']['lat'] == 0.0
+
+
+def test_replay_is_the_same_at_any_speed(tmp_path):
+    path = tmp_path / 'flight.log'
+    record_flight(path)
+
+    def outcome(manager):
+        history = manager.history.window()
+        link = manager.get_metrics()['link']['messages']['GLOBAL_POSITION_INT']
+        return history['timestamp'].tolist(), history['lat'].tolist(), link['rate_hz'], link['age_s']
+
+    assert outcome(replay(path, 0)) == outcome(replay(path, 4))
+
+
+def test_new_recorder_has_no_timestamps_yet(tmp_path):
+    recorder = FlightRecorder(str(tmp_path / 'flight.log'))
+    assert (recorder.first_timestamp, recorder.last_timestamp) == (None, None)
+    recorder.close()
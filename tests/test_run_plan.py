@@ -0,0 +1,33 @@
+import time
+
+from src.auto import openai_assistant as assistant
+
+
+def run_plan(calls, monkeypatch, function_map):
+    monkeypatch.setattr(assistant, 'get_function_map', lambda: function_map)
+    report = {}
+    result = assistant._run_plan(calls, "arm", None, lambda: object(), report, {'plan_ready': time.monotonic()})
+    return result, report
+
+
+def test_missing_helper_fails_its_step_only(monkeypatch):
+    armed = []
+
+    def arm_disarm(master, arm_command):
+        armed.append(arm_command)
+        return 0
+
+    calls = [('arm_disarm', {'arm_command': True}), ('generate_waypoint_json', {'waypoints': []})]
+    (success, function_list, waypoint_data), report = run_plan(
+        calls, monkeypatch, {'arm_disarm': arm_disarm, 'generate_waypoint_json': None})
+    assert armed == [True]
+    assert not success
+    assert function_list == [['arm_disarm', 0], ['generate_waypoint_json', False]]
+    assert [step['status'] for step in report['timeline']] == ['ok', 'failed']
+
+
+def test_unknown_helper_name_fails_its_step_only(monkeypatch):
+    monkeypatch.setattr(assistant, 'HELPER_FUNCTIONS', assistant.HELPER_FUNCTIONS + ['make_report'])
+    (success, function_list, _), _ = run_plan([('make_report', {})], monkeypatch, {})
+    assert not success
+    assert function_list == [['make_report', False]]
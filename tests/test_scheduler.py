@@ -0,0 +1,159 @@
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from src.auto.executor import CancellationToken, CommandCancelled, CommandExecutor, check_cancelled, use_token
+from src.scheduler import LaneScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = LaneScheduler(lanes={'work': 1})
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+def wait_cancelled(timeout=5):
+    """Spin the way a primitive does, polling the current token, until it is cancelled"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        check_cancelled()
+        time.sleep(0.01)
+    return 'not cancelled'
+
+
+def test_cancel_while_queued_never_runs(scheduler):
+    release = threading.Event()
+    ran = []
+    blocker = scheduler.submit('work', release.wait, 5)
+    queued = scheduler.submit('work', ran.append, 'queued')
+    assert queued.cancel()
+    release.set()
+    blocker.result(timeout=5)
+    scheduler.submit('work', lambda: None).result(timeout=5)  # Drain the lane
+    assert ran == []
+    with pytest.raises(CancelledError):
+        queued.result()
+
+
+def test_cancel_while_running_sets_the_event(scheduler):
+    started = threading.Event()
+    stopped = threading.Event()
+
+    def work(task_holder):
+        started.set()
+        task_holder[0].cancel_event.wait(5)
+        stopped.set()
+
+    holder = []
+    holder.append(scheduler.submit('work', work, holder))
+    assert started.wait(5)
+    assert holder[0].running
+    assert holder[0].cancel()
+    with pytest.raises(CancelledError):
+        holder[0].result(timeout=1)
+    assert stopped.wait(5)
+
+
+def test_tool_call_follows_its_commands_token():
+    executor = CommandExecutor(workers=1)
+    parent = CancellationToken()
+    results = []
+
+    def command():
+        with use_token(parent):
+            try:
+                results.append(executor.run('hold', wait_cancelled, timeout=5))
+            except CommandCancelled as e:
+                results.append(e)
+
+    thread = threading.Thread(target=command)
+    thread.start()
+    time.sleep(0.1)
+    parent.cancel("user cancelled")
+    thread.join(5)
+    executor.scheduler.stop()
+    assert len(results) == 1 and isinstance(results[0], CommandCancelled)
+    assert executor.metrics()['commands']['hold']['cancelled'] == 1
+
+
+def test_tool_call_past_its_deadline_is_cancelled():
+    executor = CommandExecutor(workers=1, grace=1.0)
+    started = time.monotonic()
+    with pytest.raises(CommandCancelled):
+        executor.run('hold', wait_cancelled, timeout=0.1)
+    executor.scheduler.stop()
+    assert time.monotonic() - started < 2
+    assert executor.metrics()['commands']['hold']['timed_out'] == 1
+
+
+def test_token_with_cancelled_parent_is_cancelled():
+    parent = CancellationToken()
+    child = CancellationToken(parent=parent)
+    assert not child.cancelled
+    parent.cancel("stop")
+    assert child.cancelled
+    assert child.reason == "stop"
+    with pytest.raises(CommandCancelled):
+        child.check()
+
+
+def test_cancelling_a_user_command_cancels_its_token(monkeypatch):
+    pytest.importorskip('pymavlink')
+    from src.auto import openai_assistant
+    from src.telemetary import ContinuousTelemetryManager
+
+    started = threading.Event()
+    outcome = []
+
+    def get_and_execute_drone_commands(command):
+        started.set()
+        try:
+            return wait_cancelled()
+        except CommandCancelled:
+            outcome.append('cancelled')
+            raise
+
+    monkeypatch.setattr(openai_assistant, 'get_and_execute_drone_commands', get_and_execute_drone_commands)
+    manager = ContinuousTelemetryManager()
+    manager.scheduler.start()
+    try:
+        task = manager.execute_user_command_async("hover", lambda result: outcome.append(result))
+        assert started.wait(5)
+        assert manager.cancel_user_command(task)
+        deadline = time.monotonic() + 5
+        while not outcome and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        manager.scheduler.stop()
+    assert outcome == ['cancelled']
+
+
+def test_user_command_may_outlast_the_result_wait(monkeypatch):
+    pytest.importorskip('pymavlink')
+    from src.auto import openai_assistant
+    from src.telemetary import ContinuousTelemetryManager
+
+    def get_and_execute_drone_commands(command):
+        # A long plan: only the tool calls have deadlines, not the command
+        for _ in range(30):
+            check_cancelled()
+            time.sleep(0.01)
+        return 'done'
+
+    monkeypatch.setattr(openai_assistant, 'get_and_execute_drone_commands', get_and_execute_drone_commands)
+    manager = ContinuousTelemetryManager()
+    manager.command_timeout = 0.1
+    manager.scheduler.start()
+    try:
+        results = []
+        manager.execute_user_command_async("survey", results.append)
+        deadline = time.monotonic() + 5
+        while not results and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        manager.scheduler.stop()
+    assert results == ['done']
@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import src.auto.openai_assistant as assistant
+from src.auto.plan_cache import PlanCache
+from src.auto.single_flight import SingleFlight
+
+
+def run_together(count, fn):
+    """Call fn() from count threads released at the same moment; returns their results"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+def test_concurrent_callers_share_one_run():
+    flights = SingleFlight(window=0)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'done'
+
+    results = run_together(2, lambda: flights.run('key', slow))
+    assert len(calls) == 1
+    assert sorted(results) == [('done', False), ('done', True)]
+    assert flights.status()['coalesced_in_flight'] == 1
+
+
+def test_recent_result_is_reused_within_window():
+    flights = SingleFlight(window=60)
+    assert flights.run('key', lambda: 1) == (1, False)
+    assert flights.run('key', lambda: 2) == (1, True)
+    assert flights.run('other', lambda: 3) == (3, False)
+
+
+def test_expired_flight_runs_again():
+    flights = SingleFlight(window=0)
+    assert flights.run('key', lambda: 1) == (1, False)
+    assert flights.run('key', lambda: 2) == (2, False)
+
+
+def test_exception_is_shared():
+    flights = SingleFlight(window=60)
+
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        flights.run('key', fail)
+    with pytest.raises(ValueError):
+        flights.run('key', lambda: 1)
+
+
+def test_identical_commands_share_plan_and_execution(monkeypatch):
+    requests = []
+    executions = []
+
+    def start_plan_request(user_input, usage=None):
+        requests.append(user_input)
+        future = Future()
+        threading.Timer(0.2, future.set_result, [None]).start()
+        return future
+
+    def plan_from_response(future, usage=None):
+        future.result()
+        return [('generate_cross_coverage_path', {'altitude': 40})]
+
+    def generate_cross_coverage_path(**args):
+        executions.append('generate_cross_coverage_path')
+        return {'path': []}
+
+    monkeypatch.setattr(assistant, 'command_flights', SingleFlight(window=0))
+    monkeypatch.setattr(assistant, 'plan_cache', PlanCache(path=None))
+    monkeypatch.setattr(assistant, 'start_plan_request', start_plan_request)
+    monkeypatch.setattr(assistant, 'plan_from_response', plan_from_response)
+    monkeypatch.setattr(assistant, 'get_function_map', lambda: {'generate_cross_coverage_path': generate_cross_coverage_path})
+
+    # Cross coverage plans only run local helpers, so no vehicle connection is involved
+    command = "generate a cross coverage path at 40m"
+    waypoints = [{'id': 'area', 'coordinates': [{'lat': 9.62, 'lon': 77.72, 'alt': 0}]}]
+
+    def issue():
+        report = {}
+        return assistant.get_and_execute_drone_commands(command, waypoints, report=report), report
+
+    results = run_together(2, issue)
+    assert requests == [command]
+    assert executions == ['generate_cross_coverage_path']
+    assert results[0][0] == results[1][0]
+    assert results[0][0][0] is True
+    assert sorted(report['coalesced'] for _, report in results) == [False, True]
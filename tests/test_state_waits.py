@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('pymavlink')
+
+from src.state_waits import armed, feeding_telemetry, feeds_telemetry, wait_for, wait_until
+from src.telemetary import ContinuousTelemetryManager
+
+
+class FakeLayer:
+    """Just enough of a CommandLayer: listeners, and a pump that reads nothing"""
+
+    def __init__(self):
+        self.listeners = []
+        self.pumped = 0
+
+    def add_listener(self, callback):
+        self.listeners = self.listeners + [callback]
+
+    def remove_listener(self, callback):
+        self.listeners = [listener for listener in self.listeners if listener != callback]
+
+    def pump(self, timeout):
+        self.pumped += 1
+        return None
+
+
+def scheduler_threads(manager):
+    return sum(len(lane.threads) for lane in manager.scheduler.lanes.values())
+
+
+def test_constructing_a_wait_starts_no_threads():
+    manager = ContinuousTelemetryManager()
+    wait = wait_for(armed(), timeout=5, manager=manager)
+    assert scheduler_threads(manager) == 0
+    wait.cancel()
+
+
+def test_awaiting_a_wait_fires_its_deadline():
+    manager = ContinuousTelemetryManager()
+
+    async def main():
+        with pytest.raises(TimeoutError):
+            await wait_for(armed(), timeout=0.1, manager=manager)
+
+    try:
+        asyncio.run(main())
+        assert scheduler_threads(manager) > 0
+    finally:
+        manager.scheduler.stop()
+
+
+def test_ingest_listens_only_while_waiting():
+    manager = ContinuousTelemetryManager()
+    layer = FakeLayer()
+    with feeding_telemetry(layer, manager):
+        assert feeds_telemetry(layer, manager)
+        assert layer.listeners == [manager.ingest]
+        with feeding_telemetry(layer, manager):
+            assert feeds_telemetry(layer, manager)
+        # Still held by the outer block
+        assert layer.listeners == [manager.ingest]
+    assert layer.listeners == []
+
+
+def test_feeds_telemetry_outside_a_wait_registers_nothing():
+    manager = ContinuousTelemetryManager()
+    layer = FakeLayer()
+    assert feeds_telemetry(layer, manager)
+    assert layer.listeners == []
+
+
+def test_wait_until_removes_its_listener(monkeypatch):
+    manager = ContinuousTelemetryManager()
+    layer = FakeLayer()
+    monkeypatch.setattr('src.state_waits.command_layer', lambda master: layer)
+    assert wait_until(armed(), timeout=0.3, master_conn=object(), manager=manager) is None
+    assert layer.pumped > 0
+    assert layer.listeners == []
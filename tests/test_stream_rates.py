@@ -0,0 +1,65 @@
+import pytest
+
+mavutil = pytest.importorskip('pymavlink.mavutil')
+
+from src.auto.command_layer import command_layer
+from src.stream_rates import StreamRateManager
+
+mavlink = mavutil.mavlink
+
+
+class FakeMaster:
+    """Connection to system 1 that records what is sent through it"""
+    target_system = 1
+    target_component = 1
+
+    def __init__(self):
+        self.mav = mavlink.MAVLink(None, srcSystem=255)
+        self.commands = []
+        self.messages = []
+        self.mav.command_long_send = lambda *args: self.commands.append(args)
+        self.mav.send = self.messages.append
+
+
+def ack(command, result):
+    vehicle = mavlink.MAVLink(None, srcSystem=1)
+    msg = vehicle.command_ack_encode(command, result)
+    msg.pack(vehicle)
+    return msg
+
+
+def test_interval_goes_through_the_command_layer():
+    master = FakeMaster()
+    rates = StreamRateManager()
+    rates.request('test', 'ATTITUDE', 20)
+    rates.attach(master)
+    assert len(master.commands) == 1
+    _, _, command, _, msg_id, interval_us = master.commands[0][:6]
+    assert (command, msg_id, interval_us) == (mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, mavlink.MAVLINK_MSG_ID_ATTITUDE, 5e4)
+
+    layer = command_layer(master)
+    layer.handle_message(ack(mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, mavlink.MAV_RESULT_ACCEPTED))
+    assert rates.status()['ATTITUDE']['applied_hz'] == 20
+    assert layer.metrics['unmatched_acks'] == 0
+
+
+def test_rejected_interval_falls_back_to_the_legacy_stream():
+    master = FakeMaster()
+    rates = StreamRateManager()
+    rates.request('test', 'ATTITUDE', 20)
+    rates.attach(master)
+    command_layer(master).handle_message(ack(mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, mavlink.MAV_RESULT_UNSUPPORTED))
+    assert rates.status()['ATTITUDE']['legacy']
+    assert [msg.get_type() for msg in master.messages] == ['REQUEST_DATA_STREAM']
+    assert master.messages[0].req_stream_id == mavlink.MAV_DATA_STREAM_EXTRA1
+
+
+def test_detach_stops_the_pending_request():
+    master = FakeMaster()
+    rates = StreamRateManager()
+    rates.request('test', 'ATTITUDE', 20)
+    rates.attach(master)
+    rates.detach()
+    layer = command_layer(master)
+    layer.check_timeouts()
+    assert layer.pending == {}
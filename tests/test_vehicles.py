@@ -0,0 +1,41 @@
+import pytest
+
+mavutil = pytest.importorskip('pymavlink.mavutil')
+
+from src.telemetary import ContinuousTelemetryManager
+
+mavlink = mavutil.mavlink
+
+
+def sent_by(system, build, component=1):
+    mav = mavlink.MAVLink(None, srcSystem=system, srcComponent=component)
+    msg = build(mav)
+    msg.pack(mav)
+    return msg
+
+
+def vehicle_heartbeat(mav):
+    return mav.heartbeat_encode(mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0, 4)
+
+
+def test_radio_heard_first_does_not_become_primary():
+    manager = ContinuousTelemetryManager()
+    manager.ingest(sent_by(51, lambda mav: mav.radio_status_encode(200, 190, 100, 40, 30, 0, 0)))
+    manager.ingest(sent_by(1, lambda mav: mav.global_position_int_encode(0, 96212000, 777243000, 0, 5000, 0, 0, 0, 0)))
+    assert manager.primary.vehicle_id is None
+    manager.ingest(sent_by(1, vehicle_heartbeat))
+    assert manager.primary.vehicle_id == 1
+    assert set(manager.vehicles) == {1}
+
+
+def test_ground_stations_and_companions_are_not_vehicles():
+    manager = ContinuousTelemetryManager()
+    manager.ingest(sent_by(200, lambda mav: mav.heartbeat_encode(
+        mavlink.MAV_TYPE_GCS, mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0)))
+    manager.ingest(sent_by(1, lambda mav: mav.heartbeat_encode(
+        mavlink.MAV_TYPE_ONBOARD_CONTROLLER, mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0), component=191))
+    assert manager.vehicles == {}
+    manager.ingest(sent_by(1, vehicle_heartbeat))
+    manager.ingest(sent_by(2, vehicle_heartbeat))
+    assert manager.primary.vehicle_id == 1
+    assert set(manager.vehicles) == {1, 2}
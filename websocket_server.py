@@ -1,5 +1,6 @@
 import asyncio
 import json
+import os
 import time
 import math
 from typing import Set
@@ -8,7 +9,8 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 # Import existing telemetry system
-from src.telemetary import get_live_telemetry
+from src.telemetary import get_live_telemetry, get_fleet_telemetry, get_telemetry_metrics, start_continuous_telemetry, stop_continuous_telemetry, telemetry_manager, telemetry_service_available
+from src.mavlink_async import AsyncMavlinkLink
 
 app = FastAPI(title="Drone Position Delta WebSocket Server")
 
@@ -82,72 +84,87 @@ class DronePositionTracker:
 # Global tracker instance
 position_tracker = DronePositionTracker()
 
-async def drone_position_broadcaster():
-    """Background task that continuously broadcasts drone position deltas"""
-    print("Starting drone position broadcaster...")
-    
-    while True:
-        try:
-            # Get current telemetry data
-            telemetry_data = get_live_telemetry()
-            
-            # Check if we have valid position data
-            if (telemetry_data.get("lat", 0) != 0 or 
-                telemetry_data.get("long", 0) != 0 or 
-                telemetry_data.get("alt", 0) != 0):
-                
-                # Calculate position delta
-                delta = position_tracker.calculate_delta(telemetry_data)
-                
-                # Prepare message for WebSocket clients
-                message = {
-                    "timestamp": time.time(),
-                    "lat": delta["lat"],
-                    "lon": delta["lon"],  # Convert 'long' to 'lon' for client
-                    "alt": delta["alt"],
-                    "drone_status": {
-                        "mode": telemetry_data.get("mode", "UNKNOWN"),
-                        "armed": telemetry_data.get("armed", False),
-                        "current_position": {
-                            "lat": telemetry_data.get("lat", 0),
-                            "lon": telemetry_data.get("long", 0),
-                            "alt": telemetry_data.get("alt", 0)
-                        }
-                    }
-                }
-                
-                # Broadcast to all connected clients
-                await manager.broadcast(message)
-                
-            else:
-                # Send status message when no position data is available
-                status_message = {
-                    "timestamp": time.time(),
-                    "lat": 0.0,
-                    "lon": 0.0,
-                    "alt": 0.0,
-                    "status": "No position data available",
-                    "drone_status": {
-                        "mode": telemetry_data.get("mode", "UNKNOWN"),
-                        "armed": telemetry_data.get("armed", False)
-                    }
+# Follows the telemetry manager's link on the event loop (None when reading from the telemetry service)
+telemetry_link = None
+
+def build_position_message(telemetry_data):
+    """Build the WebSocket message for one telemetry snapshot"""
+    # Check if we have valid position data
+    if (telemetry_data.get("lat", 0) != 0 or 
+        telemetry_data.get("long", 0) != 0 or 
+        telemetry_data.get("alt", 0) != 0):
+        
+        # Calculate position delta
+        delta = position_tracker.calculate_delta(telemetry_data)
+        
+        # Prepare message for WebSocket clients
+        return {
+            "timestamp": time.time(),
+            "lat": delta["lat"],
+            "lon": delta["lon"],  # Convert 'long' to 'lon' for client
+            "alt": delta["alt"],
+            "drone_status": {
+                "mode": telemetry_data.get("mode", "UNKNOWN"),
+                "armed": telemetry_data.get("armed", False),
+                "current_position": {
+                    "lat": telemetry_data.get("lat", 0),
+                    "lon": telemetry_data.get("long", 0),
+                    "alt": telemetry_data.get("alt", 0)
                 }
-                await manager.broadcast(status_message)
-                
-        except Exception as e:
-            print(f"Error in position broadcaster: {e}")
-            # Send error message to clients
-            error_message = {
-                "timestamp": time.time(),
-                "lat": 0.0,
-                "lon": 0.0,
-                "alt": 0.0,
-                "error": f"Telemetry error: {str(e)}"
             }
-            await manager.broadcast(error_message)
-        
-        # Wait for 0.5 seconds before next update
-        await asyncio.sleep(0.5)
+        }
+    
+    # Send status message when no position data is available
+    return {
+        "timestamp": time.time(),
+        "lat": 0.0,
+        "lon": 0.0,
+        "alt": 0.0,
+        "status": "No position data available",
+        "drone_status": {
+            "mode": telemetry_data.get("mode", "UNKNOWN"),
+            "armed": telemetry_data.get("armed", False)
+        }
+    }
+
+async def broadcast_telemetry():
+    """Broadcast the current telemetry snapshot to all clients"""
+    try:
+        await manager.broadcast(build_position_message(get_live_telemetry()))
+    except Exception as e:
+        print(f"Error in position broadcaster: {e}")
+        # Send error message to clients
+        error_message = {
+            "timestamp": time.time(),
+            "lat": 0.0,
+            "lon": 0.0,
+            "alt": 0.0,
+            "error": f"Telemetry error: {str(e)}"
+        }
+        await manager.broadcast(error_message)
+
+async def drone_position_broadcaster(link=None):
+    """Background task that continuously broadcasts drone position deltas.
+
+    With an AsyncMavlinkLink following the telemetry manager, a message goes out
+    as soon as each position update (or heartbeat) arrives, and at least every
+    0.5 seconds while the vehicle is silent; otherwise the shared telemetry
+    service is sampled every 0.5 seconds.
+    """
+    print("Starting drone position broadcaster...")
+    
+    if link is not None:
+        while True:
+            try:
+                await link.wait_for(type=('GLOBAL_POSITION_INT', 'HEARTBEAT'), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass  # Nothing heard - still send the status so clients see it
+            await broadcast_telemetry()
+    else:
+        while True:
+            await broadcast_telemetry()
+            # Wait for 0.5 seconds before next update
+            await asyncio.sleep(0.5)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -195,21 +212,48 @@ async def get_status():
         "websocket_url": "ws://localhost:8000/ws"
     }
 
+@app.get("/fleet")
+async def get_fleet_status():
+    """Get telemetry for every vehicle heard on the link, keyed by system ID"""
+    return {
+        "vehicles": get_fleet_telemetry()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Telemetry link quality: per-message rate, jitter, loss, age and latency histograms"""
+    return get_telemetry_metrics()
+
 # Startup event to begin broadcasting
 @app.on_event("startup")
 async def startup_event():
+    global telemetry_link
+    replay_path = os.environ.get('TELEMETRY_REPLAY')
+    if replay_path:
+        # Fan out a recorded flight (TELEMETRY_REPLAY_SPEED times real time, 0 = unpaced) instead of the live link
+        from src.flight_recorder import ReplaySource
+        telemetry_manager.use_replay(ReplaySource(replay_path, float(os.environ.get('TELEMETRY_REPLAY_SPEED', 1.0))))
+        print(f"Replaying telemetry from {replay_path}")
+    # Own the MAVLink link (through the telemetry manager) unless a shared-memory publisher already does
+    if telemetry_service_available() and not replay_path:
+        print("Reading telemetry from the shared-memory telemetry service")
+    else:
+        start_continuous_telemetry()
+        telemetry_link = await AsyncMavlinkLink().attach(telemetry_manager)
+    
     # Start the background broadcaster task
-    asyncio.create_task(drone_position_broadcaster())
-    print("WebSocket server started - Broadcasting drone position deltas every 0.5 seconds")
+    asyncio.create_task(drone_position_broadcaster(telemetry_link))
+    print("WebSocket server started - Broadcasting drone position deltas")
     print("Connect to: ws://localhost:8000/ws")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if telemetry_link is not None:
+        telemetry_link.close()
+        stop_continuous_telemetry()
+
 if __name__ == "__main__":
     print("Starting Drone Position Delta WebSocket Server...")
     print("WebSocket endpoint: ws://localhost:8000/ws")
-    print("Broadcasting position deltas every 0.5 seconds")
-    
-    # Start the continuous telemetry system
-    from src.telemetary import start_continuous_telemetry
-    start_continuous_telemetry()
     
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file